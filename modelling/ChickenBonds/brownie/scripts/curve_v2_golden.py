@@ -0,0 +1,125 @@
+"""
+Golden vectors for tests/test_curvev2_int.py, computed by the contract itself.
+Run from the brownie directory with:
+    brownie run curve_v2_golden
+It deploys CurveCryptoSwap2 with the same parameters as tests/test_curve_v2.py,
+walks it through random trades, and records after each one the pool state and
+the contract outputs (get_dy, fee, newton_y) for random inputs. Inputs the
+contract rejects (e.g. Newton not converging) are recorded with a null output.
+Without a node for brownie, curve_v2_golden_evm.py does the same walk on the
+same contract in an in-process EVM.
+"""
+import os
+import json
+import random
+
+
+CURVE_V2_A = 200000000
+CURVE_V2_GAMMA = 19900000000000000
+CURVE_V2_MID_FEE = 15000000
+CURVE_V2_OUT_FEE = 30000000
+CURVE_V2_ALLOWED_EXTRA_PROFIT = 100000000
+CURVE_V2_FEE_GAMMA = 5000000000000000
+CURVE_V2_ADJUSTMENT_STEP = 5500000000000
+CURVE_V2_ADMIN_FEE = 5000000000
+CURVE_V2_MA_HALF_TIME = 600
+CURVE_V2_INITIAL_PRICE = 2570000000000000000
+
+OUTPUT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "tests", "data", "curve_v2_golden.json")
+SEED = 0
+NUM_STATES = 50
+NUM_QUOTES = 8
+
+def deploy():
+    from brownie import accounts, Token, CurveToken, CurveCryptoSwap2
+    # Token.sol has no mint_relative, which claiming admin fees needs
+    token = accounts[0].deploy(CurveToken)
+    coin1 = accounts[0].deploy(Token, "Coin 1", "C1T", 18, 1e30)
+    coin2 = accounts[0].deploy(Token, "Coin 2", "C2T", 18, 1e30)
+    pool = accounts[0].deploy(
+        CurveCryptoSwap2,
+        accounts[0],
+        accounts[0],
+        CURVE_V2_A,
+        CURVE_V2_GAMMA,
+        CURVE_V2_MID_FEE,
+        CURVE_V2_OUT_FEE,
+        CURVE_V2_ALLOWED_EXTRA_PROFIT,
+        CURVE_V2_FEE_GAMMA,
+        CURVE_V2_ADJUSTMENT_STEP,
+        CURVE_V2_ADMIN_FEE,
+        CURVE_V2_MA_HALF_TIME,
+        CURVE_V2_INITIAL_PRICE,
+        token.address,
+        [coin1.address, coin2.address]
+    )
+    coin1.approve(pool.address, 2**256 - 1, { 'from': accounts[0] })
+    coin2.approve(pool.address, 2**256 - 1, { 'from': accounts[0] })
+    return pool
+
+def get_state(pool):
+    return {
+        "balances": [pool.balances(0), pool.balances(1)],
+        "price_scale": pool.price_scale(),
+        "D": pool.D(),
+        "A_gamma": [pool.A(), pool.gamma()],
+        "mid_fee": pool.mid_fee(),
+        "out_fee": pool.out_fee(),
+        "fee_gamma": pool.fee_gamma(),
+        "xp": list(pool.xp_wrapper()),
+        "fee": pool.fee(),
+    }
+
+def call_or_none(reverted, method, *args):
+    try:
+        return method(*args)
+    except reverted:
+        return None
+
+def walk(pool, chain, sender, reverted):
+    """
+    @param pool: Deployed CurveCryptoSwap2, with brownie style methods
+    @param chain: Object with brownie style sleep(seconds) and mine()
+    @param sender: Account holding the coins, with the pool approved for them
+    @param reverted: Exception raised by calls that revert
+    @return: The pool states and contract outputs
+    """
+    random.seed(SEED)
+    x = 10**6 * 10**18
+    pool.add_liquidity([x, x * 10**18 // CURVE_V2_INITIAL_PRICE], 0, { 'from': sender })
+
+    vectors = []
+    while len(vectors) < NUM_STATES:
+        i = random.randint(0, 1)
+        try:
+            pool.exchange(i, 1 - i, pool.balances(i) * random.randint(1, 200) // 1000, 0, { 'from': sender })
+        except reverted:
+            # Trades too far out of balance for the solvers
+            continue
+        chain.sleep(random.randint(0, 3600))
+        chain.mine()
+
+        state = get_state(pool)
+        state["get_dy"] = []
+        state["newton_y"] = []
+        for _ in range(NUM_QUOTES):
+            i = random.randint(0, 1)
+            dx = state["balances"][i] * random.randint(1, 500) // 1000
+            state["get_dy"].append({"i": i, "j": 1 - i, "dx": dx, "dy": call_or_none(reverted, pool.get_dy, i, 1 - i, dx)})
+            x = list(state["xp"])
+            x[i] = x[i] * random.randint(1001, 1500) // 1000
+            y = call_or_none(reverted, pool.newton_y_wrapper, state["A_gamma"][0], state["A_gamma"][1], x, state["D"], 1 - i)
+            state["newton_y"].append({"x": x, "i": 1 - i, "y": y})
+        vectors.append(state)
+    return vectors
+
+def save(vectors):
+    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+    with open(OUTPUT_FILE, "w") as f:
+        json.dump({"seed": SEED, "states": vectors}, f, indent=1)
+    print(f"{len(vectors)} states written to {OUTPUT_FILE}")
+
+def main():
+    from brownie import accounts, chain
+    from brownie.exceptions import VirtualMachineError
+    save(walk(deploy(), chain, accounts[0], VirtualMachineError))
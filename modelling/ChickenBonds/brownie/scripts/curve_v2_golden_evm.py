@@ -0,0 +1,131 @@
+"""
+Golden vectors for tests/test_curvev2_int.py, as curve_v2_golden.py, without brownie:
+CurveCryptoSwap2 is compiled with vyper 0.3.3 (its pragma) and run in py-evm, through eth-tester.
+Run from the brownie directory, in an environment with vyper==0.3.3, eth-tester[py-evm] and web3
+(vyper 0.3.3 needs Python <= 3.10), with:
+    python scripts/curve_v2_golden_evm.py
+Coins are the Vyper ERC20 below instead of Token.sol (no solc needed): the pool only calls
+transfer, transferFrom and decimals on them. The LP token is CurveToken.vy, as in curve_v2_golden.py.
+"""
+import os
+import sys
+import vyper
+from web3 import Web3, EthereumTesterProvider
+from eth_tester.exceptions import TransactionFailed
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from curve_v2_golden import *
+
+CONTRACTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "contracts")
+GAS = 10**7
+
+TOKEN_SOURCE = """
+# @version 0.3.3
+
+decimals: public(uint256)
+totalSupply: public(uint256)
+balanceOf: public(HashMap[address, uint256])
+allowance: public(HashMap[address, HashMap[address, uint256]])
+
+@external
+def __init__(_decimals: uint256, _supply: uint256):
+    self.decimals = _decimals
+    self.totalSupply = _supply
+    self.balanceOf[msg.sender] = _supply
+
+@external
+def approve(_spender: address, _value: uint256) -> bool:
+    self.allowance[msg.sender][_spender] = _value
+    return True
+
+@external
+def transfer(_to: address, _value: uint256) -> bool:
+    self.balanceOf[msg.sender] -= _value
+    self.balanceOf[_to] += _value
+    return True
+
+@external
+def transferFrom(_from: address, _to: address, _value: uint256) -> bool:
+    self.allowance[_from][msg.sender] -= _value
+    self.balanceOf[_from] -= _value
+    self.balanceOf[_to] += _value
+    return True
+"""
+
+class Chain():
+    """
+    brownie.chain, for sleep() and mine()
+    """
+    def __init__(self, w3):
+        self.w3 = w3
+        self.tester = w3.provider.ethereum_tester
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.tester.time_travel(self.w3.eth.get_block("latest")["timestamp"] + seconds)
+
+    def mine(self):
+        self.tester.mine_blocks(1)
+
+class Contract():
+    """
+    Deployed contract with brownie style methods: views are called, the rest are sent
+    as transactions, with the brownie transaction dict as last argument.
+    """
+    def __init__(self, w3, contract):
+        self.w3 = w3
+        self.contract = contract
+        self.address = contract.address
+        self.views = {entry["name"] for entry in contract.abi if entry.get("stateMutability") in ("view", "pure")}
+
+    def __getattr__(self, name):
+        function = getattr(self.contract.functions, name)
+        def method(*args):
+            if name in self.views:
+                return function(*args).call()
+            tx = {"from": args[-1]["from"], "gas": GAS}
+            receipt = self.w3.eth.wait_for_transaction_receipt(function(*args[:-1]).transact(tx))
+            if receipt["status"] != 1:
+                raise TransactionFailed(f"{name} reverted")
+        return method
+
+def deploy_file(w3, name, sender, *args):
+    with open(os.path.join(CONTRACTS_DIR, name)) as f:
+        return deploy_source(w3, f.read(), sender, *args)
+
+def deploy_source(w3, source, sender, *args):
+    output = vyper.compile_code(source, ["abi", "bytecode"])
+    factory = w3.eth.contract(abi=output["abi"], bytecode=output["bytecode"])
+    receipt = w3.eth.wait_for_transaction_receipt(factory.constructor(*args).transact({"from": sender, "gas": GAS}))
+    assert receipt["status"] == 1
+    return Contract(w3, w3.eth.contract(address=receipt["contractAddress"], abi=output["abi"]))
+
+def deploy_evm(w3, sender):
+    token = deploy_file(w3, "CurveToken.vy", sender)
+    coin1 = deploy_source(w3, TOKEN_SOURCE, sender, 18, 10**30)
+    coin2 = deploy_source(w3, TOKEN_SOURCE, sender, 18, 10**30)
+    pool = deploy_file(
+        w3, "CurveCryptoSwap2.vy", sender,
+        sender,
+        sender,
+        CURVE_V2_A,
+        CURVE_V2_GAMMA,
+        CURVE_V2_MID_FEE,
+        CURVE_V2_OUT_FEE,
+        CURVE_V2_ALLOWED_EXTRA_PROFIT,
+        CURVE_V2_FEE_GAMMA,
+        CURVE_V2_ADJUSTMENT_STEP,
+        CURVE_V2_ADMIN_FEE,
+        CURVE_V2_MA_HALF_TIME,
+        CURVE_V2_INITIAL_PRICE,
+        token.address,
+        [coin1.address, coin2.address]
+    )
+    coin1.approve(pool.address, 2**256 - 1, { 'from': sender })
+    coin2.approve(pool.address, 2**256 - 1, { 'from': sender })
+    return pool
+
+if __name__ == "__main__":
+    w3 = Web3(EthereumTesterProvider())
+    sender = w3.eth.accounts[0]
+    save(walk(deploy_evm(w3, sender), Chain(w3), sender, TransactionFailed))
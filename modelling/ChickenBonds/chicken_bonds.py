@@ -1,7 +1,10 @@
 import os
+import contextlib
+import multiprocessing
 import numpy as np
 
 from lib.constants import *
+from lib.config import *
 from lib.chicken import *
 from lib.controllers import *
 from lib.utils import *
@@ -10,101 +13,200 @@ from lib.user import *
 from lib.testers import *
 from lib.log import *
 from lib.plots import *
+from lib.ensemble import *
+from lib.sweep import *
+from lib.checkpoint import *
+from lib.fork import *
+from lib.profiler import *
+from lib.journal import *
+from lib.events import *
 
-def deploy():
-    coll = Token('ETH')
-    lqty = Token('LQTY')
-    blqty = Token('bLQTY')
+def deploy(config, journal=None):
+    assert config.token_ledger in ["dict", "array"], f"Unknown token ledger: {config.token_ledger}"
+    new_token = Ledger().new_token if config.token_ledger == "array" else Token
+    coll = new_token('ETH')
+    lqty = new_token('LQTY')
+    blqty = new_token('bLQTY')
 
     chicken = Chicken(
         coll, lqty, blqty,
         "Pending", "RESERVE",
-        "AMM", AMM_FEE,
-        "bTKN_AMM", AMM_FEE,
-        "Rewards", REWARDS_PERIOD,
+        "AMM", config.amm_fee,
+        "bTKN_AMM", config.amm_fee,
+        "Rewards", config.rewards_period,
         # Curve V2:
-        CURVE_V2_A,
-        CURVE_V2_GAMMA,
-        CURVE_V2_MID_FEE,
-        CURVE_V2_OUT_FEE,
-        CURVE_V2_ALLOWED_EXTRA_PROFIT,
-        CURVE_V2_FEE_GAMMA,
-        CURVE_V2_ADJUSTMENT_STEP,
-        CURVE_V2_ADMIN_FEE,
-        CURVE_V2_MA_HALF_TIME,
-        CURVE_V2_INITIAL_PRICE
+        config.curve_v2_a,
+        config.curve_v2_gamma,
+        config.curve_v2_mid_fee,
+        config.curve_v2_out_fee,
+        config.curve_v2_allowed_extra_profit,
+        config.curve_v2_fee_gamma,
+        config.curve_v2_adjustment_step,
+        config.curve_v2_admin_fee,
+        config.curve_v2_ma_half_time,
+        config.curve_v2_initial_price,
+        config.curve_v2_math,
+        config.curve_v2_warm_start
     )
 
-    chicks = list(map(lambda chick: User(f"chick_{chick:02}"), range(NUM_CHICKS)))
+    chicken.btkn_amm.step_seconds = config.step_seconds
+
+    if journal is not None:
+        journal.attach(chicken.get_tokens())
+
+    chicks = AgentPopulation([f"chick_{chick:02}" for chick in range(config.num_chicks)])
     # Initial CHICK balance
     for chick in chicks:
-        lqty.mint(chick.account, INITIAL_AMOUNT)
+        lqty.mint(chick.account, config.initial_amount)
 
     return chicken, chicks
 
-def main(tester):
-    if not os.path.exists("images"):
-        os.mkdir("images")
+def init_simulation(tester, log_level=LOG_LEVEL, journal=None):
+    """
+    Deploy the system and return the simulation state, as a dict with the same
+    keys as a checkpoint (see lib/checkpoint.py), ready for run_simulation().
+    @param journal: Journal to log every ledger event into, from deployment on
+    """
+    chicken, chicks = deploy(tester.config, journal)
+
+    log_state(chicken, chicks, tester, log_level, 0)
 
-    #print(f"alpha: {INITIAL_ACCRUAL_PARAM}")
+    tester.init(chicks)
 
-    chicken, chicks = deploy()
+    return {
+        "chicken": chicken,
+        "chicks": chicks,
+        "tester": tester,
+        "controller": AsymmetricController.from_config(tester.config),
+        "recorder": init_data(tester.config.iterations, tester.get_metric_windows()),
+        "journal": journal,
+        "loop_state": {
+            "iteration": -1,
+            "natural_rate": tester.config.initial_natural_rate,
+            "accrued_fees_A": 0,
+            "accrued_fees_B": 0,
+            "accrued_fees_LP": 0,
+        },
+    }
 
-    controller = AsymmetricController(
-        adjustment_rate=ACCRUAL_ADJUSTMENT_RATE,
-        init_output=INITIAL_ACCRUAL_PARAM
+def simulate(tester, log_level=LOG_LEVEL, checkpoint_interval=CHECKPOINT_INTERVAL, checkpoint_file=CHECKPOINT_FILE, resume=False, profiler=None, journal=None):
+    """
+    @param profiler: Profiler to record phase timings and call counts into (see lib/profiler.py)
+    @param journal: Journal to log every ledger event into (see lib/journal.py)
+    @param checkpoint_interval: If > 0, the full state is saved to checkpoint_file every that many iterations
+    @param resume: Continue from checkpoint_file instead of deploying a new system.
+                   The saved tester state is loaded into `tester`.
+    """
+    if resume:
+        sim = restore(checkpoint_file)
+        # Keep the caller’s tester object, so it can be used afterwards (e.g. by main)
+        vars(tester).clear()
+        vars(tester).update(vars(sim["tester"]))
+        sim["tester"] = tester
+        # The journal goes along with the tokens it's attached to
+        sim["journal"] = sim["chicken"].token.journal
+    else:
+        sim = init_simulation(tester, log_level, journal)
+
+    run_simulation(
+        sim,
+        log_level=log_level,
+        checkpoint_interval=checkpoint_interval,
+        checkpoint_file=checkpoint_file,
+        profiler=profiler
     )
 
-    data = init_data()
-    natural_rate = INITIAL_NATURAL_RATE
-    accrued_fees_A = 0
-    accrued_fees_B = 0
-    accrued_fees_LP = 0
+    return sim["chicken"], sim["chicks"], sim["recorder"]
 
-    print(f"\n  --> Model: {tester.name}")
-    print('  ------------------------------------------------------\n')
-    log_state(chicken, chicks, tester, LOG_LEVEL, 0)
+def run_simulation(sim, end=None, log_level=LOG_LEVEL, checkpoint_interval=CHECKPOINT_INTERVAL, checkpoint_file=CHECKPOINT_FILE, profiler=None):
+    """
+    Run the main loop on a simulation state, from the iteration after the last one completed.
+    With config.time_engine "events" the loop is run as events instead (see lib/events.py).
+    @param sim: State from init_simulation(), restore() or fork_simulation()
+    @param end: Iteration to stop before (defaults to config.iterations)
+    @param profiler: Profiler to record phase timings and call counts into
+    """
+    profiler = profiler or NullProfiler()
+    journal = sim.get("journal")
+    if journal is not None:
+        profiler = ProfilerGroup([profiler, journal])
+    time_engine = sim["tester"].config.time_engine
+    assert time_engine in ["loop", "events"], f"Unknown time engine: {time_engine}"
+    profiler.instrument()
+    try:
+        if time_engine == "events":
+            return SimulationEvents(sim, log_level, checkpoint_interval, checkpoint_file, profiler).run(end)
+        return run_iterations(sim, end, log_level, checkpoint_interval, checkpoint_file, profiler)
+    finally:
+        profiler.uninstrument()
+        if journal is not None:
+            journal.flush()
 
-    tester.init(chicks)
+def run_iterations(sim, end, log_level, checkpoint_interval, checkpoint_file, profiler):
+    chicken = sim["chicken"]
+    chicks = sim["chicks"]
+    tester = sim["tester"]
+    controller = sim["controller"]
+    data = sim["recorder"]
+    loop_state = sim["loop_state"]
+    natural_rate = loop_state["natural_rate"]
+    accrued_fees_A = loop_state["accrued_fees_A"]
+    accrued_fees_B = loop_state["accrued_fees_B"]
+    accrued_fees_LP = loop_state["accrued_fees_LP"]
+    start = loop_state["iteration"] + 1
+
+    config = tester.config
+    if end is None:
+        end = config.iterations
 
-    for iteration in range(ITERATIONS):
+    for iteration in range(start, end):
         #print(f"\n  --> Iteration: {iteration}")
+        profiler.start_iteration(iteration)
 
         chicken.btkn_amm.set_block_timestamp(iteration)
 
         natural_rate = tester.get_natural_rate(natural_rate, iteration)
         chicken.amm_iteration_apr, accrued_fees_A, accrued_fees_B, accrued_fees_LP = get_amm_iteration_apr(
-            chicken.btkn_amm, accrued_fees_A, accrued_fees_B, accrued_fees_LP
+            chicken.btkn_amm, accrued_fees_A, accrued_fees_B, accrued_fees_LP, config
         )
-        chicken.amm_average_apr = get_amm_average_apr(data, iteration)
+        chicken.amm_average_apr = get_amm_average_apr(data, iteration, config)
         #print(f"AMM iteration APR: {chicken.amm_iteration_apr:.3%}")
         #print(f"AMM average APR: {chicken.amm_average_apr:.3%}")
         #assert chicken.amm_iteration_apr >= 0
+        profiler.lap("amm_apr")
 
         # Distribute yield
         tester.distribute_yield(chicken, chicks, iteration)
+        profiler.lap("distribute_yield")
 
         # Users bond
         tester.bond(chicken, chicks, iteration)
+        profiler.lap("bond")
 
         # Users chicken in and out
-        tester.update_chicken(chicken, chicks, data, iteration, LOG_LEVEL > 0)
+        tester.update_chicken(chicken, chicks, data, iteration, log_level > 0)
+        profiler.lap("update_chicken")
 
         # Arbitrage bTKN
-        tester.arbitrage_btkn(chicken, chicks, iteration, LOG_LEVEL > 0)
+        tester.arbitrage_btkn(chicken, chicks, iteration, log_level > 0)
+        profiler.lap("arbitrage_btkn")
 
         # Buy bTKN (speculation if price is low)
-        tester.buy_btkn(chicken, chicks, LOG_LEVEL > 0)
+        tester.buy_btkn(chicken, chicks, log_level > 0)
+        profiler.lap("buy_btkn")
 
         # Sell bTKN (speculation if they are making gains)
-        tester.sell_btkn(chicken, chicks, LOG_LEVEL > 0)
+        tester.sell_btkn(chicken, chicks, log_level > 0)
+        profiler.lap("sell_btkn")
 
         # Controller feedback
         avg_age = tester.get_avg_outstanding_bond_age(chicks, iteration)
-        controller_output = controller.feed(TARGET_AVERAGE_AGE - avg_age)
+        controller_output = controller.feed(config.target_average_age - avg_age)
         tester.set_accrual_param(controller_output)
+        profiler.lap("controller")
 
-        log_state(chicken, chicks, tester, LOG_LEVEL, iteration)
+        log_state(chicken, chicks, tester, log_level, iteration)
+        profiler.lap("log_state")
 
         new_row = state_to_row(
             chicken,
@@ -114,14 +216,42 @@ def main(tester):
             data,
             iteration
         )
-        data = data.append(new_row, ignore_index=True)
+        data.append(new_row)
+        profiler.lap("state_to_row")
 
-        if PLOTS_INTERVAL[1] > 0 and iteration >= PLOTS_INTERVAL[1]:
-            break
-        if chicken.btkn_amm.get_token_B_price() > 100:
+        loop_state["iteration"] = iteration
+        loop_state["natural_rate"] = natural_rate
+        loop_state["accrued_fees_A"] = accrued_fees_A
+        loop_state["accrued_fees_B"] = accrued_fees_B
+        loop_state["accrued_fees_LP"] = accrued_fees_LP
+
+        if checkpoint_interval > 0 and (iteration + 1) % checkpoint_interval == 0:
+            snapshot(chicken, chicks, tester, controller, data, loop_state=loop_state, path=checkpoint_file)
+
+        stop = PLOTS_INTERVAL[1] > 0 and iteration >= PLOTS_INTERVAL[1]
+        if not stop and chicken.btkn_amm.get_token_B_price() > 100:
             print(f"Price too high!: {chicken.btkn_amm.get_token_B_price():,.2f}")
+            stop = True
+        profiler.lap("checks")
+        profiler.end_iteration()
+        if stop:
             break
 
+    return sim
+
+def main(tester):
+    if not os.path.exists("images"):
+        os.mkdir("images")
+
+    #print(f"alpha: {tester.config.initial_accrual_param}")
+
+    print(f"\n  --> Model: {tester.name}")
+    print('  ------------------------------------------------------\n')
+
+    profiler = Profiler(capacity=tester.config.iterations) if PROFILE else None
+    journal = Journal(JOURNAL_DIR) if JOURNAL_DIR else None
+    chicken, chicks, data = simulate(tester, profiler=profiler, journal=journal)
+
     plot_interval = PLOTS_INTERVAL[:]
     group=90
     group_description="Quarter"
@@ -129,14 +259,21 @@ def main(tester):
         group = 1
         group_description = "Day"
     else:
-        plot_interval[1] = ITERATIONS
+        plot_interval[1] = tester.config.iterations
 
     log_state(chicken, chicks, tester, 1, 'END')
 
+    if profiler is not None:
+        print("")
+        print("Profile")
+        print(profiler.get_summary().to_string())
+        print("Solvers (bLUSD AMM)")
+        print(chicken.btkn_amm.get_solver_stats())
+
     plot_charts(
         chicken,
         chicks,
-        data[plot_interval[0] : plot_interval[1]],
+        data.get_dataframe()[plot_interval[0] : plot_interval[1]],
         tester.price_max_value, tester.time_max_value, tester.apr_min_value, tester.apr_max_value,
         description=tester.name,
         group=group,
@@ -149,5 +286,156 @@ def main(tester):
 
     return
 
+def run_replica(args):
+    tester_factory, run_id, variables = args
+    tester = tester_factory()
+    tester.run_id = run_id
+    # Keep workers quiet, warnings from the AMM would interleave
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        _, _, data = simulate(tester, log_level=0)
+
+    return run_id, {variable: np.array(data[variable]) for variable in variables}
+
+def run_ensemble(tester_factory, n_runs=ENSEMBLE_RUNS, workers=None, variables=ENSEMBLE_VARIABLES):
+    """
+    Run independent replicas of the simulation in a process pool.
+    Each replica gets its own random stream (see TesterSimple.seed), and
+    results are collected as they finish.
+    @param tester_factory: Picklable callable returning a fresh tester (e.g. TesterSimple,
+                           or functools.partial(TesterSimple, config))
+    @param n_runs: Number of replicas
+    @param workers: Number of processes (defaults to all cores)
+    @return: EnsembleRecorder with the per-iteration values of every run
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    iterations = tester_factory().config.iterations
+    ensemble = EnsembleRecorder(n_runs, iterations, variables)
+    tasks = [(tester_factory, run_id, variables) for run_id in range(n_runs)]
+
+    if workers == 1:
+        for task in tasks:
+            ensemble.record(*run_replica(task))
+        return ensemble
+
+    with multiprocessing.Pool(min(workers, n_runs)) as pool:
+        # runs are long, so hand them out one by one to keep all workers busy
+        for run_id, columns in pool.imap_unordered(run_replica, tasks, chunksize=1):
+            ensemble.record(run_id, columns)
+
+    return ensemble
+
+def run_sweep_point(args):
+    tester_class, config = args
+    tester = tester_class(config)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            chicken, chicks, data = simulate(tester, log_level=0)
+            summary = get_run_summary(chicken, chicks, tester, data)
+        except Exception as e:
+            # Some corners of the parameter space make the AMM fail, keep the rest of the sweep going
+            summary = {"error": repr(e)}
+
+    return config, summary
+
+def run_sweep(configs, tester_class=TesterSimple, workers=None, cache_dir=SWEEP_CACHE_DIR, output_file=None):
+    """
+    Simulate every config (see get_grid_design and get_random_design) in a process pool.
+    Summaries are cached on disk by config hash, so only new points are run.
+    Failed runs are reported in the "error" column and not cached.
+    @param configs: List of SimConfig
+    @param tester_class: Tester to build from each config
+    @param workers: Number of processes (defaults to all cores)
+    @param cache_dir: Folder for the cached summaries
+    @param output_file: If given, the summary table is also written there as CSV
+    @return: DataFrame with one summary row per config
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    cache = SweepCache(cache_dir)
+    summaries = {}
+    # Repeated points are only run once
+    pending = [config for config in dict.fromkeys(configs) if config not in cache]
+    tasks = [(tester_class, config) for config in pending]
+
+    def store(config, summary):
+        summaries[config] = summary
+        if "error" not in summary:
+            cache.put(config, summary)
+
+    if workers == 1 or len(tasks) <= 1:
+        for task in tasks:
+            store(*run_sweep_point(task))
+    else:
+        with multiprocessing.Pool(min(workers, len(tasks))) as pool:
+            for config, summary in pool.imap_unordered(run_sweep_point, tasks, chunksize=1):
+                store(config, summary)
+
+    for config in configs:
+        if config not in summaries:
+            summaries[config] = cache.get(config)
+
+    sweep = get_sweep_dataframe(configs, [summaries[config] for config in configs])
+    if output_file is not None:
+        sweep.to_csv(output_file, index=False)
+
+    return sweep
+
+def warm_up(tester, iterations, log_level=0):
+    """
+    Simulate the first `iterations` iterations, to fork scenarios from (see run_forks).
+    @return: Simulation state
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        sim = init_simulation(tester, log_level)
+        return run_simulation(sim, end=iterations, log_level=log_level)
+
+# Pickled warm state, loaded once per worker process by init_fork_worker
+_fork_base = None
+
+def init_fork_worker(sim_bytes):
+    global _fork_base
+    _fork_base = sim_bytes
+
+def run_fork(args):
+    return run_fork_from(_fork_base, *args)
+
+def run_fork_from(sim_bytes, name, scenario, end):
+    sim = load_simulation(sim_bytes)
+    fork_length = len(sim["recorder"])
+    scenario(sim)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        run_simulation(sim, end=end, log_level=0)
+
+    return name, sim["recorder"].get_dataframe()[fork_length:].reset_index(drop=True).copy()
+
+def run_forks(warm_sim, scenarios, end=None, workers=None):
+    """
+    Continue a warm simulation (see warm_up) under different scenarios, in a process pool.
+    The warm state is pickled once and sent once to each worker, and every fork starts
+    from its own copy of it, so the warm-up is neither re-simulated nor shared between forks.
+    @param warm_sim: Simulation state to fork
+    @param scenarios: Dict of name -> function(sim) changing a forked state (see lib/fork.py)
+    @param end: Iteration to stop the forks before (defaults to config.iterations)
+    @param workers: Number of processes (defaults to all cores)
+    @return: ForkResults with the common prefix and the history of every fork after it
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    results = ForkResults(warm_sim["recorder"].get_dataframe().copy())
+    sim_bytes = dump_simulation(warm_sim)
+    tasks = [(name, scenario, end) for name, scenario in scenarios.items()]
+
+    if workers == 1 or len(tasks) <= 1:
+        for task in tasks:
+            results.record(*run_fork_from(sim_bytes, *task))
+        return results
+
+    with multiprocessing.Pool(min(workers, len(tasks)), initializer=init_fork_worker, initargs=(sim_bytes,)) as pool:
+        for name, suffix in pool.imap_unordered(run_fork, tasks, chunksize=1):
+            results.record(name, suffix)
+
+    return results
+
 if __name__ == "__main__":
     main(TesterSimple())
@@ -1,6 +1,17 @@
+import contextlib
+from collections import namedtuple
+
+from lib.constants import SECONDS_PER_DAY
 from lib.erc_token import *
 from lib.amm.rewards import *
 
+# Swap directions for quote()
+SWAP_A_FOR_B = 0
+SWAP_B_FOR_A = 1
+
+# Immutable snapshot of what pricing depends on, for pools without extra parameters
+PoolState = namedtuple("PoolState", ["balance_A", "balance_B", "fee"])
+
 class AmmBase():
     def __init__(self, pool_account, token_A, token_B, fee, rewards_account=None, rewards_period=None):
         self.pool_account = pool_account # mimics the address
@@ -8,13 +19,15 @@ class AmmBase():
             self.rewards = Rewards(token_A, rewards_account, rewards_period)
         self.token_A = token_A
         self.token_B = token_B
-        self.lp_token = Token(token_A.symbol + token_B.symbol)
+        self.lp_token = token_A.new_token(token_A.symbol + token_B.symbol)
         assert fee > 0.0 and fee < 1.0
         self.fee = fee
         self.fees_accrued_A = 0.0
         self.fees_accrued_B = 0.0
         self.fees_accrued_LP = 0.0
         self.block_timestamp = 0 # for AMM time weighted oracle
+        self.step_seconds = SECONDS_PER_DAY # length of an iteration, for the timestamp
+        self.state_version = 0 # see get_state_version
 
     def __str__(self):
         return f"\n - {self.token_A.symbol} amount: {self.token_A.balance_of(self.pool_account):,.2f}" + \
@@ -23,6 +36,59 @@ class AmmBase():
             f"\n - \033[36mPrice {self.token_B.symbol}/{self.token_A.symbol}: {self.get_token_B_price():,.2f}\033[0m" + \
             f"\n - LP tokens total supply {self.get_total_liquidity():,.2f}"
 
+    def get_state(self):
+        return PoolState(self.token_A_balance(), self.token_B_balance(), self.fee)
+
+    @staticmethod
+    def quote(direction, amount, state):
+        """
+        Pure version of a swap: it only depends on its arguments, and doesn’t touch
+        the pool nor the Token ledgers, so it can be memoized on the state, or run
+        in other threads or processes.
+        @param direction: SWAP_A_FOR_B or SWAP_B_FOR_A
+        @param amount: Input amount
+        @param state: As returned by get_state()
+        @return: Output amount, fee amount (in the token it’s charged in) and state after the swap
+        """
+        pass
+
+    def get_state_version(self):
+        """
+        Monotonically increasing number, which changes whenever something prices depend on may have:
+        the ledgers of the pool tokens, or the pool fields that change on their own (e.g. with time).
+        The latter must call touch().
+        """
+        return self.state_version + self.token_A.version + self.token_B.version + self.lp_token.version
+
+    def touch(self):
+        self.state_version += 1
+
+    def get_overlay_tokens(self):
+        return [self.token_A, self.token_B, self.lp_token]
+
+    @contextlib.contextmanager
+    def overlay(self):
+        """
+        Scoped what-if: swaps, mints and transfers done inside
+        `with pool.overlay():` are discarded on exit, both in the pool fields
+        and in the ledgers of its tokens, e.g. to run a real swap as a quote.
+        """
+        # Pool fields are few, so a shallow copy is enough (lists are the only mutable ones)
+        fields = {name: value.copy() if isinstance(value, list) else value for name, value in vars(self).items()}
+        tokens = self.get_overlay_tokens()
+        for token in tokens:
+            token.begin_overlay()
+        try:
+            yield self
+        finally:
+            for token in reversed(tokens):
+                token.end_overlay()
+            state_version = self.state_version
+            vars(self).clear()
+            vars(self).update(fields)
+            # Fields are restored, but the version must keep increasing
+            self.state_version = state_version + 1
+
     def convert_to_A(self, amount_A, amount_B):
         return amount_A + amount_B * self.get_token_B_price()
     def convert_to_B(self, amount_A, amount_B):
@@ -268,4 +334,5 @@ class AmmBase():
 
     # for AMM time weighted oracle
     def set_block_timestamp(self, iteration):
-        self.block_timestamp = iteration * 86400
+        self.block_timestamp = iteration * self.step_seconds
+        self.touch()
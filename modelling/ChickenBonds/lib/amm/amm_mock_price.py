@@ -2,12 +2,14 @@ import math
 
 from lib.amm.amm_base import *
 
+MockPriceState = namedtuple("MockPriceState", ["balance_A", "balance_B", "fee", "A_price"])
+
 class AmmMockPrice(AmmBase):
     def __init__(self, pool_account, token_A, token_B, fee):
         self.pool_account = pool_account # mimics the address
         self.token_A = token_A
         self.token_B = token_B
-        self.lp_token = Token(token_A.symbol + token_B.symbol)
+        self.lp_token = token_A.new_token(token_A.symbol + token_B.symbol)
         assert fee > 0.0 and fee < 1.0
         self.fee = fee
         self.fees_accrued_A = 0.0
@@ -115,6 +117,20 @@ class AmmMockPrice(AmmBase):
 
         return output_amount
 
+    def get_state(self):
+        return MockPriceState(self.token_A_balance(), self.token_B_balance(), self.fee, self.A_price)
+
+    @staticmethod
+    def quote(direction, amount, state):
+        # Trades at the mock price, and fees are only accounted, not charged
+        if direction == SWAP_A_FOR_B:
+            output_amount = amount * state.A_price
+            new_state = state._replace(balance_A=state.balance_A + amount, balance_B=state.balance_B - output_amount)
+        else:
+            output_amount = amount / state.A_price
+            new_state = state._replace(balance_A=state.balance_A - output_amount, balance_B=state.balance_B + amount)
+        return output_amount, amount * state.fee, new_state
+
     def get_output_amount(self, input_token_balance, output_token_balance, input_amount, D_offset=None):
         pass
 
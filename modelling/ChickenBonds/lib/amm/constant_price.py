@@ -34,8 +34,18 @@ class ConstantPricePool(AmmBase):
         token_B_amount = self.swap_A_for_B(account, amount_to_swap)
         return self.add_liquidity(account, amount_to_add, token_B_amount)
 
+    @staticmethod
+    def quote(direction, amount, state):
+        output_amount = amount * (1 - state.fee) - 0.000001 # to avoid rounding issues
+        if direction == SWAP_A_FOR_B:
+            new_state = state._replace(balance_A=state.balance_A + amount, balance_B=state.balance_B - output_amount)
+        else:
+            new_state = state._replace(balance_A=state.balance_A - output_amount, balance_B=state.balance_B + amount)
+        return output_amount, amount * state.fee, new_state
+
     def get_output_amount(self, input_token_balance, output_token_balance, input_amount, D_offset=None):
-        return input_amount * (1 - self.fee) - 0.000001 # to avoid rounding issues
+        state = PoolState(input_token_balance, output_token_balance, self.fee)
+        return self.quote(SWAP_A_FOR_B, input_amount, state)[0]
 
     def get_input_amount(self, input_token, output_token, output_amount):
         return output_amount / (1 - self.fee)
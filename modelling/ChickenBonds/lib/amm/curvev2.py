@@ -1,7 +1,11 @@
 from typing import List
+from collections import OrderedDict
 import math
 import numpy as np
+from scipy.optimize import brentq
+from lib.constants import *
 from lib.amm.amm_base import *
+from lib.amm import curvev2_int
 
 # Type aliases
 uint256 = float
@@ -29,8 +33,19 @@ MAX_A = N_COINS**N_COINS * A_MULTIPLIER * 100000 / 10**18
 
 NEWTON_MAX_ITERATIONS = 1000
 
+# Root finding for trade sizes: absolute tolerance, relative to the pool balance of the input coin
+SOLVER_TOLERANCE = 1e-4
+SOLVER_MAX_ITERATIONS = 100
+SOLVER_MAX_BRACKET_STEPS = 30
+
+# Converged Newton solutions kept per pool (see SolverCache)
+SOLVER_CACHE_SIZE = 1024
+
 TMP_ACCOUNT = "tmp_account"
 
+# What the exchange math depends on (see CurveV2Pool.quote)
+CurveV2State = namedtuple("CurveV2State", ["balances", "price_scale", "D", "A_gamma", "mid_fee", "out_fee", "fee_gamma", "math_mode"])
+
 def unsafe_add(a, b):
     return a + b
 
@@ -45,7 +60,66 @@ def unsafe_div(a, b):
     #assert b > 0
     return a / b
 
+class SolverCache():
+    """
+    Converged solutions of the Newton solvers of a pool. They are kept as:
+     - an LRU memo keyed on all the solver inputs, so repeated solves are free.
+       As the keys hold the whole input, a state change can't return a stale
+       solution, it just misses.
+     - warm starts (off by default): the next solve starts from the last solution
+       instead of the constant product guess, as consecutive calls see nearly the same
+       balances (only when it's safe, see CurveV2Pool.get_warm_start_D). They save
+       Newton iterations, but solves stop at a different point within the tolerance,
+       so a simulation drifts from a cold started one (over the default 1440 iterations:
+       ~1e-5 relative on prices, a few % on APRs).
+       The memo alone keeps results identical.
+    Calls, cache hits and Newton iterations are counted per solver.
+    """
+    def __init__(self, size=SOLVER_CACHE_SIZE, warm_start=False):
+        self.size = size
+        self.warm_start = warm_start
+        self.memo = OrderedDict()
+        self.warm_starts = {}
+        self.stats = {name: {"calls": 0, "cache_hits": 0, "iterations": 0} for name in ["newton_D", "newton_y"]}
+        self.last_iterations = {name: 0 for name in self.stats}
+
+    def get(self, name, key):
+        self.stats[name]["calls"] += 1
+        solution = self.memo.get(key)
+        if solution is not None:
+            self.memo.move_to_end(key)
+            self.stats[name]["cache_hits"] += 1
+            self.last_iterations[name] = 0
+        return solution
+
+    def put(self, name, key, solution, iterations, warm_start_key):
+        self.memo[key] = solution
+        if len(self.memo) > self.size:
+            self.memo.popitem(last=False)
+        self.warm_starts[warm_start_key] = solution
+        self.stats[name]["iterations"] += iterations
+        self.last_iterations[name] = iterations
+
+    def get_warm_start(self, warm_start_key):
+        if not self.warm_start:
+            return None
+        return self.warm_starts.get(warm_start_key)
+
+    def clear(self):
+        self.memo.clear()
+        self.warm_starts.clear()
+
 class CurveV2Pool(AmmBase):
+    """
+    Port of brownie/contracts/CurveCryptoSwap2.vy, on floats.
+    math_mode picks the invariant solvers (newton_D_bigint and newton_y_bigint):
+     - "float": Newton on floats.
+     - "int": the contract arithmetic on integers (see lib/amm/curvev2_int.py), with inputs
+       converted to wei and solutions back to floats. Only the solvers are exact: balances,
+       prices, fees and the Token ledgers stay float, so the rest of the pool is not a uint256 one.
+       In particular, tweak_price still needs the 1e-10 tolerance in its virtual price
+       check ("Loss"), the same as in float mode.
+    """
 
     def __init__(
             self,
@@ -61,7 +135,9 @@ class CurveV2Pool(AmmBase):
             adjustment_step,
             admin_fee,
             ma_half_time,
-            initial_price
+            initial_price,
+            math_mode=CURVE_V2_MATH,
+            warm_start=CURVE_V2_WARM_START
     ):
         # fee doesn’t matter, as we are overriding swap functions
         super().__init__(pool_account, token_A, token_B, mid_fee / 10 ** 10, rewards_account, rewards_period)
@@ -92,7 +168,10 @@ class CurveV2Pool(AmmBase):
 
         self.xcp_profit_a = PRECISION
 
-        self.token_A.mint(TMP_ACCOUNT, 1e32)
+        assert math_mode in ("float", "int")
+        self.math_mode = math_mode
+        # The contract always starts from the constant product guess, so no warm starts for exact math
+        self.solver_cache = SolverCache(warm_start=(warm_start and math_mode == "float"))
 
         return
 
@@ -104,6 +183,83 @@ class CurveV2Pool(AmmBase):
         return (unsorted_x[0] * unsorted_x[1]) ** (1/2)
 
     def newton_D_bigint(self, ANN: uint256, gamma: uint256, x_unsorted: uint256_N_COINS) -> uint256:
+        """
+        Invariant for balances x_unsorted, through the solver cache of the pool, if any.
+        """
+        cache: SolverCache = self.solver_cache
+        if cache is None:
+            return self.solve_D(ANN, gamma, x_unsorted)[0]
+        key = ("newton_D", ANN, gamma, x_unsorted[0], x_unsorted[1])
+        D: uint256 = cache.get("newton_D", key)
+        if D is None:
+            D0: uint256 = self.get_warm_start_D(ANN, gamma, x_unsorted, cache.get_warm_start("newton_D"))
+            D, iterations = self.solve_D(ANN, gamma, x_unsorted, D0)
+            cache.put("newton_D", key, D, iterations, "newton_D")
+        return D
+
+    def newton_y_bigint(self, ANN: uint256, gamma: uint256, x: uint256_N_COINS, D: uint256, i: int) -> uint256:
+        """
+        Balance of coin i for the other balance in x and invariant D, through the solver cache of the pool, if any.
+        """
+        cache: SolverCache = self.solver_cache
+        if cache is None:
+            return self.solve_y(ANN, gamma, x, D, i)[0]
+        key = ("newton_y", ANN, gamma, x[0], x[1], D, i)
+        y: uint256 = cache.get("newton_y", key)
+        if y is None:
+            y0: uint256 = self.get_warm_start_y(ANN, gamma, x, D, i, cache.get_warm_start(("newton_y", i)))
+            y, iterations = self.solve_y(ANN, gamma, x, D, i, y0)
+            cache.put("newton_y", key, y, iterations, ("newton_y", i))
+        return y
+
+    # Newton from the constant product guess converges monotonically: from below for D, and from
+    # above for y. A warm start can end up in a wrong solution from the other side of the root,
+    # so it's only used if it's on the same side as the constant product guess, and closer.
+
+    def get_invariant(self, ANN: uint256, gamma: uint256, x0: uint256, x1: uint256, D: uint256) -> uint256:
+        """
+        F(x, D) = K D (x0 + x1) + x0 x1 - K D^2 - (D / 2)^2 (see get_marginal_price)
+        """
+        A: uint256 = ANN * 10**18 / A_MULTIPLIER / N_COINS**N_COINS
+        K0: uint256 = N_COINS**N_COINS * x0 * x1 / D**2
+        K: uint256 = A * gamma**2 * K0 / (gamma + 1 - K0)**2
+        return K * D * (x0 + x1) + x0 * x1 - K * D**2 - D**2 / 4
+
+    def get_warm_start_D(self, ANN: uint256, gamma: uint256, x: uint256_N_COINS, D0: uint256) -> uint256:
+        if not D0:
+            return None
+        D_cold: uint256 = N_COINS * self.geometric_mean(x, False)
+        if D0 <= D_cold:
+            return None
+        if (self.get_invariant(ANN, gamma, x[0], x[1], D0) > 0) != (self.get_invariant(ANN, gamma, x[0], x[1], D_cold) > 0):
+            return None
+        return D0
+
+    def get_warm_start_y(self, ANN: uint256, gamma: uint256, x: uint256_N_COINS, D: uint256, i: int, y0: uint256) -> uint256:
+        if not y0:
+            return None
+        x_j: uint256 = x[1 - i]
+        y_cold: uint256 = D**2 / (x_j * N_COINS**2)
+        if y0 >= y_cold:
+            return None
+        if (self.get_invariant(ANN, gamma, x_j, y0, D) > 0) != (self.get_invariant(ANN, gamma, x_j, y_cold, D) > 0):
+            return None
+        return y0
+
+    def get_solver_stats(self):
+        """
+        Calls, cache hits and Newton iterations per solver, since the pool was created.
+        """
+        if self.solver_cache is None:
+            return {}
+        return {name: dict(stats) for name, stats in self.solver_cache.stats.items()}
+
+    # Newton solvers, returning the solution and the number of iterations
+    # D0 and y0 are initial guesses (warm starts), the constant product ones by default
+
+    def solve_D(self, ANN: uint256, gamma: uint256, x_unsorted: uint256_N_COINS, D0: uint256 = None) -> (uint256, int):
+        if self.math_mode == "int":
+            return self.newton_D_int(ANN, gamma, x_unsorted)
         # Convert to bigints
         ANN *= 10**18
         gamma *= 10**18
@@ -129,6 +285,8 @@ class CurveV2Pool(AmmBase):
         assert x[1] * 10**18 / x[0] > 10**14-1  # dev: unsafe values x[i] (input)
 
         D: uint256 = N_COINS * self.geometric_mean(x, False)
+        if D0:
+            D = D0 * 10**18
         S: uint256 = x[0] + x[1]
         __g1k0: uint256 = gamma + 10**18
 
@@ -180,9 +338,9 @@ class CurveV2Pool(AmmBase):
                 for _x in x:
                     frac: uint256 = _x * 10**18 / D
                     assert (frac > 10**16 - 1) and (frac < 10**20 + 1)  # dev: unsafe values x[i]
-                return D / 10**18
+                return D / 10**18, i + 1
 
-        raise "Did not converge"
+        raise RuntimeError("Did not converge")
 
     def newton_D(self, ANN: uint256, gamma: uint256, x_unsorted: uint256_N_COINS) -> uint256:
         """
@@ -260,7 +418,7 @@ class CurveV2Pool(AmmBase):
 
         raise "Did not converge"
 
-    def newton_y_bigint(self, ANN: uint256, gamma: uint256, x: uint256_N_COINS, D: uint256, i: int) -> uint256:
+    def solve_y(self, ANN: uint256, gamma: uint256, x: uint256_N_COINS, D: uint256, i: int, y0: uint256 = None) -> (uint256, int):
         """
         print("\n newton_y_bigint")
         #print(f"min A: {MIN_A:,.12f}")
@@ -271,6 +429,8 @@ class CurveV2Pool(AmmBase):
         print(f"x[1]: {x[1]:,.6f}")
         print(f"i: {i}")
         """
+        if self.math_mode == "int":
+            return self.newton_y_int(ANN, gamma, x, D, i)
         # Convert to bigints
         ANN *= 10**18
         gamma *= 10**18
@@ -289,6 +449,8 @@ class CurveV2Pool(AmmBase):
 
         x_j: uint256 = x[1 - i]
         y: uint256 = D**2 / (x_j * N_COINS**2)
+        if y0:
+            y = y0 * 10**18
         K0_i: uint256 = (10**18 * N_COINS) * x_j / D
         # S_i = x_j
 
@@ -363,13 +525,13 @@ class CurveV2Pool(AmmBase):
                 frac: uint256 = unsafe_div(y * 10**18, D)
                 assert (frac > 10**16 - 1) and (frac < 10**20 + 1)  # dev: unsafe value for y
                 #print(f"y: {y:,.2f}")
-                return y / 10**18
+                return y / 10**18, j + 1
 
         print(f"y_prev: {y_prev / 10**18:,.12f}")
         print(f"y     : {y / 10**18:,.12f}")
         print(f"diff:   {diff / 10**18:,.12f}")
         print(f"convergence_limit: {convergence_limit / 10**18:,.12f}")
-        raise "Did not converge"
+        raise RuntimeError("Did not converge")
 
     def newton_y(self, ANN: uint256, gamma: uint256, x: uint256_N_COINS, D: uint256, i: int) -> uint256:
         #print("\n newton_y")
@@ -481,6 +643,140 @@ class CurveV2Pool(AmmBase):
         raise "Did not converge"
 
 
+    # Exact contract arithmetic, on integers (math_mode "int")
+
+    def newton_D_int(self, ANN: uint256, gamma: uint256, x_unsorted: uint256_N_COINS) -> (uint256, int):
+        x = [curvev2_int.to_int(x_unsorted[0]), curvev2_int.to_int(x_unsorted[1])]
+        D, iterations = curvev2_int.newton_D(curvev2_int.to_int(ANN), curvev2_int.to_int(gamma), x, with_iterations=True)
+        return curvev2_int.to_float(D), iterations
+
+    def newton_y_int(self, ANN: uint256, gamma: uint256, x: uint256_N_COINS, D: uint256, i: int) -> (uint256, int):
+        x = [curvev2_int.to_int(x[0]), curvev2_int.to_int(x[1])]
+        y, iterations = curvev2_int.newton_y(curvev2_int.to_int(ANN), curvev2_int.to_int(gamma), x, curvev2_int.to_int(D), i, with_iterations=True)
+        return curvev2_int.to_float(y), iterations
+
+    # Vectorized solvers: same iterations as the *_bigint ones, for arrays of balances.
+    # Each lane stops updating as soon as it converges, so results match the scalar ones.
+
+    def newton_D_batch(self, ANN: uint256, gamma: uint256, x_unsorted: List[np.ndarray]) -> np.ndarray:
+        """
+        newton_D_bigint for arrays x_unsorted[0] and x_unsorted[1] (same length).
+        """
+        # Convert to bigints
+        ANN *= 10**18
+        gamma *= 10**18
+        x0 = np.asarray(x_unsorted[0], dtype=float) * 10**18
+        x1 = np.asarray(x_unsorted[1], dtype=float) * 10**18
+
+        # Safety checks
+        assert ANN > MIN_A * 10**18 - 1 and ANN < MAX_A * 10**18 + 1  # dev: unsafe values A
+        assert gamma > MIN_GAMMA * 10**18 - 1 and gamma < MAX_GAMMA * 10**18 + 1  # dev: unsafe values gamma
+
+        # Sorted, from high to low
+        x0, x1 = np.maximum(x0, x1), np.minimum(x0, x1)
+        assert np.all((x0 > 10**9 - 1) & (x0 < 10**15 * 10**18 + 1))  # dev: unsafe values x[0]
+        assert np.all(x1 * 10**18 / x0 > 10**14-1)  # dev: unsafe values x[i] (input)
+
+        D = N_COINS * (x0 * x1) ** (1/2)
+        S = x0 + x1
+        __g1k0: uint256 = gamma + 10**18
+        active = np.ones(D.shape, dtype=bool)
+
+        for i in range(255):
+            D_prev = D
+            K0 = (10**18 * N_COINS**2) * x0 / D * x1 / D
+            _g1k0 = np.abs(__g1k0 - K0) + 1
+
+            # D / (A * N**N) * _g1k0**2 / gamma**2
+            mul1 = 10**18 * D / gamma * _g1k0 / gamma * _g1k0 * A_MULTIPLIER / ANN
+            # 2*N*K0 / _g1k0
+            mul2 = ((2 * 10**18) * N_COINS) * K0 / _g1k0
+
+            neg_fprime = (S + S * mul2 / 10**18) + mul1 * N_COINS / K0 - mul2 * D / 10**18
+
+            # D -= f / fprime
+            D_plus = D * (neg_fprime + S) / neg_fprime
+            D_minus = D*D / neg_fprime
+            D_minus_correction = D * (mul1 / neg_fprime) / 10**18
+            D_minus = np.where(
+                10**18 > K0,
+                D_minus + D_minus_correction * (10**18 - K0) / K0,
+                D_minus - D_minus_correction * (K0 - 10**18) / K0
+            )
+            D = np.where(D_plus > D_minus, D_plus - D_minus, (D_minus - D_plus) / 2)
+            D = np.where(active, D, D_prev)
+
+            active &= np.abs(D - D_prev) * 10**14 >= np.maximum(10**16, D)
+            if not active.any():
+                # Test that we are safe with the next newton_y
+                for _x in [x0, x1]:
+                    frac = _x * 10**18 / D
+                    assert np.all((frac > 10**16 - 1) & (frac < 10**20 + 1))  # dev: unsafe values x[i]
+                return D / 10**18
+
+        raise RuntimeError("Did not converge")
+
+    def newton_y_batch(self, ANN: uint256, gamma: uint256, x: List[np.ndarray], D, i: int) -> np.ndarray:
+        """
+        newton_y_bigint for arrays x[0] and x[1] (same length). D can be a number or an array.
+        """
+        # Convert to bigints
+        ANN *= 10**18
+        gamma *= 10**18
+        x_j = np.asarray(x[1 - i], dtype=float) * 10**18
+        D = np.asarray(D, dtype=float) * 10**18
+
+        # Safety checks
+        assert ANN > MIN_A * 10**18 - 1 and ANN < MAX_A * 10**18 + 1  # dev: unsafe values A
+        assert gamma > MIN_GAMMA * 10**18 - 1 and gamma < MAX_GAMMA * 10**18 + 1  # dev: unsafe values gamma
+        assert np.all((D > 10**17 - 1) & (D < 10**15 * 10**18 + 1)) # dev: unsafe values D
+
+        y = D**2 / (x_j * N_COINS**2)
+        K0_i = (10**18 * N_COINS) * x_j / D
+        assert np.all((K0_i > 10**16*N_COINS - 1) & (K0_i < 10**20*N_COINS + 1))  # dev: unsafe values x[i]
+
+        convergence_limit = np.maximum(np.maximum(x_j / 10**14, D / 10**14), 100)
+        __g1k0: uint256 = gamma + 10**18
+        active = np.ones(y.shape, dtype=bool)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for j in range(NEWTON_MAX_ITERATIONS):
+                y_prev = y
+
+                K0 = K0_i * y * N_COINS / D
+                S = x_j + y
+                _g1k0 = np.abs(__g1k0 - K0) + 1
+
+                # D / (A * N**N) * _g1k0**2 / gamma**2
+                mul1 = 10**18 * D / gamma * _g1k0 / gamma * _g1k0 * A_MULTIPLIER / ANN
+                # 2*K0 / _g1k0
+                mul2 = (10**18 + (2 * 10**18) * K0) / _g1k0
+
+                yfprime = 10**18 * y + S * mul2 + mul1
+                _dyfprime = D * mul2
+                # Lanes where the step would overshoot are halved instead (and can’t converge on this step)
+                overshoot = yfprime < _dyfprime
+                yfprime = yfprime - _dyfprime
+                fprime = yfprime / y
+
+                # y -= f / f_prime;  y = (y * fprime - f) / fprime
+                y_minus = mul1 / fprime
+                y_plus = (yfprime + 10**18 * D) / fprime + y_minus * 10**18 / K0
+                y_minus += 10**18 * S / fprime
+
+                halve = overshoot | (y_plus < y_minus)
+                y = np.where(halve, y_prev / 2, y_plus - y_minus)
+                y = np.where(active, y, y_prev)
+
+                converged = ~overshoot & (np.abs(y - y_prev) < np.maximum(convergence_limit, y / 10**14))
+                active &= ~converged
+                if not active.any():
+                    frac = y * 10**18 / D
+                    assert np.all((frac > 10**16 - 1) & (frac < 10**20 + 1))  # dev: unsafe value for y
+                    return y / 10**18
+
+        raise RuntimeError("Did not converge")
+
     def _A_gamma(self) -> List[float]:
         return [self.future_A_gamma[0], self.future_A_gamma[1]]
 
@@ -697,22 +993,15 @@ class CurveV2Pool(AmmBase):
 
     # modifies self.balances
     # calls self.tweak_price
-    def _exchange(self, sender: address, i: uint256, j: uint256, dx: uint256, min_dy: uint256,
-                  receiver: address, debug=False) -> (uint256, uint256):
-        #print(f"_exchange({i}, {j}, {dx:,.6f}, {min_dy:,.2f})")
-        assert not self.is_killed  # dev: the pool is killed
-        assert i != j  # dev: coin index out of range
-        assert i < N_COINS  # dev: coin index out of range
-        assert j < N_COINS  # dev: coin index out of range
-        assert dx > 0  # dev: do not exchange 0 coins
-
-        A_gamma: List[float] = self._A_gamma()
+    # Math of _exchange, without modifying any state
+    # Returns output and fee amounts, and balances and xp after the trade (before tweak_price)
+    def _get_exchange_output(self, A_gamma: List[float], i: uint256, j: uint256, dx: uint256, debug=False):
+        balances: uint256_N_COINS = self.balances.copy()
         xp: uint256_N_COINS = self.balances.copy()
         if debug:
             print(f"xp[0]: {xp[0]:,.6f}")
             print(f"xp[1]: {xp[1]:,.6f}")
             print(f"dx: {dx:,.6f}")
-        p: uint256 = 0
         dy: uint256 = 0
 
         #_coins = self.coins
@@ -720,7 +1009,7 @@ class CurveV2Pool(AmmBase):
         y: uint256 = xp[j]
         x0: uint256 = xp[i]
         xp[i] = x0 + dx
-        self.balances[i] = xp[i]
+        balances[i] = xp[i]
 
         price_scale: uint256 = self.price_scale
 
@@ -756,7 +1045,8 @@ class CurveV2Pool(AmmBase):
             print(f"dy: {dy:,.2f}")
         # Not defining new "y" here to have less variables / make subsequent calls cheaper
         xp[j] -= dy
-        dy -= 1
+        # 1 wei, as in get_dy
+        dy -= 1 / 10**18
 
         if j > 0:
             dy = dy * PRECISION / price_scale
@@ -769,25 +1059,87 @@ class CurveV2Pool(AmmBase):
             print(f"fee: {self._fee(xp):,.6f}")
             print(f"fee amt: {fee_amount:,.6f}")
         dy -= fee_amount
+        if dy < 0:
+            return dy, fee_amount, balances, xp
+
+        y -= dy
+        balances[j] = y
+
+        y *= prec_j
+        if j > 0:
+            y = y * price_scale / PRECISION
+        xp[j] = y
+
+        return dy, fee_amount, balances, xp
+
+    def get_state(self):
+        return CurveV2State(
+            tuple(self.balances), self.price_scale, self.D, tuple(self._A_gamma()),
+            self.mid_fee, self.out_fee, self.fee_gamma, self.math_mode
+        )
+
+    @staticmethod
+    def quote(direction, amount, state, solver_cache=None):
+        """
+        Output and fee of _exchange, without executing it. The state after the swap has
+        the balances and D _exchange would leave, but not the price_scale adjustment
+        that tweak_price may do afterwards.
+        @param solver_cache: SolverCache to use for the Newton solves. Without it the
+        result only depends on the arguments; with it, warm starts (if on) can move it
+        within the solver tolerance.
+        """
+        i, j = direction, 1 - direction
+        # Bare pool with only the fields the exchange math reads
+        pool = CurveV2Pool.__new__(CurveV2Pool)
+        pool.balances = list(state.balances)
+        pool.price_scale = state.price_scale
+        pool.D = state.D
+        pool.mid_fee = state.mid_fee
+        pool.out_fee = state.out_fee
+        pool.fee_gamma = state.fee_gamma
+        pool.math_mode = state.math_mode
+        pool.solver_cache = solver_cache
+        A_gamma: List[float] = list(state.A_gamma)
+
+        output_amount, fee_amount, balances, xp = pool._get_exchange_output(A_gamma, i, j, amount)
+        if output_amount < 0:
+            # _exchange would bail out
+            return 0.0, 0.0, state
+        D: uint256 = pool.newton_D_bigint(A_gamma[0], A_gamma[1], xp)
+        return output_amount, fee_amount, state._replace(balances=tuple(balances), D=D)
+
+    def _exchange(self, sender: address, i: uint256, j: uint256, dx: uint256, min_dy: uint256,
+                  receiver: address, debug=False) -> (uint256, uint256):
+        #print(f"_exchange({i}, {j}, {dx:,.6f}, {min_dy:,.2f})")
+        assert not self.is_killed  # dev: the pool is killed
+        assert i != j  # dev: coin index out of range
+        assert i < N_COINS  # dev: coin index out of range
+        assert j < N_COINS  # dev: coin index out of range
+        assert dx > 0  # dev: do not exchange 0 coins
+
+        A_gamma: List[float] = self._A_gamma()
+        p: uint256 = 0
+        dy, fee_amount, balances, xp = self._get_exchange_output(A_gamma, i, j, dx, debug)
+        self.balances[i] = balances[i]
         if dy < 0:
             return 0, 0
         if debug:
             print(f"dy: {dy:,.6f}")
             print(f"min dy: {min_dy:,.6f}")
         assert dy >= min_dy, "Slippage"
-        y -= dy
 
-        self.balances[j] = y
+        self.balances[j] = balances[j]
 
         #assert ERC20(_coins[i]).transferFrom(sender, self, dx)
         #assert ERC20(_coins[j]).transfer(receiver, dy)
         self.coins[i].transfer(sender, self.pool_account, dx)
         self.coins[j].transfer(self.pool_account, receiver, dy)
 
-        y *= prec_j
-        if j > 0:
-            y = y * price_scale / PRECISION
-        xp[j] = y
+        prec_i: uint256 = PRECISIONS[0]
+        prec_j: uint256 = PRECISIONS[1]
+        if i == 1:
+            prec_i = PRECISIONS[1]
+            prec_j = PRECISIONS[0]
 
         # Calculate price
         if dx > 10**5 / 10**18 and dy > 10**5 / 10**18:
@@ -1111,123 +1463,121 @@ class CurveV2Pool(AmmBase):
 
         return dy
 
-    def save_state(self):
-        state = {}
-        state["balances"] = self.balances.copy()
-        state["price_scale"] = self.price_scale
-        state["D"] = self.D
-        state["last_prices"] = self.last_prices
-        state["_price_oracle"] = self._price_oracle
-        state["xcp_profit"] = self.xcp_profit
-        state["not_adjusted"] = self.not_adjusted
-        state["virtual_price"] = self.virtual_price
-        state["xcp_profit_a"] = self.xcp_profit_a
-
-        return state
-
-    def revert_state(self, state, debug=False):
-        if debug:
-            #"""
-            print(f"self.balances[0]: {self.balances[0]:,.2f}")
-            print(f"balances[0]: {balances[0]:,.2f}")
-            print(f"self.balances[1]: {self.balances[1]:,.2f}")
-            print(f"balances[1]: {balances[1]:,.2f}")
-            print(f"self.price_scale: {self.price_scale:,.2f}")
-            print(f"price_scale: {price_scale:,.2f}")
-            print(f"self.D: {self.D:,.2f}")
-            print(f"D: {D:,.2f}")
-            print(f"self.last_prices: {self.last_prices:,.2f}")
-            print(f"last_prices: {last_prices:,.2f}")
-            print(f"self._price_oracle: {self._price_oracle:,.2f}")
-            print(f"_price_oracle: {_price_oracle:,.2f}")
-            print(f"self.xcp_profit: {self.xcp_profit:,.2f}")
-            print(f"xcp_profit: {xcp_profit:,.2f}")
-            print(f"self.not_adjusted: {self.not_adjusted:,.2f}")
-            print(f"not_adjusted: {not_adjusted:,.2f}")
-            print(f"self.virtual_price: {self.virtual_price:,.2f}")
-            print(f"virtual_price: {virtual_price:,.2f}")
-            print(f"self.xcp_profit_a: {self.xcp_profit_a:,.2f}")
-            print(f"xcp_profit_a: {xcp_profit_a:,.2f}")
-            #"""
-        self.balances[0] = state["balances"][0]
-        self.balances[1] = state["balances"][1]
-        self.price_scale = state["price_scale"]
-        self.D = state["D"]
-        self.last_prices = state["last_prices"]
-        self._price_oracle = state["_price_oracle"]
-        self.xcp_profit = state["xcp_profit"]
-        self.not_adjusted = state["not_adjusted"]
-        self.virtual_price = state["virtual_price"]
-        self.xcp_profit_a = state["xcp_profit_a"]
+    def get_dy_batch(self, i: int, j: int, dx: np.ndarray) -> np.ndarray:
+        """
+        get_dy for a whole array of input amounts in one go, e.g. for depth charts or slippage tables.
+        @param dx: Array of amounts of coin i in
+        @return: Array of amounts of coin j out (0 where get_dy would fail because nothing comes out)
+        """
+        dx = np.asarray(dx, dtype=float)
+        if self.balances[0] == 0 and self.balances[1] == 0:
+            return np.zeros(dx.shape)
+        assert i != j  # dev: same input and output coin
+        assert i < N_COINS  # dev: coin index out of range
+        assert j < N_COINS  # dev: coin index out of range
 
-        return
+        price_scale: uint256 = self.price_scale * PRECISIONS[1]
+        xp = [np.full(dx.shape, self.balances[0]), np.full(dx.shape, self.balances[1])]
+
+        A_gamma: uint256[2] = self._A_gamma()
+        D: uint256 = self.D
+        if self.future_A_gamma_time > 0:
+            D = self.newton_D_bigint(A_gamma[0], A_gamma[1], self.xp().copy())
+
+        xp[i] = xp[i] + dx
+        xp = [xp[0] * PRECISIONS[0], xp[1] * price_scale / PRECISION]
+
+        y = self.newton_y_batch(A_gamma[0], A_gamma[1], xp, D, j)
+        dy = xp[j] - y - 1 / 10**18
+        xp[j] = y
+        if j > 0:
+            dy = dy * PRECISION / price_scale
+        else:
+            dy /= PRECISIONS[0]
+        dy -= self._fee(xp) * dy
+
+        return np.maximum(dy, 0)
+
+    #@view
+    def get_marginal_price(self, i, j, balances=None, D=None):
+        """
+        Amount of coin j out per unit of coin i in, for an infinitesimal trade, net of fees.
+        Along the invariant F(x, D) = 0, dx_j / dx_i = - (dF/dx_i) / (dF/dx_j), with
+        F = K D (x0 + x1) + x0 x1 - K D^2 - (D / 2)^2
+        K = A gamma^2 K0 / (gamma + 1 - K0)^2
+        K0 = 4 x0 x1 / D^2
+        @param balances: Pool balances to price at (defaults to the current ones)
+        @param D: Invariant for those balances (defaults to the current one)
+        """
+        if balances is None:
+            balances = self.balances
+        price_scale: uint256 = self.price_scale * PRECISIONS[1]
+        xp: uint256_N_COINS = [balances[0] * PRECISIONS[0], balances[1] * price_scale / PRECISION]
+        A_gamma: List[float] = self._A_gamma()
+        if D is None:
+            D = self.D
+            if self.future_A_gamma_time > 0:
+                D = self.newton_D_bigint(A_gamma[0], A_gamma[1], xp.copy())
+
+        # ANN is A * N**N * A_MULTIPLIER, scaled down by 1e18 (see newton_D_bigint)
+        A: uint256 = A_gamma[0] * 10**18 / A_MULTIPLIER / N_COINS**N_COINS
+        gamma: uint256 = A_gamma[1]
+
+        S: uint256 = xp[0] + xp[1]
+        K0: uint256 = N_COINS**N_COINS * xp[0] * xp[1] / D**2
+        g1k0: uint256 = gamma + 1 - K0
+        K: uint256 = A * gamma**2 * K0 / g1k0**2
+        # dK/dK0, and dK0/dx_k = K0 / x_k
+        dK: uint256 = A * gamma**2 * (gamma + 1 + K0) / g1k0**3
+        dF: uint256_N_COINS = [
+            K * D + xp[1] + dK * K0 / xp[0] * (D * S - D**2),
+            K * D + xp[0] + dK * K0 / xp[1] * (D * S - D**2),
+        ]
+        # From xp back to token amounts
+        scale: uint256_N_COINS = [PRECISIONS[0], price_scale / PRECISION]
+        price: uint256 = dF[i] / dF[j] * scale[i] / scale[j]
+
+        return price * (1 - self._fee(xp))
 
-    def undo_transfers(self, dx, dy, output_amount):
-        # Undo transfers
+    #@view
+    def get_post_trade_price(self, i, j, dx = 0, dy = 0, debug=False):
+        """
+        Marginal price after swapping dx of token A, or dy of token B, without executing the swap.
+        Balances and D are the ones _exchange would leave, but the price_scale
+        adjustment that tweak_price may do afterwards is not simulated.
+        """
+        assert dx == 0 or dy == 0
         if dx > 0:
-            self.coins[0].transfer(self.pool_account, TMP_ACCOUNT, dx)
-            self.coins[1].transfer(TMP_ACCOUNT, self.pool_account, output_amount)
-        if dy > 0:
-            self.coins[1].transfer(self.pool_account, TMP_ACCOUNT, dy)
-            self.coins[0].transfer(TMP_ACCOUNT, self.pool_account, output_amount)
-            self.coins[1].burn(TMP_ACCOUNT, dy)
+            input_amount = dx
+            output_amount, _, state = self.quote(SWAP_A_FOR_B, dx, self.get_state(), self.solver_cache)
+        else:
+            input_amount = dy
+            output_amount, _, state = self.quote(SWAP_B_FOR_A, dy, self.get_state(), self.solver_cache)
+        if output_amount <= 0:
+            # Nothing out (the input doesn’t even cover the fixed costs)
+            return math.inf
+        exchange_price = input_amount / output_amount
+
+        price = max(self.get_marginal_price(i, j, state.balances, state.D), exchange_price)
+        if debug:
+            print("\033[35m\n -- get_post_trade_price\033[0m")
+            print(f"dx: {dx:,.2f}")
+            print(f"dy: {dy:,.2f}")
+            print(f"output_amount: {output_amount:,.6f}")
+            print(f"exchange_price: {exchange_price:,.6f}")
+            print(f"price: {price:,.6f}")
 
-        return
+        return price
 
     # dx is always token A (LUSD), never B (bLUSD), no matter what the order of i,j is
     def get_spot_price(self, i, j, dx = 0, dy = 0, debug=False):
-        # A good trade off to reduce both slippage and error due to Newton method (2% of the balance in the pool):
         if self.balances[i] == 0:
             return 0
-        sample_amount = self.balances[i] * 0.02
-        if debug:
-            print("\033[35m\n -- get_spot_price\033[0m")
-            print(f"dx: {dx:,.2f}")
         assert dx == 0 or dy == 0
-        # Save state
-        if dx > 0 or dy > 0:
-            state = self.save_state()
-
-        price_before = self.get_dy(i, j, sample_amount) / sample_amount
-        if debug:
-            print(f"price before!:  {price_before:,.6f}")
-            print(f"price_scale b4: {self.price_scale:,.6f}")
-        exchange_price = 0
-        if dx > 0:
-            output_amount, _ = self._exchange(TMP_ACCOUNT, 0, 1, dx, 0, TMP_ACCOUNT)
-            exchange_price = dx / output_amount
-            if debug:
-                print(f"output_amount (dy): {output_amount:,.6f}")
-                print(f"exchange_price: {exchange_price:,.6f}")
-        if dy > 0:
-            # we need to mint bLUSD to simulate exchange!
-            self.coins[1].mint(TMP_ACCOUNT, dy)
-            output_amount, _ = self._exchange(TMP_ACCOUNT, 1, 0, dy, 0, TMP_ACCOUNT)
-            exchange_price = dy / output_amount
-            if debug:
-                print(f"output_amount (dx): {output_amount:,.6f}")
-                print(f"exchange_price: {exchange_price:,.6f}")
-
-        #print("\033[35m\n -- get_spot_price (cont)\033[0m")
-        # Tweak price can mess things up, making the exchange have a higher price than the final spot price
-        price = max(self.get_dy(i, j, sample_amount, debug) / sample_amount, exchange_price)
-        if debug:
-            print(f"price: {price:,.6f}")
-            print(f"price_scale: {self.price_scale:,.6f}")
-
         if dx > 0 or dy > 0:
-            # undo state
-            self.revert_state(state)
-            # Undo transfers
-            self.undo_transfers(dx, dy, output_amount)
-
-
-        price_after = self.get_dy(i, j, sample_amount) / sample_amount
-        if debug:
-            print(f"price after!: {price_after:,.2f}")
-        assert price_before == price_after
+            return self.get_post_trade_price(i, j, dx, dy, debug)
 
-        return price
+        return self.get_marginal_price(i, j)
 
     def get_token_A_price(self, dx = 0, dy = 0):
         return self.get_spot_price(0, 1, dx, dy)
@@ -1235,12 +1585,32 @@ class CurveV2Pool(AmmBase):
     def get_token_B_price(self, dx = 0, dy = 0, debug=False):
         return self.get_spot_price(1, 0, dx, dy, debug)
 
+    def find_input(self, gap, low, high, xtol):
+        """
+        Input amount where an increasing function of it, `gap`, crosses zero, with Brent’s method.
+        The result is taken on the side where gap <= 0, so it never goes over the target.
+        @param low: Input with gap(low) <= 0
+        @param high: Input with gap(high) >= 0
+        @param xtol: Absolute tolerance on the input
+        @return: Input amount and number of evaluations of gap
+        """
+        input_amount, result = brentq(gap, low, high, xtol=xtol, maxiter=SOLVER_MAX_ITERATIONS, full_output=True)
+        evaluations = result.function_calls + 1
+        if gap(input_amount) > 0:
+            # brentq stops with a bracket narrower than its tolerance, which is < 2 * xtol here
+            input_amount = max(input_amount - 2 * xtol, low)
+            evaluations = evaluations + 1
+            # gap can jump at low (e.g. the fee makes even tiny trades go over a target price)
+            if gap(input_amount) > 0:
+                input_amount = low
+
+        return input_amount, evaluations
+
     # Given a target token B price, returns the amount of token A that needs to be swapped to increase
     # current token B price to the desired target
-    def get_input_A_amount_from_target_price_B(self, target_price, debug=False):
+    def get_input_A_amount_from_target_price_B(self, target_price, debug=False, tolerance=SOLVER_TOLERANCE):
         if self.balances[1] == 0:
             return 0
-        MAX_STEPS = 100
         if debug:
             print(" \n-------------------- ")
             print(" -- get_input_A_amount_from_target_price_B")
@@ -1250,35 +1620,32 @@ class CurveV2Pool(AmmBase):
             print(f"initial_price: {initial_price:,.2f}")
         if target_price <= initial_price:
             return 0
-        step_amount = max(4 * self.token_A_balance() / MAX_STEPS * (target_price / initial_price - 1), 100)
-        input_amount = 0
-        next_price = initial_price
+
+        def price_gap(input_amount):
+            return self.get_token_B_price(input_amount, 0) - target_price
+
+        # Bracket the target price, doubling the input until the price goes over it
+        low = 0
+        high = max(4 * self.token_A_balance() * (target_price / initial_price - 1), 100)
+        step = 0
+        while price_gap(high) < 0:
+            low = high
+            high = 2 * high
+            step = step + 1
+            assert step < SOLVER_MAX_BRACKET_STEPS
+
+        # _exchange and get_dy already include fees, so no need to discount them
+        input_amount, evaluations = self.find_input(price_gap, low, high, tolerance * self.balances[0])
         if debug:
-            #"""
             print(" -- get_input_A_amount_from_target_price_B (cont.)")
             print(f"bal[0]: {self.balances[0]:,.2f}")
             print(f"bal[1]: {self.balances[1]:,.2f}")
-            print(f"A: {self.token_A_balance():,.2f}")
-            print(f"B: {self.token_B_balance():,.2f}")
-            print(f"initial_price: {initial_price:,.6f}")
-            print(f"step: {step_amount:,.2f}")
+            print(f"bracket: [{low:,.2f}, {high:,.2f}] in {step} steps")
+            print(f"evaluations: {evaluations}")
+            print(f"input_amount: {input_amount:,.2f}")
             print(f"price_scale: {self.price_scale:,.6f}")
-            #print(f"last_prices: {self.last_prices:,.6f}")
-            #"""
-        step = 0
-        while target_price > next_price:
-            input_amount += step_amount
-            next_price = self.get_token_B_price(input_amount, 0)
-            if debug:
-                print(f"Step: {step}")
-                print(f"next_price: {next_price:,.6f}")
-                print(f"input_amount: {input_amount:,.2f}")
-
-            step = step + 1
-            assert step < MAX_STEPS
 
-        # _exchange and get_dy already include fees, so no need to discount them
-        return input_amount - step_amount
+        return input_amount
 
     # Slippage
 
@@ -1289,29 +1656,20 @@ class CurveV2Pool(AmmBase):
             print(f"initial_price: {initial_price:,.2f}")
             print(f"input_amount:  {input_amount:,.2f}")
 
-        # Save state
-        state = self.save_state()
-
-        if i > j:
-            dx = 0
-            dy = input_amount
-            # we need to mint bLUSD to simulate exchange!
-            self.coins[1].mint(TMP_ACCOUNT, dy)
-            output_amount, _ = self._exchange(TMP_ACCOUNT, 1, 0, dy, 0, TMP_ACCOUNT, debug)
-        else:
-            dx = input_amount
-            dy = 0
-            output_amount, _ = self._exchange(TMP_ACCOUNT, 0, 1, dx, 0, TMP_ACCOUNT, debug)
+        # Only the math of the swap, nothing is executed. Quotes used to run the swap and tweak_price,
+        # and revert only part of it: the price oracle timestamp and the admin fee claims (LP mints)
+        # leaked into the pool. Without those leaks, the default run follows a different trajectory
+        # (e.g. ~387k reserve and ~261k bTKN supply at the end, instead of ~80k and ~54k).
+        output_amount, _, _, _ = self._get_exchange_output(self._A_gamma(), i, j, input_amount, debug)
+        if output_amount < 0:
+            # _exchange would bail out
+            output_amount = 0
 
         if debug:
             print(f"output_amount (dy): {output_amount:,.6f}")
 
         slippage = 1 - output_amount / (input_amount * initial_price)
 
-        # Undo state
-        self.revert_state(state)
-        self.undo_transfers(dx, dy, output_amount)
-
         if debug:
             print(f"\033[92m -- get_slippage_from_input ({i}, {j}) (cont)\033[0m")
             print(f"slippage: {slippage:.3%}")
@@ -1330,36 +1688,47 @@ class CurveV2Pool(AmmBase):
             return 0
         return self.get_slippage_from_input(initial_price, 1, 0, input_amount, debug)
 
-    def get_input_for_max_slippage(self, initial_price, max_slippage, i, j, debug):
-        input_amount = self.balances[i] / 5
+    def get_input_for_max_slippage(self, initial_price, max_slippage, i, j, debug, tolerance=SOLVER_TOLERANCE):
         if debug:
             print(f"\n -- get_input_for_max_slippage ({i}, {j})")
             print(f"initial_price: {initial_price:,.2f}")
-            print(f"input_amount: {input_amount:,.2f}")
             print(f"max_slippage: {max_slippage:.3%}")
             print(f"bal[{i}]: {self.balances[i]:,.2f}")
             print(f"bal[{j}]: {self.balances[j]:,.2f}")
             print(f"A bal: {self.token_A_balance():,.2f}")
             print(f"B bal: {self.token_B_balance():,.2f}")
-        slippage = self.get_slippage_from_input(initial_price, i, j, input_amount, debug)
+
+        def slippage_gap(input_amount):
+            return self.get_slippage_from_input(initial_price, i, j, input_amount, debug) - max_slippage
+
+        # Inputs are capped to 1/5 of the pool balance
+        high = self.balances[i] / 5
+        high_gap = slippage_gap(high)
+        if high_gap <= 0:
+            return high
+
+        # Slippage grows with the input, but tiny inputs also have a high one (fixed costs),
+        # so look for a lower end of the bracket halving the input, while slippage keeps going down
+        previous_gap = high_gap
+        low = high / 2
+        low_gap = slippage_gap(low)
         step = 0
-        while slippage > max_slippage:
+        while low_gap > 0:
             step = step + 1
-            slippage = self.get_slippage_from_input(initial_price, i, j, input_amount, debug)
-            if debug:
-                print(f"\nStep {step}")
-                print(f"input: {input_amount:,.2f}")
-                print(f"slippage: {slippage:.3%}")
-            input_amount = input_amount * max(0.5, min(0.8, 0.8 - 0.3 * slippage))
-            # TODO:
-            #assert step < 30
-            if step >=30:
-                print("\033[31m -- max iterations reached in get_input_for_max_slippage\033[0m")
+            if low_gap >= previous_gap or step >= SOLVER_MAX_BRACKET_STEPS:
+                if debug:
+                    print(f"\033[31m -- max slippage {max_slippage:.3%} not reachable in get_input_for_max_slippage\033[0m")
                 return 0
+            high = low
+            previous_gap = low_gap
+            low = low / 2
+            low_gap = slippage_gap(low)
+
+        input_amount, evaluations = self.find_input(slippage_gap, low, high, tolerance * self.balances[i])
 
         if debug:
             print("")
-            print(f"\033[32m Final slippage: {slippage:.3%} \033[0m")
+            print(f"\033[32m Evaluations: {evaluations} \033[0m")
             print(f"\033[33m Final input:   {input_amount:,.2f} \033[0m")
             print("")
 
@@ -0,0 +1,258 @@
+from typing import List
+
+# Exact integer math of brownie/contracts/CurveCryptoSwap2.vy (uint256 on Python ints).
+# Vyper `/` on uints is floor division, hence `//` everywhere.
+# Units are the contract ones: balances, D and prices with 18 decimals,
+# A as ANN (A * N**N * A_MULTIPLIER), gamma with 18 decimals, fees with 10 decimals.
+# Overflow reverts are not reproduced: values within the safety checks are far from 2**256.
+
+N_COINS = 2
+A_MULTIPLIER = 10000
+E18 = 10**18
+EXP_PRECISION = 10**10
+FEE_PRECISION = 10**10
+
+MIN_GAMMA = 10**10
+MAX_GAMMA = 2 * 10**16
+MIN_A = N_COINS**N_COINS * A_MULTIPLIER // 10
+MAX_A = N_COINS**N_COINS * A_MULTIPLIER * 100000
+
+MAX_X = 10**15 * E18
+MAX_ITERATIONS = 255
+
+def to_int(value, decimals=18):
+    # Floats from the simulation to contract units
+    return int(round(value * 10**decimals))
+
+def to_float(value, decimals=18):
+    return value / 10**decimals
+
+def geometric_mean(unsorted_x: List[int], sort: bool) -> int:
+    """
+    (x[0] * x[1] * ...) ** (1/N)
+    """
+    x = unsorted_x
+    if sort and x[0] < x[1]:
+        x = [unsorted_x[1], unsorted_x[0]]
+    product = x[0] * x[1]
+    D = x[0]
+    for i in range(MAX_ITERATIONS):
+        D_prev = D
+        D = (D + product // D) // N_COINS
+        diff = D - D_prev if D > D_prev else D_prev - D
+        if diff <= 1 or diff * E18 < D:
+            return D
+    raise RuntimeError("Did not converge")
+
+def newton_D(ANN: int, gamma: int, x_unsorted: List[int], with_iterations=False) -> int:
+    """
+    Finding the invariant using Newton method.
+    ANN is higher by the factor A_MULTIPLIER
+    ANN is already A * N**N
+    @param with_iterations: Return (D, number of Newton iterations)
+    """
+    # Safety checks
+    assert ANN > MIN_A - 1 and ANN < MAX_A + 1  # dev: unsafe values A
+    assert gamma > MIN_GAMMA - 1 and gamma < MAX_GAMMA + 1  # dev: unsafe values gamma
+
+    # Initial value of invariant D is that for constant-product invariant
+    x = x_unsorted
+    if x[0] < x[1]:
+        x = [x_unsorted[1], x_unsorted[0]]
+    x0, x1 = x
+
+    assert x0 > 10**9 - 1 and x0 < MAX_X + 1  # dev: unsafe values x[0]
+    assert x1 * E18 // x0 > 10**14-1  # dev: unsafe values x[i] (input)
+
+    D = N_COINS * geometric_mean(x, False)
+    S = x0 + x1
+    __g1k0 = gamma + E18
+    # Loop invariant part of K0
+    x0_K = (E18 * N_COINS**2) * x0
+
+    for i in range(MAX_ITERATIONS):
+        D_prev = D
+        assert D > 0
+
+        # collapsed for 2 coins
+        K0 = x0_K // D * x1 // D
+
+        if __g1k0 > K0:
+            _g1k0 = __g1k0 - K0 + 1  # > 0
+        else:
+            _g1k0 = K0 - __g1k0 + 1  # > 0
+
+        # D / (A * N**N) * _g1k0**2 / gamma**2
+        mul1 = E18 * D // gamma * _g1k0 // gamma * _g1k0 * A_MULTIPLIER // ANN
+
+        # 2*N*K0 / _g1k0
+        mul2 = ((2 * E18) * N_COINS) * K0 // _g1k0
+
+        neg_fprime = (S + S * mul2 // E18) + mul1 * N_COINS // K0 - mul2 * D // E18
+
+        # D -= f / fprime
+        D_plus = D * (neg_fprime + S) // neg_fprime
+        D_minus = D*D // neg_fprime
+        if E18 > K0:
+            D_minus += D * (mul1 // neg_fprime) // E18 * (E18 - K0) // K0
+        else:
+            D_minus -= D * (mul1 // neg_fprime) // E18 * (K0 - E18) // K0
+
+        if D_plus > D_minus:
+            D = D_plus - D_minus
+        else:
+            D = (D_minus - D_plus) // 2
+
+        diff = D - D_prev if D > D_prev else D_prev - D
+        if diff * 10**14 < max(10**16, D):
+            # Test that we are safe with the next newton_y
+            for _x in x:
+                frac = _x * E18 // D
+                assert (frac > 10**16 - 1) and (frac < 10**20 + 1)  # dev: unsafe values x[i]
+            if with_iterations:
+                return D, i + 1
+            return D
+
+    raise RuntimeError("Did not converge")
+
+def newton_y(ANN: int, gamma: int, x: List[int], D: int, i: int, with_iterations=False) -> int:
+    """
+    Calculating x[i] given other balances x[0..N_COINS-1] and invariant D
+    ANN = A * N**N
+    @param with_iterations: Return (y, number of Newton iterations)
+    """
+    # Safety checks
+    assert ANN > MIN_A - 1 and ANN < MAX_A + 1  # dev: unsafe values A
+    assert gamma > MIN_GAMMA - 1 and gamma < MAX_GAMMA + 1  # dev: unsafe values gamma
+    assert D > 10**17 - 1 and D < MAX_X + 1 # dev: unsafe values D
+
+    x_j = x[1 - i]
+    y = D**2 // (x_j * N_COINS**2)
+    K0_i = (E18 * N_COINS) * x_j // D
+    # frac = x_j * 1e18 / D => frac = K0_i / N_COINS
+    assert (K0_i > 10**16*N_COINS - 1) and (K0_i < 10**20*N_COINS + 1)  # dev: unsafe values x[i]
+
+    convergence_limit = max(max(x_j // 10**14, D // 10**14), 100)
+
+    __g1k0 = gamma + E18
+    # Loop invariant
+    E18_D = E18 * D
+
+    for j in range(MAX_ITERATIONS):
+        y_prev = y
+
+        K0 = K0_i * y * N_COINS // D
+        S = x_j + y
+
+        if __g1k0 > K0:
+            _g1k0 = __g1k0 - K0 + 1
+        else:
+            _g1k0 = K0 - __g1k0 + 1
+
+        # D / (A * N**N) * _g1k0**2 / gamma**2
+        mul1 = E18_D // gamma * _g1k0 // gamma * _g1k0 * A_MULTIPLIER // ANN
+
+        # 2*K0 / _g1k0
+        mul2 = (E18 + (2 * E18) * K0) // _g1k0
+
+        yfprime = E18 * y + S * mul2 + mul1
+        _dyfprime = D * mul2
+        if yfprime < _dyfprime:
+            y = y_prev // 2
+            continue
+        else:
+            yfprime -= _dyfprime
+        fprime = yfprime // y
+
+        # y -= f / f_prime;  y = (y * fprime - f) / fprime
+        y_minus = mul1 // fprime
+        y_plus = (yfprime + E18_D) // fprime + y_minus * E18 // K0
+        y_minus += E18 * S // fprime
+
+        if y_plus < y_minus:
+            y = y_prev // 2
+        else:
+            y = y_plus - y_minus
+
+        diff = y - y_prev if y > y_prev else y_prev - y
+        if diff < max(convergence_limit, y // 10**14):
+            frac = y * E18 // D
+            assert (frac > 10**16 - 1) and (frac < 10**20 + 1)  # dev: unsafe value for y
+            if with_iterations:
+                return y, j + 1
+            return y
+
+    raise RuntimeError("Did not converge")
+
+def halfpow(power: int) -> int:
+    """
+    1e18 * 0.5 ** (power/1e18)
+    """
+    intpow = power // E18
+    if intpow > 59:
+        return 0
+    otherpow = power - intpow * E18  # < 10**18
+    result = E18 // 2**intpow
+    if otherpow == 0:
+        return result
+
+    term = E18
+    S = E18
+    neg = False
+
+    for i in range(1, 256):
+        K = i * E18
+        c = K - E18
+        if otherpow > c:
+            c = otherpow - c
+            neg = not neg
+        else:
+            c = c - otherpow
+        term = term * (c // 2) // K
+        if neg:
+            S -= term
+        else:
+            S += term
+        if term < EXP_PRECISION:
+            return result * S // E18
+
+    raise RuntimeError("Did not converge")
+
+def fee(xp: List[int], mid_fee: int, out_fee: int, fee_gamma: int) -> int:
+    """
+    f = fee_gamma / (fee_gamma + (1 - K))
+    where
+    K = prod(x) / (sum(x) / N)**N
+    (all normalized to 1e18)
+    """
+    f = xp[0] + xp[1]  # sum
+    f = fee_gamma * E18 // (
+        fee_gamma + E18 - (E18 * N_COINS**N_COINS) * xp[0] // f * xp[1] // f
+    )
+    return (mid_fee * f + out_fee * (E18 - f)) // E18
+
+def get_dy(i: int, j: int, dx: int, balances: List[int], price_scale: int, D: int, A_gamma: List[int],
+           mid_fee: int, out_fee: int, fee_gamma: int, precisions: List[int] = (1, 1)) -> int:
+    """
+    get_dy of the contract for the given pool state (with A and gamma not ramping).
+    """
+    assert i != j  # dev: same input and output coin
+    assert i < N_COINS  # dev: coin index out of range
+    assert j < N_COINS  # dev: coin index out of range
+
+    price_scale = price_scale * precisions[1]
+    xp = list(balances)
+
+    xp[i] += dx
+    xp = [xp[0] * precisions[0], xp[1] * price_scale // E18]
+
+    y = newton_y(A_gamma[0], A_gamma[1], xp, D, j)
+    dy = xp[j] - y - 1
+    xp[j] = y
+    if j > 0:
+        dy = dy * E18 // price_scale
+    else:
+        dy //= precisions[0]
+    dy -= fee(xp, mid_fee, out_fee, fee_gamma) * dy // FEE_PRECISION
+
+    return dy
@@ -1,4 +1,8 @@
 class Rewards():
+    """
+    Rewards in `token` held by `account`, paid out linearly over `period`.
+    Periods and elapsed times are in days.
+    """
     def __init__(self, token, account, period):
         self.token = token
         self.account = account
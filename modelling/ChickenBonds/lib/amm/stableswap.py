@@ -2,6 +2,8 @@ import math
 import numpy as np
 from lib.amm.amm_base import *
 
+StableSwapState = namedtuple("StableSwapState", ["balance_A", "balance_B", "fee", "amplification_factor", "D"])
+
 class StableSwapPool(AmmBase):
     def __init__(self, pool_account, token_A, token_B, fee, amplification_factor):
         super().__init__(pool_account, token_A, token_B, fee)
@@ -53,6 +55,9 @@ class StableSwapPool(AmmBase):
         y = self.token_B_balance()
         return self.get_D_from_x_y(x, y)
 
+    def get_state(self):
+        return StableSwapState(self.token_A_balance(), self.token_B_balance(), self.fee, self.amplification_factor, self.D)
+
     def udpate_after_liquidity_movement(self):
             self.D = self.get_D()
 
@@ -171,18 +176,21 @@ class StableSwapPool(AmmBase):
         self.udpate_after_liquidity_movement()
         return result
 
-    def get_output_amount(self, input_balance, output_balance, input_amount, D=None):
-        if input_amount < 1e-6:
-            return 0.0
-        x = input_balance
-        y = output_balance
+    @staticmethod
+    def quote(direction, amount, state):
+        if direction == SWAP_A_FOR_B:
+            x, y = state.balance_A, state.balance_B
+        else:
+            x, y = state.balance_B, state.balance_A
+        if amount < 1e-6:
+            return 0.0, 0.0, state
+        input_amount = amount
 
-        input_amount_with_fee = input_amount * (1 - self.fee)
+        input_amount_with_fee = input_amount * (1 - state.fee)
         # let’s shorten notation for the big formula
         X = x + input_amount_with_fee
-        A = self.amplification_factor
-        if not D:
-            D = self.D
+        A = state.amplification_factor
+        D = state.D
         """
         print(" -- get_output_amount")
         b = 4*A * X**2 - (4*A-1)*D*X
@@ -219,7 +227,17 @@ class StableSwapPool(AmmBase):
         """
         assert output_amount > 0
 
-        return output_amount
+        # As in the pool, D is only updated on liquidity movements
+        x, y = x + input_amount, y - output_amount
+        if direction == SWAP_A_FOR_B:
+            new_state = state._replace(balance_A=x, balance_B=y)
+        else:
+            new_state = state._replace(balance_A=y, balance_B=x)
+        return output_amount, input_amount * state.fee, new_state
+
+    def get_output_amount(self, input_balance, output_balance, input_amount, D=None):
+        state = StableSwapState(input_balance, output_balance, self.fee, self.amplification_factor, D or self.D)
+        return self.quote(SWAP_A_FOR_B, input_amount, state)[0]
 
     def get_input_amount(self, input_token, output_token, output_amount):
         if output_amount == 0.0:
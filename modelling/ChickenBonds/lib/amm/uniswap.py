@@ -78,14 +78,28 @@ class UniswapPool(AmmBase):
         self.lp_token.mint(account, liquidity_minted)
         return
 
-    def get_output_amount(self, input_token_balance, output_token_balance, input_amount, D=None):
-        if input_amount == 0.0:
-            return 0.0
-        x = input_token_balance
-        y = output_token_balance
+    @staticmethod
+    def quote(direction, amount, state):
+        if direction == SWAP_A_FOR_B:
+            x, y = state.balance_A, state.balance_B
+        else:
+            x, y = state.balance_B, state.balance_A
+        if amount == 0.0:
+            return 0.0, 0.0, state
+
+        input_amount_with_fee = amount * (1 - state.fee)
+        output_amount = y * input_amount_with_fee / (x + input_amount_with_fee)
+        # Fees stay in the pool
+        x, y = x + amount, y - output_amount
+        if direction == SWAP_A_FOR_B:
+            new_state = state._replace(balance_A=x, balance_B=y)
+        else:
+            new_state = state._replace(balance_A=y, balance_B=x)
+        return output_amount, amount * state.fee, new_state
 
-        input_amount_with_fee = input_amount * (1 - self.fee)
-        return y * input_amount_with_fee / (x + input_amount_with_fee)
+    def get_output_amount(self, input_token_balance, output_token_balance, input_amount, D=None):
+        state = PoolState(input_token_balance, output_token_balance, self.fee)
+        return self.quote(SWAP_A_FOR_B, input_amount, state)[0]
 
     def get_input_amount(self, input_token, output_token, output_amount):
         if output_amount == 0.0:
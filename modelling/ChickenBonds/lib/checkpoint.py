@@ -0,0 +1,56 @@
+import os
+import gzip
+import pickle
+import random
+import numpy as np
+
+from lib.constants import *
+
+CHECKPOINT_VERSION = 1
+
+def get_rng_state():
+    return {"numpy": np.random.get_state(), "python": random.getstate()}
+
+def set_rng_state(rng_state):
+    np.random.set_state(rng_state["numpy"])
+    random.setstate(rng_state["python"])
+
+def snapshot(chicken, chicks, tester, controller, recorder, rng_state=None, loop_state=None, path=CHECKPOINT_FILE):
+    """
+    Save the full simulation state to a (gzipped pickle) file.
+    Everything is pickled in one go, so objects shared between the chicken,
+    its AMMs and the tester (e.g. the Token ledgers) are still shared after restore().
+    The file is written next to its destination and then renamed, so a crash
+    while saving leaves the previous checkpoint intact.
+    @param recorder: StateRecorder with the history so far
+    @param rng_state: As returned by get_rng_state() (defaults to the current one). The random streams
+                      of the simulation itself are in the tester (see TesterSimple.seed), and saved with it
+    @param loop_state: Dict with the local variables of the main loop (iteration, natural_rate...)
+    """
+    checkpoint = {
+        "version": CHECKPOINT_VERSION,
+        "chicken": chicken,
+        "chicks": chicks,
+        "tester": tester,
+        "controller": controller,
+        "recorder": recorder,
+        "rng_state": rng_state or get_rng_state(),
+        "loop_state": loop_state or {},
+    }
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wb", compresslevel=1) as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def restore(path=CHECKPOINT_FILE, set_rng=True):
+    """
+    Load a checkpoint saved by snapshot().
+    @param set_rng: Whether to also reset the global random generators to the saved state
+    @return: Dict with chicken, chicks, tester, controller, recorder, rng_state and loop_state
+    """
+    with gzip.open(path, "rb") as f:
+        checkpoint = pickle.load(f)
+    assert checkpoint["version"] == CHECKPOINT_VERSION, f"Unsupported checkpoint version: {checkpoint['version']}"
+    if set_rng:
+        set_rng_state(checkpoint["rng_state"])
+    return checkpoint
@@ -1,6 +1,11 @@
+import itertools
+
 from lib.amm.uniswap import *
 from lib.amm.curvev2 import *
 
+# Source of Chicken.simulation_id, unique per Chicken created in the process
+SIMULATION_IDS = itertools.count()
+
 class Chicken():
     def __init__(
             self,
@@ -19,8 +24,14 @@ class Chicken():
             adjustment_step,
             admin_fee,
             ma_half_time,
-            initial_price
+            initial_price,
+            math_mode=CURVE_V2_MATH,
+            warm_start=CURVE_V2_WARM_START
     ):
+        # Identifies the simulation in metric caches (see TesterSimple.get_metric_cache_key).
+        # Unlike id(self), it isn’t reused once the chicken is freed, and it survives pickling.
+        self.simulation_id = next(SIMULATION_IDS)
+
         self.coll_token = coll_token
         self.token = token
         self.btkn = btkn
@@ -46,7 +57,9 @@ class Chicken():
             adjustment_step,
             admin_fee,
             ma_half_time,
-            initial_price
+            initial_price,
+            math_mode,
+            warm_start
         )
 
         self.amm_iteration_apr = 0.0
@@ -56,6 +69,10 @@ class Chicken():
 
         return
 
+    def get_tokens(self):
+        # All the ledgers of the system, including the LP tokens of its pools
+        return [self.coll_token, self.token, self.btkn, self.amm.lp_token, self.btkn_amm.lp_token]
+
     def pending_token_balance(self):
         return self.token.balance_of(self.pending_account)
 
@@ -0,0 +1,142 @@
+import dataclasses
+from dataclasses import dataclass
+from typing import Tuple
+
+from lib.constants import *
+
+def get_initial_accrual_param(target_average_age, chicken_in_amm_fee, initial_btkn_price):
+    # alpha = T * [(1-fee)*lambda - 1] / [1 + ((1-fee)*lambda)^0.5]
+    reduced_price = (1 - chicken_in_amm_fee) * initial_btkn_price
+    return target_average_age * (reduced_price - 1) / (1 + reduced_price ** 0.5)
+
+@dataclass(frozen=True)
+class SimConfig():
+    """
+    Immutable (and hashable) set of simulation parameters.
+    Defaults are the values in lib/constants.py; see there for their meaning.
+    Fields in DERIVED_FIELDS left as None are computed from the rest; the ones given
+    explicitly are kept by replace().
+    """
+    # Iterations and time units
+    time_units_per_year: int = TIME_UNITS_PER_YEAR
+    iterations: int = ITERATIONS
+    step_seconds: int = STEP_SECONDS
+    yield_period: int = YIELD_PERIOD
+    time_engine: str = TIME_ENGINE
+    rng: str = RNG
+    rng_seed: int = RNG_SEED
+
+    # User and money
+    num_chicks: int = NUM_CHICKS
+    num_rebonders: int = NUM_REBONDERS
+    num_lps: int = NUM_LPS
+    num_sellers: int = NUM_SELLERS
+    num_traders: int = None
+    initial_amount: float = INITIAL_AMOUNT
+    token_ledger: str = TOKEN_LEDGER
+
+    # Bonding
+    external_yield: float = EXTERNAL_YIELD
+    bond_amount: Tuple[int, int] = BOND_AMOUNT
+
+    # Bootstrap
+    bootstrap_period_chicken_in: int = BOOTSTRAP_PERIOD_CHICKEN_IN
+    bootstrap_period_redeem: int = BOOTSTRAP_PERIOD_REDEEM
+    bootstrap_num_bonds: int = BOOTSTRAP_NUM_BONDS
+
+    chicken_in_amm_fee: float = CHICKEN_IN_AMM_FEE
+
+    # AMM
+    amm_apr_period: int = AMM_APR_PERIOD
+    amm_fee: float = AMM_FEE
+    max_slippage: float = MAX_SLIPPAGE
+    amm_yield: float = AMM_YIELD
+    rewards_period: int = REWARDS_PERIOD
+    initial_btkn_price: float = INITIAL_BTKN_PRICE
+
+    # Curve V2
+    curve_v2_a: float = CURVE_V2_A
+    curve_v2_gamma: float = CURVE_V2_GAMMA
+    curve_v2_mid_fee: float = CURVE_V2_MID_FEE
+    curve_v2_out_fee: float = CURVE_V2_OUT_FEE
+    curve_v2_allowed_extra_profit: float = CURVE_V2_ALLOWED_EXTRA_PROFIT
+    curve_v2_fee_gamma: float = CURVE_V2_FEE_GAMMA
+    curve_v2_adjustment_step: float = CURVE_V2_ADJUSTMENT_STEP
+    curve_v2_admin_fee: float = CURVE_V2_ADMIN_FEE
+    curve_v2_ma_half_time: float = CURVE_V2_MA_HALF_TIME
+    curve_v2_initial_price: float = None
+    curve_v2_math: str = CURVE_V2_MATH
+    curve_v2_warm_start: bool = CURVE_V2_WARM_START
+
+    fraction_to_swap: float = FRACTION_TO_SWAP
+
+    # Controller
+    accrual_adjustment_rate: float = ACCRUAL_ADJUSTMENT_RATE
+    target_average_age: float = TARGET_AVERAGE_AGE
+    initial_accrual_param: float = None
+
+    # Chicken
+    chicken_in_gamma: Tuple[float, float] = CHICKEN_IN_GAMMA
+    chicken_out_probability: float = CHICKEN_OUT_PROBABILITY
+    chicken_in_liquidity_factor: float = CHICKEN_IN_LIQUIDITY_FACTOR
+
+    # Buy bTKN
+    buy_premium_percentage_mean: float = BUY_PREMIUM_PERCENTAGE_MEAN
+    buy_premium_percentage_sd: float = BUY_PREMIUM_PERCENTAGE_SD
+    buy_price_cap: float = None
+
+    # Natural rates
+    initial_natural_rate: float = INITIAL_NATURAL_RATE
+    sd_natural_rate: float = SD_NATURAL_RATE
+
+    # Price
+    price_premium: str = PRICE_PREMIUM
+    premium_mu: float = PREMIUM_MU
+    premium_sigma: float = PREMIUM_SIGMA
+    price_volatility: str = PRICE_VOLATILITY
+    vola_mu: float = VOLA_MU
+    vola_sigma: float = VOLA_SIGMA
+    twap_period: int = TWAP_PERIOD
+
+    DERIVED_FIELDS = ("num_traders", "curve_v2_initial_price", "initial_accrual_param", "buy_price_cap")
+
+    def __post_init__(self):
+        # Frozen dataclass, so derived values have to bypass __setattr__
+        def derive(name, value):
+            if getattr(self, name) is None:
+                object.__setattr__(self, name, value)
+
+        # Plain attribute, not a field: it is left out of comparisons, hashes and asdict()
+        object.__setattr__(self, "explicit_fields", frozenset(
+            name for name in self.DERIVED_FIELDS if getattr(self, name) is not None
+        ))
+        derive("num_traders", self.num_chicks - (self.num_rebonders + self.num_lps + self.num_sellers))
+        derive("curve_v2_initial_price", self.initial_btkn_price)
+        derive("initial_accrual_param", get_initial_accrual_param(
+            self.target_average_age,
+            self.chicken_in_amm_fee,
+            self.initial_btkn_price
+        ))
+        derive("buy_price_cap", self.initial_btkn_price * 2)
+        assert self.num_traders >= 0
+        assert self.yield_period % self.step_seconds == 0, "Yield period must be a multiple of the step"
+        assert self.rng in ["legacy", "generator"], f"Unknown random streams: {self.rng}"
+
+    # Time base: iterations are step_seconds long, while yields and APRs are annual,
+    # and time_units_per_year is in days
+    def get_step_days(self):
+        return self.step_seconds / SECONDS_PER_DAY
+
+    def get_steps_per_year(self):
+        return self.time_units_per_year * SECONDS_PER_DAY / self.step_seconds
+
+    def get_yield_steps(self):
+        # Iterations per yield accrual
+        return self.yield_period // self.step_seconds
+
+    def replace(self, **changes):
+        # Derived values are recomputed, unless explicitly given (here or when this config was made)
+        for name in self.DERIVED_FIELDS:
+            if name not in self.explicit_fields:
+                changes.setdefault(name, None)
+        return dataclasses.replace(self, **changes)
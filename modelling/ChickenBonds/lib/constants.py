@@ -1,9 +1,20 @@
+# Default values for the simulation parameters. Runs read them through lib.config.SimConfig,
+# so different sets of parameters can be used in the same process.
+
 # ------------ ITERATIONS AND TIME UNITS -----------------
 TIME_UNITS_PER_YEAR = 360
 MONTH = int(TIME_UNITS_PER_YEAR / 12)   # Months per year
 YEAR = TIME_UNITS_PER_YEAR              # Days per year
+SECONDS_PER_DAY = 86400
+STEP_SECONDS = SECONDS_PER_DAY          # Length of an iteration in seconds (e.g. 3600 for hourly steps). Periods counted in iterations
+                                        # (bootstraps, TWAP and APR windows, bond ages) are not rescaled with it
+YIELD_PERIOD = SECONDS_PER_DAY          # Yield and AMM rewards accrue once every that many seconds (a multiple of STEP_SECONDS), for the whole period
 ITERATIONS = TIME_UNITS_PER_YEAR * 4    # Total iterations steps in days
 #ITERATIONS = 360
+TIME_ENGINE = "loop"                    # Main loop: "loop" (fixed daily steps), or "events" (discrete-event scheduler, see lib/events.py)
+RNG = "legacy"                          # Random streams of a simulation (see TesterSimple.seed): "legacy" (same numbers as the former global seeds),
+                                        # or "generator" (numpy Generators spawned from RNG_SEED, per replica, phase and iteration)
+RNG_SEED = 0                            # Root entropy of the "generator" streams
 
 # ------------ Plots -----------------
 PLOTS_SHOW = True                       # Whether to open browser tabs to show plots
@@ -12,8 +23,24 @@ PLOTS_SAVE = False                      # Whether to save plots in images/ folde
 PLOTS_PREFIX = '001'                    # Prefix for plot files in case of saving
 PLOTS_INTERVAL = [0, 0]                 # [0, 0] will plot’em all
 
+# ------------ Ensemble -----------------
+ENSEMBLE_RUNS = 64                      # Number of Monte Carlo replicas in run_ensemble
+ENSEMBLE_VARIABLES = ["btkn_price", "backing_ratio", "avg_age", "bonding_apr", "btkn_apr", "amm_iteration_apr"]
+ENSEMBLE_PERCENTILES = [5, 25, 50, 75, 95]
+
+# ------------ Sweeps -----------------
+SWEEP_CACHE_DIR = "sweeps"              # One summary file per simulated config, see lib/sweep.py
+SWEEP_POINTS = 32                       # Number of points in random designs
+
+# ------------ Checkpoints -----------------
+CHECKPOINT_INTERVAL = 0                 # Save the full simulation state every that many iterations (0: never)
+CHECKPOINT_FILE = "checkpoint.pkl"      # Where simulate() saves and resumes from
+
 # ------------ Logs -----------------
 LOG_LEVEL = 0                           # To display logs in console (for now only 0: off, and 1: on)
+PROFILE = False                         # Print time per phase of the main loop and calls of hot primitives at the end
+JOURNAL_DIR = None                      # If set, every mint, burn and transfer is logged to that directory (see lib/journal.py)
+JOURNAL_CHUNK_SIZE = 2**16              # Events per chunk file of the journal
 
 # ------------- User and Money --------------------
 NUM_CHICKS =   100
@@ -23,6 +50,7 @@ NUM_SELLERS =   25     # Number of users that will sell upon chickening in
 #NUM_TRADERS           # Number of users that will only trade (never bond)
 NUM_TRADERS =   NUM_CHICKS - (NUM_REBONDERS + NUM_LPS + NUM_SELLERS)
 INITIAL_AMOUNT = 10000
+TOKEN_LEDGER = "dict"   # Token balances: "dict" (one per token), or "array" (shared NumPy matrix, see erc_token.Ledger)
 
 # -------------- Bonding Parameters ----------------
 EXTERNAL_YIELD = 0.10 # 10%             # Yield received from staking the total reserves per year.
@@ -40,7 +68,7 @@ AMM_APR_PERIOD = 10                     # number of iterations to take the avera
 AMM_FEE = 0.2 / 100                     # ToDo
 MAX_SLIPPAGE = 0.10                     # ToDo
 AMM_YIELD = 0.02                        # ToDo: remove and use real fees!
-REWARDS_PERIOD = 7                      # Time to distribute current rewards
+REWARDS_PERIOD = 7                      # Time to distribute current rewards, in days
 INITIAL_BTKN_PRICE = 1.5                # Initial price the first user to chicken in and LP to AMM will use
 #INITIAL_BTKN_PRICE = 1.2 * (BOOTSTRAP_PERIOD_CHICKEN_IN + INITIAL_ACCRUAL_PARAM) / BOOTSTRAP_PERIOD_CHICKEN_IN
 
@@ -70,6 +98,10 @@ CURVE_V2_ADMIN_FEE = 5000000000 / 10**18
 CURVE_V2_MA_HALF_TIME = 25
 CURVE_V2_INITIAL_PRICE = INITIAL_BTKN_PRICE
 #"""
+# CURVE_V2_MA_HALF_TIME is in seconds, like block timestamps (see STEP_SECONDS)
+CURVE_V2_MATH = "float"                 # Invariant solvers: "float" (fast), or "int" (exact contract arithmetic for the solvers only, see CurveV2Pool)
+CURVE_V2_WARM_START = False             # Start float Newton solves from the previous solution (fewer iterations, but they stop at a different
+                                        # point within the tolerance, so the simulation drifts from cold starts, see SolverCache)
 
 FRACTION_TO_SWAP = 0.1 # 10%            # Fraction of token funds in pool to use for slippage measures
 
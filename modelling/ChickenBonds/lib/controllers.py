@@ -7,3 +7,10 @@ class AsymmetricController():
         if (error < 0):
             self.output *= (1 - self.adjustment_rate)
         return self.output
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            adjustment_rate=config.accrual_adjustment_rate,
+            init_output=config.initial_accrual_param
+        )
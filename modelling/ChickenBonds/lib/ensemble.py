@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from lib.constants import *
+
+class EnsembleRecorder():
+    """
+    Columnar store for the results of an ensemble of runs: one
+    (runs x iterations) array per variable. Runs that stop early are
+    left padded with NaN, and ignored by the percentiles from then on.
+    """
+    def __init__(self, n_runs, iterations=ITERATIONS, variables=ENSEMBLE_VARIABLES):
+        self.n_runs = n_runs
+        self.iterations = iterations
+        self.variables = list(variables)
+        self.values = {variable: np.full((n_runs, iterations), np.nan) for variable in self.variables}
+        self.completed = 0
+
+    def record(self, run_id, columns):
+        for variable in self.variables:
+            run_values = columns[variable]
+            self.values[variable][run_id, :len(run_values)] = run_values
+        self.completed = self.completed + 1
+
+    def get_percentiles(self, variable, percentiles=ENSEMBLE_PERCENTILES):
+        values = self.values[variable]
+        # iterations no run reached would only produce all-NaN warnings
+        reached = (~np.isnan(values)).any(axis=0).sum()
+        result = np.nanpercentile(values[:, :reached], percentiles, axis=0)
+        return pd.DataFrame(result.T, columns=[f"p{p}" for p in percentiles])
+
+    def get_dataframe(self, percentiles=ENSEMBLE_PERCENTILES):
+        return pd.concat(
+            {variable: self.get_percentiles(variable, percentiles) for variable in self.variables},
+            axis=1
+        )
@@ -1,23 +1,55 @@
+import types
+import numpy as np
+from collections import ChainMap
+
+# Journal operations, see lib/journal.py
+MINT = 0
+BURN = 1
+TRANSFER = 2
+
+# Initial size of Ledger matrices, which double when full
+LEDGER_INITIAL_TOKENS = 4
+LEDGER_INITIAL_ACCOUNTS = 256
+
 class Token():
     def __init__(self, symbol):
         self.symbol = symbol
         self.total_supply = 0.0
         self.balances = {}
+        self.overlay_supplies = []
+        # Increased on every change of balances or supply, so values derived from the ledger
+        # can be cached until it changes (see TesterSimple.memoize)
+        self.version = 0
+        # Event log, see lib/journal.py
+        self.journal = None
+        self.journal_id = None
+        # Sets of holders to keep up to date, see AgentPopulation.get_holders
+        self.holder_indexes = []
 
     def __str__(self):
         return f"Token {self.symbol}. Total supply: {self.total_supply}"
 
+    def new_token(self, symbol):
+        # Token of the same kind, e.g. for LP tokens of pools
+        return Token(symbol)
+
     def mint(self, account, amount):
         #print(f"amount: {amount:,.2f}")
         #print(f"bal:    {self.balances.get(account, 0.0):,.2f}")
         #print(f"total:  {self.total_supply:,.2f}")
+        self.version += 1
         self.total_supply = self.total_supply + amount
         self.balances[account] = self.balances.get(account, 0.0) + amount
+        if self.journal is not None and not self.overlay_supplies:
+            self.journal.record(self.journal_id, MINT, None, account, amount)
+        if self.holder_indexes and not self.overlay_supplies:
+            self.update_holders(account)
         #print(f"bal:    {self.balances[account]:,.2f}")
         #print(f"total:  {self.total_supply:,.2f}")
         #assert self.total_supply >= self.balances[account]
 
     def burn(self, account, amount):
+        self.version += 1
         try:
             self.total_supply = self.total_supply - amount
             self.balances[account] = self.balances.get(account, 0.0) - amount
@@ -32,8 +64,13 @@ class Token():
             print(f"supply: {self.total_supply:,}")
             print(f"bal:    {self.balances[account]:,}")
             raise RuntimeError('Negative balance!')
+        if self.journal is not None and not self.overlay_supplies:
+            self.journal.record(self.journal_id, BURN, account, None, amount)
+        if self.holder_indexes and not self.overlay_supplies:
+            self.update_holders(account)
 
     def transfer(self, sender, recipient, amount):
+        self.version += 1
         try:
             self.balances[recipient] = self.balances.get(recipient, 0.0) + amount
             self.balances[sender] = self.balances.get(sender, 0.0) - amount
@@ -47,6 +84,257 @@ class Token():
             print(f"bal b4: {self.balances[sender] + amount:,}")
             print(f"bal:    {self.balances[sender]:,}")
             raise RuntimeError('Negative balance!')
+        if self.journal is not None and not self.overlay_supplies:
+            self.journal.record(self.journal_id, TRANSFER, sender, recipient, amount)
+        if self.holder_indexes and not self.overlay_supplies:
+            self.update_holders(sender)
+            self.update_holders(recipient)
 
     def balance_of(self, account):
         return self.balances.get(account, 0.0)
+
+    def balances_of(self, accounts):
+        balances = self.balances
+        return np.array([balances.get(account, 0.0) for account in accounts])
+
+    # Changes inside overlays are discarded, so they are left out of holder sets
+    def update_holders(self, account):
+        balance = self.balance_of(account)
+        for holder_index in self.holder_indexes:
+            holder_index.update(account, balance)
+
+    # What-if changes: between begin_overlay and end_overlay balance writes go to a new dict
+    # on top of the committed ones (reads fall through to them), and are discarded at the end.
+    # Overlays can be nested. See AmmBase.overlay.
+    def begin_overlay(self):
+        self.balances = ChainMap({}, self.balances)
+        self.overlay_supplies.append(self.total_supply)
+
+    def end_overlay(self):
+        # The version isn’t restored: it keeps increasing, as the ledger changes back
+        self.version += 1
+        self.balances = self.balances.maps[1]
+        self.total_supply = self.overlay_supplies.pop()
+
+class Ledger():
+    """
+    Balances of a set of tokens, in a (tokens x accounts) float64 matrix, so that a large
+    number of agents takes little memory and balances can be updated in batches.
+    Account names are interned to dense integer IDs, shared by all the tokens of the ledger.
+    Methods of LedgerToken take either names or IDs (ints, or arrays of them).
+    """
+    def __init__(self, num_tokens=LEDGER_INITIAL_TOKENS, num_accounts=LEDGER_INITIAL_ACCOUNTS):
+        self.balances = np.zeros((num_tokens, num_accounts))
+        self.num_tokens = 0
+        self.accounts = []
+        self.account_ids = {}
+
+    def new_token(self, symbol):
+        return LedgerToken(symbol, self)
+
+    def add_token(self):
+        if self.num_tokens == self.balances.shape[0]:
+            self.grow(2 * self.balances.shape[0], self.balances.shape[1])
+        self.num_tokens += 1
+        return self.num_tokens - 1
+
+    def grow(self, num_tokens, num_accounts):
+        balances = np.zeros((num_tokens, num_accounts))
+        balances[:self.balances.shape[0], :self.balances.shape[1]] = self.balances
+        self.balances = balances
+
+    def get_account_id(self, account):
+        """
+        ID of an account, added to the ledger if it’s new.
+        @param account: Name, or already an ID
+        """
+        if isinstance(account, (int, np.integer)):
+            assert 0 <= account < len(self.accounts), f"Unknown account ID {account}"
+            return account
+        account_id = self.account_ids.get(account)
+        if account_id is None:
+            account_id = len(self.accounts)
+            if account_id == self.balances.shape[1]:
+                self.grow(self.balances.shape[0], 2 * self.balances.shape[1])
+            self.accounts.append(account)
+            self.account_ids[account] = account_id
+        return account_id
+
+    def get_account_ids(self, accounts):
+        if isinstance(accounts, np.ndarray) and accounts.dtype.kind in "iu":
+            return accounts
+        if isinstance(accounts, str):
+            return np.array([self.get_account_id(accounts)])
+        return np.array([self.get_account_id(account) for account in accounts], dtype=np.int64)
+
+class LedgerToken():
+    """
+    Token with the same interface as Token, with balances in a row of a Ledger,
+    plus batch_mint and batch_transfer to move many balances at once.
+    """
+    def __init__(self, symbol, ledger=None):
+        self.symbol = symbol
+        self.ledger = ledger or Ledger()
+        self.row = self.ledger.add_token()
+        self.total_supply = 0.0
+        self.overlay_supplies = []
+        # Balances before the first write in each overlay, by account ID
+        self.overlay_undo = []
+        self.version = 0
+        self.journal = None
+        self.journal_id = None
+        self.holder_indexes = []
+
+    def __str__(self):
+        return f"Token {self.symbol}. Total supply: {self.total_supply}"
+
+    def new_token(self, symbol):
+        return LedgerToken(symbol, self.ledger)
+
+    @property
+    def balances(self):
+        # Non zero balances by account name, like Token.balances (for debugging).
+        # It’s a read-only snapshot: balances can only be changed through the ledger.
+        row = self.ledger.balances[self.row]
+        return types.MappingProxyType({account: float(row[i]) for i, account in enumerate(self.ledger.accounts) if row[i] != 0})
+
+    def save_for_overlay(self, account_ids):
+        if not self.overlay_undo:
+            return
+        undo = self.overlay_undo[-1]
+        row = self.ledger.balances[self.row]
+        for account_id in np.atleast_1d(account_ids).tolist():
+            if account_id not in undo:
+                undo[account_id] = row[account_id]
+
+    def set_balance(self, account_id, balance):
+        if self.overlay_undo:
+            self.save_for_overlay(account_id)
+        self.ledger.balances[self.row, account_id] = balance
+        if self.holder_indexes and not self.overlay_undo:
+            self.update_holders([account_id])
+
+    def update_holders(self, account_ids):
+        accounts = self.ledger.accounts
+        row = self.ledger.balances[self.row]
+        for account_id in account_ids:
+            for holder_index in self.holder_indexes:
+                holder_index.update(accounts[account_id], row[account_id])
+
+    def mint(self, account, amount):
+        self.version += 1
+        account_id = self.ledger.get_account_id(account)
+        self.total_supply = self.total_supply + amount
+        self.set_balance(account_id, self.ledger.balances[self.row, account_id] + amount)
+        if self.journal is not None and not self.overlay_undo:
+            self.journal.record(self.journal_id, MINT, None, self.ledger.accounts[account_id], amount)
+
+    def burn(self, account, amount):
+        self.version += 1
+        account_id = self.ledger.get_account_id(account)
+        self.total_supply = self.total_supply - amount
+        balance = self.ledger.balances[self.row, account_id] - amount
+        self.set_balance(account_id, balance)
+        # TODO: rounding issues
+        if self.total_supply < 0.0 or balance < 0.0:
+            print(f"{self.symbol} token burn from {account}")
+            print(f"amount: {amount:,}")
+            print(f"supply: {self.total_supply:,}")
+            print(f"bal:    {balance:,}")
+            raise RuntimeError('Negative balance!')
+        if self.journal is not None and not self.overlay_undo:
+            self.journal.record(self.journal_id, BURN, self.ledger.accounts[account_id], None, amount)
+
+    def transfer(self, sender, recipient, amount):
+        self.version += 1
+        recipient_id = self.ledger.get_account_id(recipient)
+        sender_id = self.ledger.get_account_id(sender)
+        balances = self.ledger.balances
+        self.set_balance(recipient_id, balances[self.row, recipient_id] + amount)
+        balance = balances[self.row, sender_id] - amount
+        self.set_balance(sender_id, balance)
+        # Balance of pools can turn into tiny negative value thanks to floating point arithmetic (see Token.transfer)
+        if balance < -1e-9:
+            print(f"{self.symbol} token transfer from {sender} to {recipient}")
+            print(f"amount: {amount:,}")
+            print(f"bal b4: {balance + amount:,}")
+            print(f"bal:    {balance:,}")
+            raise RuntimeError('Negative balance!')
+        if self.journal is not None and not self.overlay_undo:
+            self.journal.record(self.journal_id, TRANSFER, self.ledger.accounts[sender_id], self.ledger.accounts[recipient_id], amount)
+
+    def balance_of(self, account):
+        if isinstance(account, (int, np.integer)):
+            return float(self.ledger.balances[self.row, account])
+        account_id = self.ledger.account_ids.get(account)
+        if account_id is None:
+            return 0.0
+        return float(self.ledger.balances[self.row, account_id])
+
+    def balances_of(self, accounts):
+        return self.ledger.balances[self.row, self.ledger.get_account_ids(accounts)]
+
+    def batch_mint(self, accounts, amounts):
+        """
+        Vectorized mint. Repeated accounts get the sum of their amounts.
+        @param accounts: Names or IDs
+        @param amounts: One per account, or a single one for all of them
+        """
+        self.version += 1
+        account_ids = self.ledger.get_account_ids(accounts)
+        account_ids, amounts = np.broadcast_arrays(account_ids, np.asarray(amounts, dtype=float))
+        self.save_for_overlay(account_ids)
+        np.add.at(self.ledger.balances[self.row], account_ids, amounts)
+        self.total_supply = self.total_supply + float(amounts.sum())
+        if self.holder_indexes and not self.overlay_undo:
+            self.update_holders(account_ids.tolist())
+        if self.journal is not None and not self.overlay_undo:
+            accounts = self.ledger.accounts
+            self.journal.record_batch(self.journal_id, MINT, [None] * len(amounts), [accounts[i] for i in account_ids], amounts)
+
+    def batch_transfer(self, senders, recipients, amounts):
+        """
+        Vectorized transfer: senders[k] sends amounts[k] to recipients[k].
+        It’s all or nothing: if any sender would end up with a negative balance, nothing is moved.
+        @param senders: Names or IDs, or a single one for all the transfers
+        @param recipients: Names or IDs, or a single one for all the transfers
+        @param amounts: One per transfer, or a single one for all of them
+        """
+        sender_ids = self.ledger.get_account_ids(senders)
+        recipient_ids = self.ledger.get_account_ids(recipients)
+        sender_ids, recipient_ids, amounts = np.broadcast_arrays(sender_ids, recipient_ids, np.asarray(amounts, dtype=float))
+        num_transfers = len(amounts)
+
+        # Net the transfers on a copy of the touched balances, and only write them back if they are all fine
+        account_ids, positions = np.unique(np.concatenate([sender_ids, recipient_ids]), return_inverse=True)
+        row = self.ledger.balances[self.row]
+        balances = row[account_ids]
+        np.subtract.at(balances, positions[:num_transfers], amounts)
+        np.add.at(balances, positions[num_transfers:], amounts)
+        if (balances[positions[:num_transfers]] < -1e-9).any():
+            print(f"{self.symbol} batch transfer of {num_transfers} amounts")
+            raise RuntimeError('Negative balance!')
+
+        self.version += 1
+        self.save_for_overlay(account_ids)
+        row[account_ids] = balances
+        if self.holder_indexes and not self.overlay_undo:
+            self.update_holders(account_ids.tolist())
+        if self.journal is not None and not self.overlay_undo:
+            accounts = self.ledger.accounts
+            self.journal.record_batch(
+                self.journal_id, TRANSFER, [accounts[i] for i in sender_ids], [accounts[i] for i in recipient_ids], amounts
+            )
+
+    # What-if changes, as in Token: writes inside an overlay save the previous balances first,
+    # and they are put back by end_overlay.
+    def begin_overlay(self):
+        self.overlay_undo.append({})
+        self.overlay_supplies.append(self.total_supply)
+
+    def end_overlay(self):
+        self.version += 1
+        row = self.ledger.balances[self.row]
+        for account_id, balance in self.overlay_undo.pop().items():
+            row[account_id] = balance
+        self.total_supply = self.overlay_supplies.pop()
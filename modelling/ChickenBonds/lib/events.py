@@ -0,0 +1,261 @@
+import heapq
+import itertools
+
+from lib.constants import *
+from lib.utils import *
+from lib.log import *
+from lib.state import *
+from lib.checkpoint import *
+from lib.profiler import NullProfiler
+
+# Events of a simulated day, by priority: the phases of the daily loop (see run_iterations in
+# chicken_bonds.py), in the same order
+DAILY_EVENTS = [
+    "amm_apr",
+    "distribute_yield",
+    "bond",
+    "update_chicken",
+    "arbitrage_btkn",
+    "buy_btkn",
+    "sell_btkn",
+    "controller",
+    "log_state",
+    "state_to_row",
+    "checks",
+]
+
+class EventEngine():
+    """
+    Discrete-event scheduler: handlers are called in time order, only when their events are due,
+    instead of every step of a fixed loop.
+    Time is in iterations (see STEP_SECONDS), and can be fractional. Events at the same time run by priority
+    (lowest first), then in the order they were scheduled. Handlers can schedule more events,
+    at the current time or later.
+    On every advance of time, clock(time) is called (e.g. to set the block timestamp of the AMMs).
+    The time of each event is charged to its phase in the profiler (see lib/profiler.py).
+    """
+    def __init__(self, clock=None, profiler=None):
+        self.queue = []
+        self.counter = itertools.count()
+        self.time = None
+        self.clock = clock
+        self.profiler = profiler or NullProfiler()
+        self.stopped = False
+        self.event_count = 0
+
+    def __len__(self):
+        return len(self.queue)
+
+    def schedule(self, time, priority, phase, handler, *args):
+        """
+        @param phase: Name to profile the handler under (None to leave it out of the profile)
+        @param handler: Called as handler(time, *args)
+        """
+        assert self.time is None or time >= self.time, f"Event in the past: {time} < {self.time}"
+        heapq.heappush(self.queue, (time, priority, next(self.counter), phase, handler, args))
+
+    def get_next_time(self):
+        if not self.queue:
+            return None
+        return self.queue[0][0]
+
+    def stop(self):
+        """
+        Stop running after the current event. Pending events are kept.
+        """
+        self.stopped = True
+
+    def run(self, end):
+        """
+        Run events until there are none left, stop() is called, or the next one is at or after end.
+        @return: Time of the last event run
+        """
+        self.stopped = False
+        while self.queue and not self.stopped and self.queue[0][0] < end:
+            time, _, _, phase, handler, args = heapq.heappop(self.queue)
+            if time != self.time:
+                self.time = time
+                if self.clock is not None:
+                    self.clock(time)
+            handler(time, *args)
+            self.event_count += 1
+            if phase is not None:
+                self.profiler.lap(phase)
+
+        return self.time
+
+class SimulationEvents():
+    """
+    The main loop of a simulation (see init_simulation in chicken_bonds.py) as events of an EventEngine,
+    driving the same tester, Chicken and AMM primitives.
+    Only genuinely periodic phases are on a fixed cadence: the day start (amm_apr) every iteration,
+    which schedules the controller and the recording of the row, and distribute_yield every yield period
+    (see get_yield_steps). The phases of the agents are scheduled, one after the other, only when due:
+    - bond, when some chicks are available for bonding (see is_bond_due),
+    - update_chicken, split into its chicken outs, while there are bonds, and its chicken ins, when
+      the oldest bond of the bond calendar is old enough (see is_chicken_in_time),
+    - arbitrage_btkn, when its trigger holds (see is_arbitrage_triggered),
+    - buy_btkn and sell_btkn, once there is bTKN.
+    When bond or update_chicken are not due, only their start (the seed of their stream, and the
+    shuffle of the chicks) is done, as the next phases go on from them. So with only these events,
+    results are the same as with the loop.
+    More events can be added with engine.schedule, at any time, e.g. intraday trades: they run in
+    between days (time is fractional, and the block timestamp follows it), and their effects show in
+    the next recorded row.
+    """
+    def __init__(self, sim, log_level=LOG_LEVEL, checkpoint_interval=CHECKPOINT_INTERVAL, checkpoint_file=CHECKPOINT_FILE, profiler=None):
+        self.sim = sim
+        self.chicken = sim["chicken"]
+        self.chicks = sim["chicks"]
+        self.tester = sim["tester"]
+        self.config = self.tester.config
+        self.log_level = log_level
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_file = checkpoint_file
+        self.profiler = profiler or NullProfiler()
+        self.engine = EventEngine(self.chicken.btkn_amm.set_block_timestamp, self.profiler)
+        self.priorities = {phase: priority for priority, phase in enumerate(DAILY_EVENTS)}
+        for phase in DAILY_EVENTS:
+            self.profiler.add_phase(phase)
+        # Values carried between the events of a day
+        self.avg_age = 0
+        start = sim["loop_state"]["iteration"] + 1
+        self.schedule_day(start)
+        yield_steps = self.config.get_yield_steps()
+        self.schedule_yield(-(-start // yield_steps) * yield_steps)
+
+    def schedule(self, iteration, phase, handler):
+        self.engine.schedule(iteration, self.priorities[phase], phase, handler)
+
+    def schedule_day(self, iteration):
+        self.schedule(iteration, "amm_apr", self.start_day)
+
+    def schedule_yield(self, iteration):
+        self.next_yield = iteration
+        self.schedule(iteration, "distribute_yield", self.distribute_yield)
+
+    def run(self, end=None):
+        """
+        Run days until end (excluded, defaults to config.iterations), or a stop condition.
+        """
+        if end is None:
+            end = self.config.iterations
+        self.engine.run(end)
+        return self.sim
+
+    def start_day(self, time):
+        iteration = int(time)
+        loop_state = self.sim["loop_state"]
+        self.profiler.start_iteration(iteration)
+
+        loop_state["natural_rate"] = self.tester.get_natural_rate(loop_state["natural_rate"], iteration)
+        self.chicken.amm_iteration_apr, loop_state["accrued_fees_A"], loop_state["accrued_fees_B"], loop_state["accrued_fees_LP"] = get_amm_iteration_apr(
+            self.chicken.btkn_amm, loop_state["accrued_fees_A"], loop_state["accrued_fees_B"], loop_state["accrued_fees_LP"], self.config
+        )
+        self.chicken.amm_average_apr = get_amm_average_apr(self.sim["recorder"], iteration, self.config)
+
+        self.schedule(iteration, "controller", self.update_controller)
+        self.schedule(iteration, "log_state", self.log_state)
+        self.schedule(iteration, "state_to_row", self.record)
+        self.schedule(iteration, "checks", self.end_day)
+        self.schedule_day(iteration + 1)
+        # Otherwise the yield can make chicks available for bonding, so agents start after it
+        if self.next_yield != iteration:
+            self.schedule_bond(iteration)
+
+    def distribute_yield(self, time):
+        iteration = int(time)
+        self.tester.distribute_yield(self.chicken, self.chicks, iteration)
+        self.schedule_yield(iteration + self.config.get_yield_steps())
+        self.schedule_bond(iteration)
+
+    # Each phase of the agents schedules the next one, as whether it's due depends on what the
+    # previous ones did
+    def schedule_bond(self, iteration):
+        if self.tester.is_bond_due(self.chicken, self.chicks):
+            self.schedule(iteration, "bond", self.bond)
+        else:
+            self.tester.start_bond(self.chicks, iteration)
+            self.schedule_update_chicken(iteration)
+
+    def bond(self, time):
+        iteration = int(time)
+        self.tester.bond(self.chicken, self.chicks, iteration)
+        self.schedule_update_chicken(iteration)
+
+    def schedule_update_chicken(self, iteration):
+        if self.chicks.bonded:
+            self.schedule(iteration, "update_chicken", self.chicken_out)
+        else:
+            self.tester.start_update_chicken(self.chicks, iteration)
+            self.schedule_trading(iteration)
+
+    def chicken_out(self, time):
+        iteration = int(time)
+        self.tester.update_chicken_out(self.chicken, self.chicks, iteration, self.log_level > 0)
+        if self.tester.is_chicken_in_time(self.chicken, self.chicks, iteration):
+            self.schedule(iteration, "update_chicken", self.chicken_in)
+        else:
+            self.schedule_trading(iteration)
+
+    def chicken_in(self, time):
+        iteration = int(time)
+        self.tester.update_chicken_in(self.chicken, self.chicks, self.sim["recorder"], iteration, self.log_level > 0)
+        self.schedule_trading(iteration)
+
+    def schedule_trading(self, iteration):
+        if self.tester.is_arbitrage_triggered(self.chicken, iteration):
+            self.schedule(iteration, "arbitrage_btkn", self.arbitrage_btkn)
+        if not self.tester.is_before_first_chicken_in(self.chicken):
+            self.schedule(iteration, "buy_btkn", self.buy_btkn)
+            self.schedule(iteration, "sell_btkn", self.sell_btkn)
+
+    def arbitrage_btkn(self, time):
+        self.tester.arbitrage_btkn(self.chicken, self.chicks, int(time), self.log_level > 0)
+
+    def buy_btkn(self, time):
+        self.tester.buy_btkn(self.chicken, self.chicks, self.log_level > 0)
+
+    def sell_btkn(self, time):
+        self.tester.sell_btkn(self.chicken, self.chicks, self.log_level > 0)
+
+    def update_controller(self, time):
+        self.avg_age = self.tester.get_avg_outstanding_bond_age(self.chicks, int(time))
+        controller_output = self.sim["controller"].feed(self.config.target_average_age - self.avg_age)
+        self.tester.set_accrual_param(controller_output)
+
+    def log_state(self, time):
+        log_state(self.chicken, self.chicks, self.tester, self.log_level, int(time))
+
+    def record(self, time):
+        iteration = int(time)
+        data = self.sim["recorder"]
+        new_row = state_to_row(
+            self.chicken,
+            self.tester,
+            self.sim["loop_state"]["natural_rate"],
+            self.avg_age,
+            data,
+            iteration
+        )
+        data.append(new_row)
+
+    def end_day(self, time):
+        iteration = int(time)
+        loop_state = self.sim["loop_state"]
+        loop_state["iteration"] = iteration
+
+        if self.checkpoint_interval > 0 and (iteration + 1) % self.checkpoint_interval == 0:
+            snapshot(self.chicken, self.chicks, self.tester, self.sim["controller"], self.sim["recorder"], loop_state=loop_state, path=self.checkpoint_file)
+
+        stop = PLOTS_INTERVAL[1] > 0 and iteration >= PLOTS_INTERVAL[1]
+        if not stop and self.chicken.btkn_amm.get_token_B_price() > 100:
+            print(f"Price too high!: {self.chicken.btkn_amm.get_token_B_price():,.2f}")
+            stop = True
+        # After the lap of this event
+        self.engine.schedule(time, len(DAILY_EVENTS), None, self.end_iteration, stop)
+
+    def end_iteration(self, time, stop):
+        self.profiler.end_iteration()
+        if stop:
+            self.engine.stop()
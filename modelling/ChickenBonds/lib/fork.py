@@ -0,0 +1,43 @@
+import pickle
+import pandas as pd
+
+def fork_simulation(sim):
+    """
+    Independent copy of a simulation state (see init_simulation in chicken_bonds.py).
+    Going through pickle keeps objects shared inside the state (e.g. the Token
+    ledgers used by the chicken, its pools and the rewards) shared in the copy,
+    and is much cheaper than simulating the warm-up again.
+    """
+    return load_simulation(dump_simulation(sim))
+
+def dump_simulation(sim):
+    return pickle.dumps(sim, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_simulation(sim_bytes):
+    return pickle.loads(sim_bytes)
+
+# Scenarios: functions applied to a forked state before it is run on.
+# To be used in process pools they must be picklable, e.g. functools.partial(set_adjustment_rate, adjustment_rate=0.02)
+
+def set_adjustment_rate(sim, adjustment_rate):
+    sim["controller"].adjustment_rate = adjustment_rate
+
+def shock_natural_rate(sim, factor):
+    sim["loop_state"]["natural_rate"] *= factor
+
+class ForkResults():
+    """
+    History of a set of forks of the same warm simulation.
+    The common prefix is stored once, and each fork only keeps the rows
+    recorded after the fork point.
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.fork_length = len(prefix)
+        self.suffixes = {}
+
+    def record(self, name, suffix):
+        self.suffixes[name] = suffix
+
+    def get_dataframe(self, name):
+        return pd.concat([self.prefix, self.suffixes[name]], ignore_index=True)
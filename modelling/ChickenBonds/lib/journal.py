@@ -0,0 +1,239 @@
+import os
+import glob
+import json
+import numpy as np
+import pandas as pd
+
+from lib.constants import *
+from lib.erc_token import MINT, BURN, TRANSFER
+from lib.profiler import NullProfiler
+
+OP_NAMES = ["mint", "burn", "transfer"]
+
+# Account of the missing side of mints (sender) and burns (recipient)
+NO_ACCOUNT = -1
+
+EVENT_DTYPE = np.dtype([
+    ("iteration", np.int32),
+    ("phase", np.int16),
+    ("token", np.int16),
+    ("op", np.int8),
+    ("sender", np.int32),
+    ("recipient", np.int32),
+    ("amount", np.float64),
+])
+
+class Journal(NullProfiler):
+    """
+    Append-only log of every mint, burn and transfer of the tokens attached to it,
+    in a preallocated NumPy structured array (see EVENT_DTYPE).
+    Changes inside overlays (what-ifs) are not logged.
+    It follows the main loop through the profiler interface: events are tagged with the
+    iteration given to start_iteration, and with the phase of the next lap(phase).
+    Events before the loop (deployment) have iteration -1 and phase "none".
+    With a path, full chunks are flushed to numbered .npy files in that directory, at the end
+    of an iteration, along with the names of tokens, accounts and phases (journal.json).
+    Use load_journal(path) or get_data() to query them.
+    """
+    def __init__(self, path=None, chunk_size=JOURNAL_CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.events = np.zeros(chunk_size, dtype=EVENT_DTYPE)
+        self.count = 0
+        self.num_chunks = 0
+        self.tokens = []
+        self.accounts = []
+        self.account_ids = {}
+        self.phases = ["none"]
+        self.phase_ids = {"none": 0}
+        self.iteration = -1
+        # First event of the current phase
+        self.phase_start = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            for chunk_file in glob.glob(os.path.join(path, "events_*.npy")):
+                os.remove(chunk_file)
+
+    def attach(self, tokens):
+        for token in tokens:
+            token.journal = self
+            token.journal_id = len(self.tokens)
+            self.tokens.append(token.symbol)
+
+    def get_account_id(self, account):
+        account_id = self.account_ids.get(account)
+        if account_id is None:
+            account_id = len(self.accounts)
+            self.accounts.append(account)
+            self.account_ids[account] = account_id
+        return account_id
+
+    def grow(self, count):
+        capacity = len(self.events)
+        while capacity < count:
+            capacity *= 2
+        events = np.zeros(capacity, dtype=EVENT_DTYPE)
+        events[:self.count] = self.events[:self.count]
+        self.events = events
+
+    def record(self, token_id, op, sender, recipient, amount):
+        if self.count == len(self.events):
+            self.grow(self.count + 1)
+        self.events[self.count] = (
+            self.iteration,
+            0,
+            token_id,
+            op,
+            NO_ACCOUNT if sender is None else self.get_account_id(sender),
+            NO_ACCOUNT if recipient is None else self.get_account_id(recipient),
+            amount,
+        )
+        self.count += 1
+
+    def record_batch(self, token_id, op, senders, recipients, amounts):
+        """
+        @param senders: Account names (or None), one per event
+        @param recipients: Account names (or None), one per event
+        """
+        count = self.count + len(amounts)
+        if count > len(self.events):
+            self.grow(count)
+        events = self.events[self.count:count]
+        events["iteration"] = self.iteration
+        events["phase"] = 0
+        events["token"] = token_id
+        events["op"] = op
+        events["sender"] = [NO_ACCOUNT if sender is None else self.get_account_id(sender) for sender in senders]
+        events["recipient"] = [NO_ACCOUNT if recipient is None else self.get_account_id(recipient) for recipient in recipients]
+        events["amount"] = amounts
+        self.count = count
+
+    def start_iteration(self, iteration=None):
+        self.iteration = iteration
+        self.phase_start = self.count
+
+    def lap(self, phase):
+        phase_id = self.phase_ids.get(phase)
+        if phase_id is None:
+            phase_id = len(self.phases)
+            self.phases.append(phase)
+            self.phase_ids[phase] = phase_id
+        self.events["phase"][self.phase_start:self.count] = phase_id
+        self.phase_start = self.count
+
+    def end_iteration(self):
+        if self.path is not None and self.count >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the events so far to a new chunk file, and the names to journal.json.
+        """
+        if self.path is None:
+            return
+        if self.count > 0:
+            np.save(os.path.join(self.path, f"events_{self.num_chunks:05}.npy"), self.events[:self.count])
+            self.num_chunks += 1
+            self.count = 0
+            self.phase_start = 0
+        with open(os.path.join(self.path, "journal.json"), "w") as f:
+            json.dump({"tokens": self.tokens, "accounts": self.accounts, "phases": self.phases}, f)
+
+    def get_data(self):
+        """
+        Events logged so far, including the flushed ones.
+        """
+        chunks = []
+        if self.path is not None:
+            chunks = [np.load(chunk_file) for chunk_file in sorted(glob.glob(os.path.join(self.path, "events_*.npy")))]
+        chunks.append(self.events[:self.count])
+        return JournalData(np.concatenate(chunks), self.tokens, self.accounts, self.phases)
+
+def load_journal(path):
+    """
+    Read a journal written by Journal(path), without running the simulation again.
+    """
+    with open(os.path.join(path, "journal.json")) as f:
+        names = json.load(f)
+    chunk_files = sorted(glob.glob(os.path.join(path, "events_*.npy")))
+    events = np.concatenate([np.load(chunk_file) for chunk_file in chunk_files]) if chunk_files else np.zeros(0, dtype=EVENT_DTYPE)
+    return JournalData(events, names["tokens"], names["accounts"], names["phases"])
+
+class JournalData():
+    """
+    Columnar view of journal events, with names for token, account and phase IDs.
+    """
+    def __init__(self, events, tokens, accounts, phases):
+        self.events = events
+        self.tokens = list(tokens)
+        self.accounts = list(accounts)
+        self.phases = list(phases)
+
+    def __len__(self):
+        return len(self.events)
+
+    def get_dataframe(self):
+        """
+        One row per event, with names instead of IDs (as categoricals).
+        """
+        # Missing accounts (-1) become NaN
+        return pd.DataFrame({
+            "iteration": self.events["iteration"],
+            "phase": pd.Categorical.from_codes(self.events["phase"], self.phases),
+            "token": pd.Categorical.from_codes(self.events["token"], self.tokens),
+            "op": pd.Categorical.from_codes(self.events["op"], OP_NAMES),
+            "sender": pd.Categorical.from_codes(self.events["sender"], self.accounts),
+            "recipient": pd.Categorical.from_codes(self.events["recipient"], self.accounts),
+            "amount": self.events["amount"],
+        })
+
+    def replay(self, iteration=None):
+        """
+        Rebuild the balances at the end of an iteration.
+        Events are applied in the same order as in the simulation, so balances are exactly the same.
+        @param iteration: Last iteration to apply (defaults to all of them; -1 for right after deployment)
+        @return: DataFrame with a row per account and a column per token
+        """
+        events = self.events
+        if iteration is not None:
+            events = events[events["iteration"] <= iteration]
+        # Recipient and sender sides of every event, interleaved to keep the order of the updates
+        tokens = np.repeat(events["token"], 2)
+        accounts = np.stack([events["recipient"], events["sender"]], axis=1).ravel()
+        amounts = np.stack([events["amount"], -events["amount"]], axis=1).ravel()
+        mask = accounts != NO_ACCOUNT
+
+        balances = np.zeros((len(self.tokens), len(self.accounts)))
+        np.add.at(balances, (tokens[mask], accounts[mask]), amounts[mask])
+        return pd.DataFrame(balances.T, index=self.accounts, columns=self.tokens)
+
+    def get_account_flows(self, account):
+        """
+        Amounts in and out of an account, per iteration and token.
+        @return: DataFrame indexed by (iteration, token) with columns in, out and net
+        """
+        account_id = self.accounts.index(account)
+        events = self.events
+        received = events["recipient"] == account_id
+        sent = events["sender"] == account_id
+        touched = received | sent
+        flows = pd.DataFrame({
+            "iteration": events["iteration"][touched],
+            "token": pd.Categorical.from_codes(events["token"][touched], self.tokens),
+            "in": np.where(received[touched], events["amount"][touched], 0.0),
+            "out": np.where(sent[touched], events["amount"][touched], 0.0),
+        })
+        flows = flows.groupby(["iteration", "token"], observed=True).sum()
+        flows["net"] = flows["in"] - flows["out"]
+        return flows
+
+    def get_phase_volumes(self, op=TRANSFER):
+        """
+        Total amount moved per main loop phase and token.
+        @param op: MINT, BURN or TRANSFER
+        @return: DataFrame with a row per phase and a column per token
+        """
+        events = self.events[self.events["op"] == op]
+        volumes = np.zeros((len(self.phases), len(self.tokens)))
+        np.add.at(volumes, (events["phase"], events["token"]), events["amount"])
+        return pd.DataFrame(volumes, index=self.phases, columns=self.tokens)
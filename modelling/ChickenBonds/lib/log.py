@@ -83,24 +83,15 @@ def get_subgroup_total_value(chicken, chicks, chick_selector):
         0
     )
 
-def log_performance(chicken, chicks):
-    print("")
-    print("Performance")
-    print("")
+def get_performance(chicken, chicks, config):
     pending_bal = chicken.pending_token_balance()
     reserve_bal = chicken.reserve_token_balance()
     amm_value = chicken.amm.get_value_in_token_A_of(chicken.reserve_account)
-    print(f" - Total permament:               {amm_value:,.2f}")
-    print(f" - Permament percentage:          {amm_value / (pending_bal + reserve_bal + amm_value):.3%}")
-    print("")
+
     total_rebonders = get_subgroup_total_value(chicken, chicks, lambda chick: chick.rebonder)
     total_lps = get_subgroup_total_value(chicken, chicks, lambda chick: chick.lp)
     total_sellers = get_subgroup_total_value(chicken, chicks, lambda chick: chick.seller)
     total_traders = get_subgroup_total_value(chicken, chicks, lambda chick: chick.trader)
-    print(f" - Rebonders avg gain: {total_rebonders / (NUM_REBONDERS * INITIAL_AMOUNT) - 1 :.3%}")
-    print(f" - LPs avg gain:       {total_lps / (NUM_LPS * INITIAL_AMOUNT) - 1 :.3%}")
-    print(f" - Sellers avg gain:   {total_sellers / (NUM_SELLERS * INITIAL_AMOUNT) - 1 :.3%}")
-    print(f" - Traders avg gain:   {total_traders / (NUM_TRADERS * INITIAL_AMOUNT) - 1 :.3%}")
 
     # Total LQTY
     total_lqty = reduce(
@@ -113,11 +104,32 @@ def log_performance(chicken, chicks):
     total_lqty += chicken.amm.get_value_in_token_A_of(chicken.reserve_account)
     total_lqty += chicken.token.balance_of(chicken.btkn_amm.pool_account)
     total_lqty += chicken.token.balance_of(chicken.btkn_amm.rewards.account)
-    print("")
-    print(f" - Total LQTY:         {total_lqty:,.2f}")
-    #print(f" - Yield generated:    {total_lqty / (NUM_CHICKS * INITIAL_AMOUNT) - 1:.3%}")
-
 
+    return {
+        "permanent": amm_value,
+        "permanent_share": amm_value / (pending_bal + reserve_bal + amm_value),
+        "rebonders_gain": total_rebonders / (config.num_rebonders * config.initial_amount) - 1,
+        "lps_gain": total_lps / (config.num_lps * config.initial_amount) - 1,
+        "sellers_gain": total_sellers / (config.num_sellers * config.initial_amount) - 1,
+        "traders_gain": total_traders / (config.num_traders * config.initial_amount) - 1,
+        "total_lqty": total_lqty,
+    }
+
+def log_performance(chicken, chicks, config):
+    performance = get_performance(chicken, chicks, config)
+    print("")
+    print("Performance")
+    print("")
+    print(f" - Total permament:               {performance['permanent']:,.2f}")
+    print(f" - Permament percentage:          {performance['permanent_share']:.3%}")
+    print("")
+    print(f" - Rebonders avg gain: {performance['rebonders_gain']:.3%}")
+    print(f" - LPs avg gain:       {performance['lps_gain']:.3%}")
+    print(f" - Sellers avg gain:   {performance['sellers_gain']:.3%}")
+    print(f" - Traders avg gain:   {performance['traders_gain']:.3%}")
+    print("")
+    print(f" - Total LQTY:         {performance['total_lqty']:,.2f}")
+    #print(f" - Yield generated:    {performance['total_lqty'] / (config.num_chicks * config.initial_amount) - 1:.3%}")
 
     return
 
@@ -130,6 +142,6 @@ def log_state(chicken, chicks, tester, log_level=1, iteration=0):
     #log_amm(chicken)
     log_btkn_amm(chicken)
     #log_chicks(chicken, chicks)
-    log_performance(chicken, chicks)
+    log_performance(chicken, chicks, tester.config)
     print("")
     return
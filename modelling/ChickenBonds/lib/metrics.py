@@ -0,0 +1,44 @@
+import numpy as np
+
+class RollingWindow():
+    """
+    Running mean over the last `size` pushed values, with O(1) updates.
+    The running sum is rebuilt from the ring buffer every time it wraps
+    around, so floating point drift can’t accumulate over long runs.
+    """
+    def __init__(self, size):
+        assert size > 0
+        self.size = size
+        self.values = np.zeros(size)
+        self.position = 0
+        self.count = 0
+        self.total = 0.0
+
+    def push(self, value):
+        self.total = self.total - self.values[self.position] + value
+        self.values[self.position] = value
+        self.position = self.position + 1
+        if self.position == self.size:
+            self.position = 0
+            self.total = self.values.sum()
+        if self.count < self.size:
+            self.count = self.count + 1
+
+    def mean(self):
+        if self.count == 0:
+            return 0
+        return self.total / self.count
+
+class RollingMetrics():
+    def __init__(self, windows):
+        self.windows = {variable: RollingWindow(size) for variable, size in windows.items()}
+
+    def __contains__(self, variable):
+        return variable in self.windows
+
+    def push(self, row):
+        for variable, window in self.windows.items():
+            window.push(row[variable])
+
+    def mean(self, variable):
+        return self.windows[variable].mean()
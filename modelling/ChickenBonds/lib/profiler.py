@@ -0,0 +1,176 @@
+import time
+import functools
+import pandas as pd
+
+from lib.amm.curvev2 import *
+from lib.erc_token import *
+from lib.state import *
+
+# (class, method) pairs whose calls are counted while a Profiler is instrumenting
+HOT_PRIMITIVES = [
+    (CurveV2Pool, "get_spot_price"),
+    (CurveV2Pool, "get_dy"),
+    (CurveV2Pool, "_exchange"),
+    (CurveV2Pool, "tweak_price"),
+    (CurveV2Pool, "newton_y_bigint"),
+    (CurveV2Pool, "newton_D_bigint"),
+] + [
+    # Entry points that move balances, of both token implementations (see token_ledger in lib/config.py)
+    (cls, method) for cls, methods in [
+        (Token, ["mint", "burn", "transfer"]),
+        (LedgerToken, ["mint", "burn", "transfer", "batch_mint", "batch_transfer"]),
+    ] for method in methods
+]
+
+class NullProfiler():
+    """
+    Profiler interface with no-ops, used by the main loop when profiling is off.
+    """
+    def instrument(self):
+        pass
+
+    def uninstrument(self):
+        pass
+
+    def add_phase(self, phase):
+        pass
+
+    def start_iteration(self, iteration=None):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def end_iteration(self):
+        pass
+
+class ProfilerGroup(NullProfiler):
+    """
+    Several profilers (or other followers of the main loop, like a Journal) as one.
+    """
+    def __init__(self, profilers):
+        self.profilers = profilers
+
+    def instrument(self):
+        for profiler in self.profilers:
+            profiler.instrument()
+
+    def uninstrument(self):
+        for profiler in self.profilers:
+            profiler.uninstrument()
+
+    def add_phase(self, phase):
+        for profiler in self.profilers:
+            profiler.add_phase(phase)
+
+    def start_iteration(self, iteration=None):
+        for profiler in self.profilers:
+            profiler.start_iteration(iteration)
+
+    def lap(self, phase):
+        for profiler in self.profilers:
+            profiler.lap(phase)
+
+    def end_iteration(self):
+        for profiler in self.profilers:
+            profiler.end_iteration()
+
+class Profiler(NullProfiler):
+    """
+    Wall time per phase of the main loop and call counts of hot primitives, per iteration.
+    Phases are timed by lap(phase), which charges the time since the previous lap
+    (or the start of the iteration) to `phase`. Calls are counted by wrapping the
+    methods in `targets` on their classes, only between instrument() and uninstrument(),
+    so there is no cost when not profiling.
+    """
+    def __init__(self, targets=HOT_PRIMITIVES, capacity=ITERATIONS):
+        self.targets = targets
+        self.counts = {self.get_target_name(cls, method): 0 for cls, method in targets}
+        self.originals = {}
+        self.phases = {}
+        self.iteration_counts = dict(self.counts)
+        self.iteration = None
+        self.last_time = 0
+        self.data = StateRecorder(capacity)
+
+    @staticmethod
+    def get_target_name(cls, method):
+        return f"{cls.__name__}.{method}"
+
+    def instrument(self):
+        if self.originals:
+            return
+        for cls, method in self.targets:
+            original = getattr(cls, method)
+            self.originals[(cls, method)] = original
+            setattr(cls, method, self.count_calls(self.get_target_name(cls, method), original))
+
+    def uninstrument(self):
+        for (cls, method), original in self.originals.items():
+            setattr(cls, method, original)
+        self.originals = {}
+
+    def count_calls(self, name, function):
+        counts = self.counts
+        @functools.wraps(function)
+        def counted(*args, **kwargs):
+            counts[name] += 1
+            return function(*args, **kwargs)
+        return counted
+
+    def add_phase(self, phase):
+        # For phases that may not run every iteration, so that all rows have them
+        self.phases.setdefault(phase, 0.0)
+
+    def start_iteration(self, iteration=None):
+        for phase in self.phases:
+            self.phases[phase] = 0.0
+        self.iteration = len(self.data) if iteration is None else iteration
+        self.iteration_counts = dict(self.counts)
+        self.last_time = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last_time
+        self.last_time = now
+
+    def end_iteration(self):
+        row = {"iteration": self.iteration}
+        row.update(self.phases)
+        for name, count in self.counts.items():
+            row[f"calls {name}"] = count - self.iteration_counts[name]
+        self.data.append(row)
+
+    def get_dataframe(self):
+        """
+        Per iteration time series: seconds per phase, and calls per primitive.
+        Rows only cover the iterations run while profiling (a resumed or forked run starts
+        at its first new iteration), so match them to the simulation data, whose index is
+        the iteration, by their `iteration` column, not by position.
+        """
+        return self.data.get_dataframe()
+
+    def get_summary(self):
+        """
+        Totals over the run: seconds and share of the loop time per phase, and calls per primitive.
+        """
+        data = self.get_dataframe()
+        iterations = max(len(data), 1)
+        loop_time = sum(data[phase].sum() for phase in self.phases)
+        rows = []
+        for phase in self.phases:
+            total = data[phase].sum()
+            rows.append({
+                "name": phase,
+                "total": total,
+                "per_iteration": total / iterations,
+                "share": total / loop_time if loop_time > 0 else 0,
+            })
+        for name, count in self.counts.items():
+            rows.append({
+                "name": name,
+                "total": count,
+                "per_iteration": count / iterations,
+                "share": None,
+            })
+        return pd.DataFrame(rows).set_index("name")
@@ -1,7 +1,90 @@
+import numpy as np
 import pandas as pd
 
-def init_data():
-    return pd.DataFrame()
+from lib.constants import *
+from lib.metrics import *
+
+class StateRecorder():
+    """
+    Columnar store for the per-iteration state rows.
+    Keeps one float64 column per key of state_to_row() in a preallocated,
+    column-major buffer that doubles its capacity when full, so appending a
+    row has constant cost instead of copying the whole history.
+    Views returned by __getitem__ and get_dataframe() share memory with the
+    buffer, and are only valid until the next capacity growth.
+    Variables in `windows` are also fed to rolling means (see lib/metrics.py),
+    so TWAPs don’t need to slice the history.
+    """
+    def __init__(self, capacity=ITERATIONS, windows=None):
+        assert capacity > 0
+        self.capacity = capacity
+        self.columns = []
+        self.column_index = {}
+        self.length = 0
+        self._buffer = None
+        self.metrics = RollingMetrics(windows or {})
+
+    def __len__(self):
+        return self.length
+
+    def __contains__(self, column):
+        return column in self.column_index
+
+    def __getitem__(self, column):
+        if column not in self.column_index:
+            raise KeyError(column)
+        return self._buffer[:self.length, self.column_index[column]]
+
+    def _init_columns(self, columns):
+        self.columns = list(columns)
+        self.column_index = {column: index for index, column in enumerate(self.columns)}
+        self._buffer = np.empty((self.capacity, len(self.columns)), order='F')
+
+    def _grow(self):
+        self.capacity = 2 * self.capacity
+        new_buffer = np.empty((self.capacity, len(self.columns)), order='F')
+        new_buffer[:self.length] = self._buffer[:self.length]
+        self._buffer = new_buffer
+
+    def append(self, row):
+        if self._buffer is None:
+            self._init_columns(row.keys())
+        assert len(row) == len(self.columns)
+        if self.length == self.capacity:
+            self._grow()
+        self._buffer[self.length] = [row[column] for column in self.columns]
+        self.length = self.length + 1
+        self.metrics.push(row)
+
+    def __getstate__(self):
+        # Only pickle the filled rows, the spare capacity is reallocated on load
+        state = self.__dict__.copy()
+        if self._buffer is not None:
+            state["_buffer"] = np.array(self._buffer[:self.length])
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._buffer is not None:
+            buffer = np.empty((self.capacity, len(self.columns)), order='F')
+            buffer[:self.length] = self._buffer
+            self._buffer = buffer
+
+    def mean(self, column, start, end):
+        return self[column][start:end].mean()
+
+    def get_dataframe(self):
+        """
+        Frame of the rows so far, without copying them: it shares memory with the recorder,
+        so in-place edits to the frame change the recorded history (use .copy() to edit it).
+        """
+        # Zero-copy: the frame wraps the filled rows of the (capacity, columns) Fortran-order buffer as they are
+        if self._buffer is None:
+            return pd.DataFrame()
+        return pd.DataFrame(self._buffer[:self.length], columns=self.columns, copy=False)
+
+def init_data(capacity=ITERATIONS, windows=None):
+    return StateRecorder(capacity, windows)
 
 def state_to_row(
         chicken,
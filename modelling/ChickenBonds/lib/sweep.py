@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+import itertools
+import dataclasses
+import numpy as np
+import pandas as pd
+
+from lib.constants import *
+from lib.config import *
+from lib.log import *
+
+def get_grid_design(ranges, base_config=None):
+    """
+    Cartesian product of the given values.
+    @param ranges: Dict of SimConfig field -> list of values, e.g. {"external_yield": [0.03, 0.05]}
+    @param base_config: SimConfig for the fields not in ranges
+    @return: List of SimConfig
+    """
+    base_config = base_config or SimConfig()
+    names = list(ranges.keys())
+    return [
+        base_config.replace(**dict(zip(names, values)))
+        for values in itertools.product(*ranges.values())
+    ]
+
+def get_random_design(ranges, n_points=SWEEP_POINTS, base_config=None, seed=0):
+    """
+    Points drawn uniformly from the given intervals.
+    @param ranges: Dict of SimConfig field -> (low, high)
+    @param n_points: Number of configs to draw
+    @param base_config: SimConfig for the fields not in ranges
+    @param seed: Seed of the draw, so the same design can be rebuilt (and hit the cache)
+    @return: List of SimConfig
+    """
+    base_config = base_config or SimConfig()
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(n_points):
+        changes = {name: float(rng.uniform(low, high)) for name, (low, high) in ranges.items()}
+        configs.append(base_config.replace(**changes))
+    return configs
+
+def get_config_key(config):
+    # hash() of strings is salted per process, so it can’t be used for files
+    fields = json.dumps(dataclasses.asdict(config), sort_keys=True)
+    return hashlib.sha256(fields.encode()).hexdigest()[:20]
+
+def get_run_summary(chicken, chicks, tester, data):
+    return {
+        "iterations_run": len(data),
+        "backing_ratio": chicken.get_backing_ratio(),
+        "btkn_price": chicken.btkn_amm.get_token_B_price(),
+        **get_performance(chicken, chicks, tester.config),
+    }
+
+class SweepCache():
+    """
+    On disk store of run summaries, one JSON file per config, named after
+    get_config_key(), so every worker can write its own results.
+    """
+    def __init__(self, directory=SWEEP_CACHE_DIR):
+        self.directory = directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def get_path(self, config):
+        return os.path.join(self.directory, get_config_key(config) + ".json")
+
+    def __contains__(self, config):
+        return os.path.exists(self.get_path(config))
+
+    def get(self, config):
+        with open(self.get_path(config)) as f:
+            return json.load(f)["summary"]
+
+    def put(self, config, summary):
+        # Write and rename, so an interrupted sweep can’t leave a truncated file
+        path = self.get_path(config)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"config": dataclasses.asdict(config), "summary": summary}, f)
+        os.replace(tmp_path, path)
+
+def get_sweep_dataframe(configs, summaries):
+    """
+    One row per config: the fields that change across the sweep, followed by the run summary.
+    """
+    config_rows = pd.DataFrame([dataclasses.asdict(config) for config in configs])
+    varying = [
+        column for column in config_rows.columns
+        if config_rows[column].astype(str).nunique() > 1
+    ]
+    return pd.concat(
+        [config_rows[varying], pd.DataFrame(summaries)],
+        axis=1
+    )
@@ -2,14 +2,16 @@ import math
 import numpy as np
 import random
 
-from lib.constants import *
+from lib.config import *
+from lib.user import *
 
 # Testers
 
 class TesterInterface():
-    def __init__(self):
+    def __init__(self, config=None):
+        self.config = config or SimConfig()
         self.name = ""
-        self.iterations = ITERATIONS
+        self.iterations = self.config.iterations
 
         self.price_max_value = 200
         self.apr_min_value = -20
@@ -21,6 +23,11 @@ class TesterInterface():
         self.chicken_in_counter = 0
         self.chicken_out_counter = 0
 
+        # Replica number, to get an independent random stream in ensemble runs
+        self.run_id = 0
+        # Random stream of the current phase (see TesterSimple.seed)
+        self.rng = None
+
         return
 
     def init(self, chicks):
@@ -29,6 +36,9 @@ class TesterInterface():
     def prefixes_getter(self):
         pass
 
+    def get_metric_windows(self):
+        pass
+
     def get_fair_price(self, chicken):
         pass
 
@@ -80,8 +90,8 @@ class TesterInterface():
         pass
 
 class TesterSimple(TesterInterface):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, config=None):
+        super().__init__(config)
         self.name = "Simple toll model"
         self.plot_prefix = '0_0'
         self.plot_file_description = 'simple_toll'
@@ -91,87 +101,102 @@ class TesterSimple(TesterInterface):
         self.apr_max_value = 100
         self.time_max_value = 1000
 
-        self.initial_price = INITIAL_BTKN_PRICE
-        self.twap_period = TWAP_PERIOD
-        self.price_premium = PRICE_PREMIUM
-        self.price_volatility = PRICE_VOLATILITY
+        self.initial_price = self.config.initial_btkn_price
+        self.twap_period = self.config.twap_period
+        self.price_premium = self.config.price_premium
+        self.price_volatility = self.config.price_volatility
 
-        self.external_yield = EXTERNAL_YIELD
+        self.external_yield = self.config.external_yield
 
-        self.accrual_param = INITIAL_ACCRUAL_PARAM
-        self.chicken_in_gamma_shape = CHICKEN_IN_GAMMA[0]
-        self.chicken_in_gamma_scale = CHICKEN_IN_GAMMA[1]
-        self.chicken_out_probability = CHICKEN_OUT_PROBABILITY
-        self.chicken_in_amm_fee = CHICKEN_IN_AMM_FEE
+        self.accrual_param = self.config.initial_accrual_param
+        self.chicken_in_gamma_shape = self.config.chicken_in_gamma[0]
+        self.chicken_in_gamma_scale = self.config.chicken_in_gamma[1]
+        self.chicken_out_probability = self.config.chicken_out_probability
+        self.chicken_in_amm_fee = self.config.chicken_in_amm_fee
 
-        self.rebonders = NUM_REBONDERS
-        self.lps = NUM_LPS
-        self.sellers = NUM_SELLERS
-        self.traders = NUM_TRADERS
+        self.rebonders = self.config.num_rebonders
+        self.lps = self.config.num_lps
+        self.sellers = self.config.num_sellers
+        self.traders = self.config.num_traders
 
-        self.max_slippage = MAX_SLIPPAGE
-        self.amm_yield = AMM_YIELD
+        self.max_slippage = self.config.max_slippage
+        self.amm_yield = self.config.amm_yield
+
+        # See memoize
+        self.metric_cache = {}
+        self.metric_cache_stats = {"hits": 0, "misses": 0}
 
         return
 
     def init(self, chicks):
-        for i in range(self.rebonders):
-            chicks[i].rebonder = True
+        chicks.set_role(ROLE_REBONDER, 0, self.rebonders)
         start = self.rebonders
         end = start + self.lps
-        for i in range(start, end):
-            chicks[i].lp = True
+        chicks.set_role(ROLE_LP, start, end)
         start = end
         end = start + self.sellers
-        for i in range(start, end):
-            chicks[i].seller = True
+        chicks.set_role(ROLE_SELLER, start, end)
         start = end
         end = start + self.traders
-        for i in range(start, end):
-            chicks[i].trader = True
+        chicks.set_role(ROLE_TRADER, start, end)
 
         return
 
     def prefixes_getter(self):
         return self.plot_prefix, self.plot_file_description
 
-    # TODO: index them
+    # Variables averaged over a rolling window, and their window sizes
+    def get_metric_windows(self):
+        return {
+            "btkn_price": self.twap_period,
+            "btkn_apr": self.twap_period,
+            "bonding_apr": self.twap_period,
+            "amm_iteration_apr": self.config.amm_apr_period,
+        }
+
+    # Chicks are an AgentPopulation (see lib/user.py). Queries are on its maintained sets of bonded
+    # agents, roles and token holders, so they cost what they return, and give the matching chicks
+    # in the current (shuffled) order. Queries with another threshold than 0 are masks over all of them.
     def get_bonded_chicks(self, chicks):
-        return list(filter(lambda chick: chick.bond_amount > 0, chicks))
+        return chicks.select_indexes(chicks.bonded)
 
     def get_bonded_chicks_lps(self, chicks):
-        return list(filter(lambda chick: chick.bond_amount > 0 and chick.lp, chicks))
+        return chicks.select_indexes(chicks.bonded & chicks.role_sets[ROLE_LP])
 
     def get_bonded_chicks_non_lps(self, chicks):
-        return list(filter(lambda chick: chick.bond_amount > 0 and not chick.lp, chicks))
+        return chicks.select_indexes(chicks.bonded - chicks.role_sets[ROLE_LP])
 
     def get_bonded_chicks_rebonders(self, chicks):
-        return list(filter(lambda chick: chick.bond_amount > 0 and chick.rebonder, chicks))
+        return chicks.select_indexes(chicks.bonded & chicks.role_sets[ROLE_REBONDER])
 
     def get_bonded_chicks_others(self, chicks):
-        return list(filter(lambda chick: chick.bond_amount > 0 and not chick.rebonder and not chick.lp, chicks))
+        return chicks.select_indexes(chicks.bonded - chicks.role_sets[ROLE_REBONDER] - chicks.role_sets[ROLE_LP])
 
     def get_not_bonded_chicks(self, chicks):
-        return list(filter(lambda chick: chick.bond_amount == 0, chicks))
+        return chicks.select(chicks.bond_amount == 0)
 
     def get_available_for_bonding_chicks(self, chicken, chicks):
-        return list(
-            filter(lambda chick: chick.bond_amount == 0 and chicken.token.balance_of(chick.account) > 0 and not chick.trader, chicks))
+        return chicks.select_indexes(chicks.get_holders(chicken.token) - chicks.bonded - chicks.role_sets[ROLE_TRADER])
+
+    def get_holders(self, chicks, token, threshold):
+        if threshold == 0:
+            return chicks.get_holders(token)
+        return set(np.flatnonzero(chicks.get_balances(token) > threshold).tolist())
 
     def get_token_hodlers(self, chicken, chicks, threshold=0):
-        return list(filter(lambda chick: chicken.token.balance_of(chick.account) > threshold, chicks))
+        return chicks.select_indexes(self.get_holders(chicks, chicken.token, threshold))
 
     def get_btkn_hodlers(self, chicken, chicks, threshold=0):
-        return list(filter(lambda chick: chicken.btkn.balance_of(chick.account) > threshold, chicks))
+        return chicks.select_indexes(self.get_holders(chicks, chicken.btkn, threshold))
 
     def get_lp_hodlers(self, chicken, chicks, threshold=0):
-        return list(filter(lambda chick: chicken.btkn_amm.lp_token.balance_of(chick.account) > threshold, chicks))
+        return chicks.select_indexes(self.get_holders(chicks, chicken.btkn_amm.lp_token, threshold))
 
     def get_traders_with_token(self, chicken, chicks, threshold=0):
-        return list(filter(lambda chick: chick.trader and chicken.token.balance_of(chick.account) > threshold, chicks))
+        return chicks.select_indexes(chicks.role_sets[ROLE_TRADER] & self.get_holders(chicks, chicken.token, threshold))
 
     def get_traders_with_btkn(self, chicken, chicks, threshold=0):
-        return list(filter(lambda chick: chick.trader and chicken.btkn.balance_of(chick.account) > threshold, chicks))
+        return chicks.select_indexes(chicks.role_sets[ROLE_TRADER] & self.get_holders(chicks, chicken.btkn, threshold))
 
     #def is_pre_chicken_in_phase(self, chicken, chicks):
         #return len(self.get_btkn_hodlers(chicken, chicks)) == 0
@@ -183,9 +208,28 @@ class TesterSimple(TesterInterface):
             return 999999999
         return bond_amount / backing_ratio
 
+    def get_stream(self, salt, iteration):
+        """
+        Random stream of a phase of an iteration, owned by this simulation (the global one is not used).
+        With config.rng "legacy", a RandomState seeded as np.random.seed was, so results are the same as before
+        (run 0 keeps the original seeds, so a single run is reproducible as before).
+        With "generator", a Generator from the SeedSequence tree of config.rng_seed, spawned per replica,
+        phase (salt) and iteration, so streams do not overlap across replicas.
+        """
+        if self.config.rng == "generator":
+            seed_sequence = np.random.SeedSequence(self.config.rng_seed, spawn_key=(self.run_id, salt, iteration))
+            return np.random.Generator(np.random.PCG64(seed_sequence))
+        if self.run_id == 0:
+            return np.random.RandomState(salt * iteration)
+        return np.random.RandomState([self.run_id, salt * iteration])
+
+    def seed(self, salt, iteration):
+        # Draws until the next seed (e.g. the ones of get_fair_price) go on with this stream
+        self.rng = self.get_stream(salt, iteration)
+
     def get_natural_rate(self, previous_natural_rate, iteration):
-        np.random.seed(2021 * iteration)
-        shock_natural_rate = np.random.normal(0, SD_NATURAL_RATE)
+        self.seed(2021, iteration)
+        shock_natural_rate = self.rng.normal(0, self.config.sd_natural_rate)
         new_natural_rate = previous_natural_rate * (1 + shock_natural_rate)
         # print(f"previous natural rate: {previous_natural_rate:.3%}")
         # print(f"new natural rate:      {new_natural_rate:.3%}")
@@ -193,7 +237,7 @@ class TesterSimple(TesterInterface):
         return new_natural_rate
 
     def get_premium_by_yield_comparison(self, chicken):
-        expected_bonding_time = 2 * TARGET_AVERAGE_AGE
+        expected_bonding_time = 2 * self.config.target_average_age
         reserve_bucket = chicken.reserve_token_balance()
         pending_bucket = chicken.pending_token_balance()
         permanent_bucket = chicken.amm.get_value_in_token_A()
@@ -220,13 +264,13 @@ class TesterSimple(TesterInterface):
 
         base_amount = chicken.reserve_token_balance()
 
-        mu = base_amount * PREMIUM_MU
-        sigma = mu * PREMIUM_SIGMA
+        mu = base_amount * self.config.premium_mu
+        sigma = mu * self.config.premium_sigma
 
         # Different methods to estimate the premium of bLQTY tokens.
-        premium_mapper = {"normal_dist": np.random.normal(mu, sigma, 1)[0] / btkn_supply,
+        premium_mapper = {"normal_dist": self.rng.normal(mu, sigma, 1)[0] / btkn_supply,
                           # TODO: add reserve here too:
-                          "perpetuity": (chicken.pending_token_balance() * EXTERNAL_YIELD) ** (1 / TIME_UNITS_PER_YEAR),
+                          "perpetuity": (chicken.pending_token_balance() * self.config.external_yield) ** (1 / self.config.get_steps_per_year()),
                           "pending_balance": chicken.pending_token_balance() / btkn_supply,
                           "full_balance": (chicken.pending_token_balance() + (self.amm_yield/self.external_yield) * chicken.amm.get_value_in_token_A()) / btkn_supply,
                           "yield_comparison": self.get_premium_by_yield_comparison(chicken),
@@ -250,8 +294,8 @@ class TesterSimple(TesterInterface):
 
         # Different methods to include volatility in the price.
         volatility_mapper = {"None": 0,
-                             "bounded": min(np.random.normal(VOLA_MU, VOLA_SIGMA, 1), price_floor),
-                             "unbounded": np.random.normal(VOLA_MU, VOLA_SIGMA, 1),
+                             "bounded": min(self.rng.normal(self.config.vola_mu, self.config.vola_sigma, 1), price_floor),
+                             "unbounded": self.rng.normal(self.config.vola_mu, self.config.vola_sigma, 1),
                              }
 
         total_price = price_floor \
@@ -260,23 +304,50 @@ class TesterSimple(TesterInterface):
 
         return total_price
 
+    # Metrics which only depend on the state of the chicken (not on randomness) are computed many
+    # times per iteration, e.g. once per chick, with nothing changed in between. They are memoized
+    # on the state versions of the ledgers and the bTKN AMM they read, which increase on every change,
+    # so only the last value of each metric needs to be kept.
+    def get_metric_cache_key(self, chicken):
+        return (
+            chicken.simulation_id,
+            chicken.token.version,
+            chicken.btkn.version,
+            chicken.btkn_amm.get_state_version(),
+            self.accrual_param,
+        )
+
+    def memoize(self, name, chicken, function):
+        key = self.get_metric_cache_key(chicken)
+        cached = self.metric_cache.get(name)
+        if cached is not None and cached[0] == key:
+            self.metric_cache_stats["hits"] += 1
+            return cached[1]
+        self.metric_cache_stats["misses"] += 1
+        value = function(chicken)
+        self.metric_cache[name] = (key, value)
+        return value
+
     def get_btkn_spot_price(self, chicken):
-        return chicken.btkn_amm.get_token_B_price()
+        return self.memoize("btkn_spot_price", chicken, lambda chicken: chicken.btkn_amm.get_token_B_price())
 
     def get_btkn_twap(self, data, iteration):
         if iteration <= self.twap_period:
             return self.initial_price
-        # print(data[iteration - self.twap_period : iteration]["btkn_price"])
-        # print(f"average: {data[iteration - self.twap_period : iteration].mean()['btkn_price']:,.2f}")
-        return data[iteration - self.twap_period: iteration].mean()["btkn_price"]
+        # print(data["btkn_price"][iteration - self.twap_period : iteration])
+        # print(f"average: {data.metrics.mean('btkn_price'):,.2f}")
+        return data.metrics.mean("btkn_price")
 
     def get_btkn_price(self, chicken, data, iteration):
         return self.get_btkn_twap(data, iteration)
 
     def get_backing_ratio(self, chicken):
-        return chicken.get_backing_ratio()
+        return self.memoize("backing_ratio", chicken, lambda chicken: chicken.get_backing_ratio())
 
     def get_optimal_apr_chicken_in_time(self, chicken):
+        return self.memoize("optimal_apr_chicken_in_time", chicken, self.compute_optimal_apr_chicken_in_time)
+
+    def compute_optimal_apr_chicken_in_time(self, chicken):
         # market/fair price
         m = self.get_btkn_spot_price(chicken)
         # backing ratio
@@ -294,24 +365,23 @@ class TesterSimple(TesterInterface):
         """
 
         if t == 0:
-            return TARGET_AVERAGE_AGE
+            return self.config.target_average_age
         if t <= r:
-            return ITERATIONS
+            return self.config.iterations
 
         chicken_in_time = u * (r + math.sqrt(t * r)) / (t - r)
 
         assert chicken_in_time > 0
 
-        return min(ITERATIONS, chicken_in_time)
+        return min(self.config.iterations, chicken_in_time)
 
     def get_twap_metric(self, chicken, data, iteration, variable):
         if iteration == 0:
             return 0
-        if iteration <= self.twap_period:
-            return data[0: iteration].mean()[variable]
-        # print(data[iteration - self.twap_period : iteration][variable])
-        # print(f"average: {data[iteration - self.twap_period : iteration].mean()[variable]:,.2f}")
-        return data[iteration - self.twap_period: iteration].mean()[variable]
+        # Before the window fills up, this is the average of all previous iterations
+        # print(data[variable][iteration - self.twap_period : iteration])
+        # print(f"average: {data.metrics.mean(variable):,.2f}")
+        return data.metrics.mean(variable)
 
     def get_bonding_apr_spot(self, chicken):
         m = self.get_btkn_spot_price(chicken)
@@ -321,7 +391,7 @@ class TesterSimple(TesterInterface):
             return 0
         # optimal_time
         t = self.get_optimal_apr_chicken_in_time(chicken)
-        apr = ((1 - self.chicken_in_amm_fee) * m/r * t / (t+u) - 1) * TIME_UNITS_PER_YEAR / t
+        apr = ((1 - self.chicken_in_amm_fee) * m/r * t / (t+u) - 1) * self.config.get_steps_per_year() / t
         """
         print(f"backing ratio: {r:,.2f}")
         print(f"spot price:    {m:,.2f}")
@@ -347,7 +417,7 @@ class TesterSimple(TesterInterface):
         #print(f"previous_spot_price: {previous_spot_price:,.2f}")
         #print(f"current_spot_price:  {current_spot_price:,.2f}")
 
-        return (current_spot_price / previous_spot_price - 1) * TIME_UNITS_PER_YEAR / span
+        return (current_spot_price / previous_spot_price - 1) * self.config.get_steps_per_year() / span
 
     def get_btkn_apr_twap(self, chicken, data, iteration):
         return self.get_twap_metric(chicken, data, iteration, "btkn_apr")
@@ -358,16 +428,31 @@ class TesterSimple(TesterInterface):
     # https://www.desmos.com/calculator/taphbjrugg
     # See also: https://homepage.divms.uiowa.edu/~mbognar/applets/gamma.html
     def get_chicken_in_profit_percentage(self):
-        return np.random.gamma(self.chicken_in_gamma_shape, self.chicken_in_gamma_scale, 1)[0]
+        return self.rng.gamma(self.chicken_in_gamma_shape, self.chicken_in_gamma_scale, 1)[0]
+
+    def get_bond_draws(self, count):
+        """
+        Amounts and target profits of count new bonds, drawn at once.
+        Only for "generator" streams: legacy ones draw them bond by bond, to get the same numbers as before.
+        """
+        if self.config.rng != "generator":
+            return None, None
+        amounts = self.rng.integers(self.config.bond_amount[0], self.config.bond_amount[1], count)
+        target_profits = self.rng.gamma(self.chicken_in_gamma_shape, self.chicken_in_gamma_scale, count)
+        return amounts, target_profits
 
     def get_yield_amount(self, base_amount, yield_percentage, time_units=1):
-        return base_amount * ((1 + yield_percentage) ** (time_units / TIME_UNITS_PER_YEAR) - 1)
+        """
+        @param yield_percentage: Annual yield
+        @param time_units: Number of iterations
+        """
+        return base_amount * ((1 + yield_percentage) ** (time_units / self.config.get_steps_per_year()) - 1)
 
     # Special case before the first chicken in (actually, when bTKN supply is zero)
     # to avoid giving advantage to the first one
     def distribute_yield_pre_chicken_in(self, chicken, chicks, iteration):
         # Pending generated yield
-        generated_yield = self.get_yield_amount(chicken.pending_token_balance(), self.external_yield)
+        generated_yield = self.get_yield_amount(chicken.pending_token_balance(), self.external_yield, self.config.get_yield_steps())
         if generated_yield == 0:
             return
 
@@ -388,21 +473,26 @@ class TesterSimple(TesterInterface):
         return
 
     def distribute_yield(self, chicken, chicks, iteration):
+        # Yield accrues once per yield period (see YIELD_PERIOD), for all its iterations at once,
+        # so short steps don’t pay for minting and distributing rewards every time
+        yield_steps = self.config.get_yield_steps()
+        if iteration % yield_steps != 0:
+            return
         if self.is_before_first_chicken_in(chicken):
             return self.distribute_yield_pre_chicken_in(chicken, chicks, iteration)
         # Reserve generated yield
-        generated_yield = self.get_yield_amount(chicken.reserve_token_balance(), self.external_yield)
+        generated_yield = self.get_yield_amount(chicken.reserve_token_balance(), self.external_yield, yield_steps)
 
         chicken.token.mint(chicken.reserve_account, generated_yield)
 
         # AMM generated yield
         # TODO: use real fees!
-        generated_yield = self.get_yield_amount(chicken.amm.get_value_in_token_A(), self.amm_yield)
+        generated_yield = self.get_yield_amount(chicken.amm.get_value_in_token_A(), self.amm_yield, yield_steps)
 
         #print(f"generated_yield:      {generated_yield:,.2f}")
         chicken.token.mint(chicken.reserve_account, generated_yield)
         # Distribute rewards
-        distributed_amount = chicken.btkn_amm.rewards.distribute_yield(1)
+        distributed_amount = chicken.btkn_amm.rewards.distribute_yield(yield_steps * self.config.get_step_days())
         #print(f"distributed_amount: {distributed_amount:,.2f}")
         for chick in self.get_lp_hodlers(chicken, chicks):
             reward_chick_amount = distributed_amount * chicken.btkn_amm.get_lp_share(chick.account)
@@ -422,26 +512,42 @@ class TesterSimple(TesterInterface):
         p = min(1, 0.1 * 100 / t**2)
         return p
 
+    def is_bond_due(self, chicken, chicks):
+        """ Whether bond can make new bonds: some chicks are available for bonding.
+        Otherwise start_bond is all it does.
+        """
+        return bool(chicks.get_holders(chicken.token) - chicks.bonded - chicks.role_sets[ROLE_TRADER])
+
+    def start_bond(self, chicks, iteration):
+        # Stream of the bond phase, and the order the chicks bond in (which the next phases start from)
+        self.seed(2022, iteration)
+        chicks.shuffle(self.rng)
+
     def bond(self, chicken, chicks, iteration):
-        np.random.seed(2022 * iteration)
-        np.random.shuffle(chicks)
+        self.start_bond(chicks, iteration)
         not_bonded_chicks = self.get_available_for_bonding_chicks(chicken, chicks)
         if iteration == 0:
-            num_new_bonds = BOOTSTRAP_NUM_BONDS
+            num_new_bonds = self.config.bootstrap_num_bonds
         else:
             not_bonded_chicks_len = len(not_bonded_chicks)
-            num_new_bonds = np.random.binomial(not_bonded_chicks_len, self.get_bond_probability(chicken))
+            num_new_bonds = self.rng.binomial(not_bonded_chicks_len, self.get_bond_probability(chicken))
             #print(f"available: {not_bonded_chicks_len:,.2f}")
         #print(f"bonding:   {num_new_bonds:,.2f}")
-        for chick in not_bonded_chicks[:num_new_bonds]:
+        new_bonders = not_bonded_chicks[:num_new_bonds]
+        amounts, target_profits = self.get_bond_draws(len(new_bonders))
+        for position, chick in enumerate(new_bonders):
             chick_balance = chicken.token.balance_of(chick.account)
-            if chick_balance < BOND_AMOUNT[0]:
+            if chick_balance < self.config.bond_amount[0]:
                 continue
-            amount = min(
-                np.random.randint(BOND_AMOUNT[0], BOND_AMOUNT[1], 1)[0],
-                chick_balance
-            )
-            target_profit = self.get_chicken_in_profit_percentage()
+            if amounts is None:
+                amount = min(
+                    self.rng.randint(self.config.bond_amount[0], self.config.bond_amount[1], 1)[0],
+                    chick_balance
+                )
+                target_profit = self.get_chicken_in_profit_percentage()
+            else:
+                amount = min(amounts[position], chick_balance)
+                target_profit = target_profits[position]
             """
             print("\n \033[33m--> Bonding!\033[0m")
             print(chick)
@@ -453,16 +559,17 @@ class TesterSimple(TesterInterface):
         return
 
     def get_avg_outstanding_bond_age(self, chicks, iteration):
-        bonded_chicks = self.get_bonded_chicks(chicks)
+        bonded = chicks.is_bonded()
 
-        if not bonded_chicks:
+        if not bonded.any():
             return 0
 
         # size-weighted average
-        numerator = sum(map(lambda chick: chick.bond_amount * (iteration - chick.bond_time), bonded_chicks))
-        denominator = sum(map(lambda chick: chick.bond_amount, bonded_chicks))
+        bond_amount = chicks.bond_amount[bonded]
+        numerator = np.sum(bond_amount * (iteration - chicks.bond_time[bonded]))
+        denominator = np.sum(bond_amount)
 
-        return numerator / denominator
+        return float(numerator / denominator)
 
     def update_chicken(self, chicken, chicks, data, iteration, debug=False):
         """ Update the state of each user. Users may:
@@ -475,42 +582,57 @@ class TesterSimple(TesterInterface):
         @param data: Logging data
         @param iteration: The iteration step
         """
+        self.update_chicken_out(chicken, chicks, iteration, debug)
+        if self.is_chicken_in_time(chicken, chicks, iteration):
+            self.update_chicken_in(chicken, chicks, data, iteration, debug)
+        return
+
+    def start_update_chicken(self, chicks, iteration):
+        # Stream of the update_chicken phase (which buy_btkn goes on with), and the order of the chicks
+        self.seed(2023, iteration)
+        chicks.shuffle(self.rng)
 
-        np.random.seed(2023 * iteration)
-        np.random.shuffle(chicks)
+    def update_chicken_out(self, chicken, chicks, iteration, debug=False):
+        """ First part of update_chicken: the chicken outs. Without bonds, start_update_chicken is all it does.
+        """
+        self.start_update_chicken(chicks, iteration)
 
-        # ----------- Chicken-out --------------------
-        bonded_chicks = self.get_bonded_chicks(chicks)
+        bonded_indexes = chicks.sort_indexes(chicks.bonded)
         if debug:
-            print(f"Bonded Chicks ini: {len(bonded_chicks)}")
+            print(f"Bonded Chicks ini: {len(bonded_indexes)}")
 
-        for chick in bonded_chicks:
-            backing_ratio = self.get_backing_ratio(chicken)
+        # Check if chicken-out conditions are met and eventually chicken-out
+        self.chicken_out_bonds(chicken, chicks, bonded_indexes, iteration)
+        return
 
-            # Check if chicken-out conditions are met and eventually chicken-out
-            self.chicken_out(chicken, chick, iteration, data)
+    def get_chicken_in_horizon(self, ages, iteration):
+        # Last bond time old enough for a chicken in (see get_chicken_in_ages). One more day, in case of rounding
+        return iteration - min(ages.values(), default=-math.inf) + 1
 
-        # ----------- Chicken-in --------------------
-        if iteration < BOOTSTRAP_PERIOD_CHICKEN_IN:
-            return
+    def is_chicken_in_time(self, chicken, chicks, iteration):
+        """ Whether update_chicken_in has any bond to visit: after the bootstrap period, the oldest
+        bond of the bond calendar is old enough for a chicken in. Otherwise it would do nothing.
+        """
+        if iteration < self.config.bootstrap_period_chicken_in or not chicks.bond_times:
+            return False
+        ages = self.get_chicken_in_ages(chicken, chicks)
+        return chicks.bond_times[0] <= self.get_chicken_in_horizon(ages, iteration)
 
+    def update_chicken_in(self, chicken, chicks, data, iteration, debug=False):
+        """ Second part of update_chicken: the chicken ins, once due (see is_chicken_in_time).
+        """
         # LPs first
-        bonded_chicks = self.get_bonded_chicks_lps(chicks)
         if debug:
-            print(f"Bonded Chicks before LPs: {len(bonded_chicks)}")
+            print(f"Bonded Chicks before LPs: {len(chicks.bonded & chicks.role_sets[ROLE_LP])}")
 
-        for chick in bonded_chicks:
-            # Check if chicken-in conditions are met and eventually chicken-in
-            self.chicken_in(chicken, chick, iteration, data, debug)
+        # Check if chicken-in conditions are met and eventually chicken-in
+        self.chicken_in_bonds(chicken, chicks, True, iteration, data, debug)
 
         # Non LPs afterwards
-        bonded_chicks = self.get_bonded_chicks_non_lps(chicks)
         if debug:
-            print(f"Bonded Chicks before sellers: {len(bonded_chicks)}")
+            print(f"Bonded Chicks before sellers: {len(chicks.bonded - chicks.role_sets[ROLE_LP])}")
 
-        for chick in bonded_chicks:
-            # Check if chicken-in conditions are met and eventually chicken-in
-            self.chicken_in(chicken, chick, iteration, data, debug)
+        self.chicken_in_bonds(chicken, chicks, False, iteration, data, debug)
 
         if debug:
             print(f"Bonded Chicks fin: {len(self.get_bonded_chicks(chicks))}")
@@ -521,7 +643,7 @@ class TesterSimple(TesterInterface):
         return
 
     def is_bootstrap_chicken_out(self, chick, iteration):
-        return iteration <= BOOTSTRAP_PERIOD_CHICKEN_IN and chick.bond_time == 0
+        return iteration <= self.config.bootstrap_period_chicken_in and chick.bond_time == 0
 
     def set_accrual_param(self, new_value):
         self.accrual_param = new_value
@@ -543,6 +665,126 @@ class TesterSimple(TesterInterface):
         assert claimable_btkn_amount < bond_cap or claimable_btkn_amount == 0
         return claimable_btkn_amount, bond_cap
 
+    def get_bond_claims(self, chicken, chicks, indexes, iteration):
+        """ get_claimable_btkn_amount for several bonds at once, as arrays.
+        The operations are the same, so are the results.
+
+        @param chicks: All users
+        @param indexes: Agent indexes of the bonds
+        @return: claimable bTKN amounts, bond caps
+        """
+        backing_ratio = self.get_backing_ratio(chicken)
+        bond_cap = self.get_bond_cap(chicks.bond_amount[indexes], backing_ratio)
+        bond_duration = iteration - chicks.bond_time[indexes]
+        claimable_btkn_amount = bond_cap * bond_duration / (bond_duration + self.accrual_param)
+        assert np.all((claimable_btkn_amount < bond_cap) | (claimable_btkn_amount == 0))
+        return claimable_btkn_amount, bond_cap
+
+    def chicken_out_bonds(self, chicken, chicks, indexes, iteration):
+        """ chicken_out for several bonds, in order.
+        Chicken outs don’t change the bTKN spot price nor the backing ratio (the reserve and
+        the bTKN supply stay the same), so all the decisions are taken at once: profits are
+        computed as arrays, and the probabilities drawn in one go for the bonds not at break
+        even (the same draws as one by one). Only the bonds leaving are then processed.
+
+        @param chicks: All users
+        @param indexes: Agent indexes of the bonds, in order
+        """
+        btkn_price = self.get_btkn_spot_price(chicken)
+        claimable_btkn_amount, _ = self.get_bond_claims(chicken, chicks, indexes, iteration)
+        profit = claimable_btkn_amount * btkn_price - chicks.bond_amount[indexes]
+
+        # skip chicken out for bootstrappers, and bonds at break even
+        bootstrap = (iteration <= self.config.bootstrap_period_chicken_in) & (chicks.bond_time[indexes] == 0)
+        candidates = indexes[~bootstrap & ~(profit > 0)]
+
+        # chicken-out proba
+        leaving = candidates[self.rng.binomial(1, self.chicken_out_probability, len(candidates)) == 1]
+
+        for index in leaving.tolist():
+            chicken.chicken_out(chicks.agents[index])
+            self.chicken_out_counter += 1
+
+        return
+
+    def get_chicken_in_eligibility(self, chicken, chicks, indexes, iteration):
+        """ Whether bonds pass the first checks of chicken_in: something to claim, and at least
+        break even at the current bTKN spot price.
+
+        @param chicks: All users
+        @param indexes: Agent indexes of the bonds
+        """
+        claimable_btkn_amount, _ = self.get_bond_claims(chicken, chicks, indexes, iteration)
+        btkn_spot_price = self.get_btkn_spot_price(chicken)
+        eligible = claimable_btkn_amount != 0
+        if btkn_spot_price > 0:
+            eligible &= ~(claimable_btkn_amount * btkn_spot_price < chicks.bond_amount[indexes])
+        return eligible
+
+    def get_chicken_in_ages(self, chicken, chicks):
+        """ Bond age from which chicken_in acts, per role (see rebond, lp_chicken_in and
+        seller_chicken_in), for the roles with users. Younger bonds are left as they are.
+
+        @param chicks: All users
+        """
+        ages = {}
+        if chicks.role_sets[ROLE_REBONDER]:
+            ages[ROLE_REBONDER] = self.get_rebond_time(chicken)
+        if chicks.role_sets[ROLE_LP]:
+            if self.is_before_first_chicken_in(chicken) or not chicken.amm_iteration_apr < 0.1:
+                ages[ROLE_LP] = -math.inf
+            else:
+                ages[ROLE_LP] = self.get_optimal_apr_chicken_in_time(chicken)
+        if chicks.role_sets[ROLE_SELLER]:
+            ages[ROLE_SELLER] = self.get_optimal_apr_chicken_in_time(chicken)
+        return ages
+
+    def is_chicken_in_due(self, chicks, indexes, ages, iteration):
+        """ Whether bonds are old enough for chicken_in to act.
+
+        @param chicks: All users
+        @param indexes: Agent indexes of the bonds
+        @param ages: From get_chicken_in_ages
+        """
+        roles = chicks.roles[indexes]
+        # Same precedence as in chicken_in: rebonder, LP, seller (and unknown ones raise there)
+        min_age = np.full(len(indexes), -math.inf)
+        for role in [ROLE_SELLER, ROLE_LP, ROLE_REBONDER]:
+            if role in ages:
+                min_age[(roles & role) != 0] = ages[role]
+        return ~(iteration - chicks.bond_time[indexes] < min_age)
+
+    def chicken_in_bonds(self, chicken, chicks, lps, iteration, data, debug=False):
+        """ chicken_in for the bonded LPs (or non LPs), in order, skipping the ones it would
+        leave as they are.
+        Bonds come from the bond calendar of the users, up to the last bond time old enough for
+        any chicken in (see get_chicken_in_ages), so younger ones are not visited at all.
+        Ages and eligibility depend on the state (backing ratio, spot price, accrual parameter),
+        which chicken ins change, so they are evaluated again, for the bonds after the last one
+        visited, only when a chicken in actually changed it.
+
+        @param chicks: All users
+        @param lps: True for the LPs, False for the others
+        """
+        lp_set = chicks.role_sets[ROLE_LP]
+        last_rank = -1
+        while True:
+            state_key = self.get_metric_cache_key(chicken)
+            ages = self.get_chicken_in_ages(chicken, chicks)
+            bonds = chicks.get_bonded_until(self.get_chicken_in_horizon(ages, iteration))
+            bonds = bonds & lp_set if lps else bonds - lp_set
+            indexes = chicks.sort_indexes(bonds)
+            indexes = indexes[chicks.rank[indexes] > last_rank]
+            indexes = indexes[self.is_chicken_in_due(chicks, indexes, ages, iteration)]
+            indexes = indexes[self.get_chicken_in_eligibility(chicken, chicks, indexes, iteration)]
+            for index in indexes.tolist():
+                self.chicken_in(chicken, chicks.agents[index], iteration, data, debug)
+                last_rank = chicks.rank[index]
+                if self.get_metric_cache_key(chicken) != state_key:
+                    break
+            else:
+                return
+
     def chicken_out(self, chicken, chick, iteration, data):
         """ Chicken  out defines leaving users. User are only allowed to leave if
         the break-even point of the investment is not reached with a predefined
@@ -565,7 +807,7 @@ class TesterSimple(TesterInterface):
             return
 
         # if break even is reached or chicken-out proba (10%) is not fulfilled
-        if profit > 0 or np.random.binomial(1, self.chicken_out_probability) == 0:
+        if profit > 0 or self.rng.binomial(1, self.chicken_out_probability) == 0:
             return
 
         #print("\n \033[33m--> Chickening out!\033[0m")
@@ -577,7 +819,7 @@ class TesterSimple(TesterInterface):
         return
 
     def is_bootstrap_chicken_in(self, chick, iteration):
-        return iteration == BOOTSTRAP_PERIOD_CHICKEN_IN and chick.bond_time == 0
+        return iteration == self.config.bootstrap_period_chicken_in and chick.bond_time == 0
 
     def get_permanent_amm_amounts(self, chicken, bond_cap, claimable_btkn_amount):
         backing_ratio = self.get_backing_ratio(chicken)
@@ -610,6 +852,9 @@ class TesterSimple(TesterInterface):
         return
 
     def get_rebond_time(self, chicken):
+        return self.memoize("rebond_time", chicken, self.compute_rebond_time)
+
+    def compute_rebond_time(self, chicken):
         from scipy.special import lambertw
         btkn_spot_price = self.get_btkn_spot_price(chicken)
         backing_ratio = self.get_backing_ratio(chicken)
@@ -617,7 +862,7 @@ class TesterSimple(TesterInterface):
         if btkn_spot_price == 0 or backing_ratio >= reduced_spot_price:
             #print(f"btkn price:     {btkn_spot_price}")
             #print(f"redemption price: {backing_ratio}")
-            return ITERATIONS
+            return self.config.iterations
 
         w = lambertw(math.exp(1) * backing_ratio / reduced_spot_price).real
         rebond_time = w / (1 - w)
@@ -633,14 +878,14 @@ class TesterSimple(TesterInterface):
         print(f"\033[34mFinal rebond time:          {self.accrual_param * rebond_time.real:,.2f}\033[0m")
         """
 
-        return min(self.accrual_param * rebond_time.real, ITERATIONS)
+        return min(self.accrual_param * rebond_time.real, self.config.iterations)
 
     def rebond(self, chicken, chick, claimable_btkn_amount, iteration, debug=False):
         # If it’s a rebonder and the optimal point hasn’t been reached yet
         rebond_time = self.get_rebond_time(chicken)
         # If the optimal point hasn’t been reached yet, or liquidity is too thin
         if iteration - chick.bond_time < rebond_time \
-           or claimable_btkn_amount > CHICKEN_IN_LIQUIDITY_FACTOR * chicken.btkn.balance_of(chicken.btkn_amm.pool_account):
+           or claimable_btkn_amount > self.config.chicken_in_liquidity_factor * chicken.btkn.balance_of(chicken.btkn_amm.pool_account):
             if debug:
                 print(f"chicken_in_time: {chicken_in_time:,.2f}")
                 print(f"time gone:       {iteration - chick.bond_time:,.2f}")
@@ -661,7 +906,7 @@ class TesterSimple(TesterInterface):
         )
         #print("Rebond -> sell bLQTY")
         bought_token_amount = chicken.btkn_amm.swap_B_for_A(chick.account, btkn_swap_amount)
-        if bought_token_amount < BOND_AMOUNT[0]:
+        if bought_token_amount < self.config.bond_amount[0]:
             #print(f"max swap:     {max_swap_amount:,.2f}")
             return 0
         # bond again
@@ -681,12 +926,12 @@ class TesterSimple(TesterInterface):
             print(f" - {chicken.token.symbol} bonded:  {chick.bond_amount:,.2f}")
             print(f" - {chicken.btkn.symbol} balance: {chicken.btkn.balance_of(chick.account):,.2f}")
 
-        assert chick.bond_amount > BOND_AMOUNT[0]
+        assert chick.bond_amount > self.config.bond_amount[0]
 
         return 1
 
     def lp_chicken_in(self, chicken, chick, claimable_btkn_amount, iteration, debug=False):
-        assert iteration >= BOOTSTRAP_PERIOD_CHICKEN_IN
+        assert iteration >= self.config.bootstrap_period_chicken_in
 
         is_first_chicken_in = self.is_before_first_chicken_in(chicken)
         # If it’s an LP it will chicken in if:
@@ -712,7 +957,7 @@ class TesterSimple(TesterInterface):
         #print("\n \033[32mAdd liquidity!\033[0m \n")
         # First one sets the price
         if is_first_chicken_in:
-            token_liquidity_amount = claimable_btkn_amount * INITIAL_BTKN_PRICE
+            token_liquidity_amount = claimable_btkn_amount * self.config.initial_btkn_price
             assert chicken.token.balance_of(chick.account) >= token_liquidity_amount
         else:
             liquidity_amount = chicken.btkn_amm.get_A_amount_for_liquidity(claimable_btkn_amount)
@@ -745,7 +990,7 @@ class TesterSimple(TesterInterface):
         chicken_in_time = self.get_optimal_apr_chicken_in_time(chicken)
         # If the optimal point hasn’t been reached yet, or liquidity is too thin
         if iteration - chick.bond_time < chicken_in_time \
-           or claimable_btkn_amount > CHICKEN_IN_LIQUIDITY_FACTOR * chicken.btkn.balance_of(chicken.btkn_amm.pool_account):
+           or claimable_btkn_amount > self.config.chicken_in_liquidity_factor * chicken.btkn.balance_of(chicken.btkn_amm.pool_account):
             if debug:
                 print(f"chicken_in_time: {chicken_in_time:,.2f}")
                 print(f"time gone:       {iteration - chick.bond_time:,.2f}")
@@ -779,7 +1024,7 @@ class TesterSimple(TesterInterface):
         @param data: Logging data
         """
 
-        if iteration < BOOTSTRAP_PERIOD_CHICKEN_IN:
+        if iteration < self.config.bootstrap_period_chicken_in:
             return
 
         claimable_btkn_amount, bond_cap = self.get_claimable_btkn_amount(chicken, chick, iteration)
@@ -842,18 +1087,25 @@ class TesterSimple(TesterInterface):
 
         return
 
+    def is_arbitrage_triggered(self, chicken, iteration):
+        # bTKN below its redemption price, once redemptions are open
+        if iteration < self.config.bootstrap_period_redeem:
+            return False
+        # 0.99 to account for fees and avoid rounding issues
+        return self.get_btkn_spot_price(chicken) < 0.99 * self.get_backing_ratio(chicken)
+
     def arbitrage_btkn(self, chicken, chicks, iteration, debug=False):
-        if iteration < BOOTSTRAP_PERIOD_REDEEM:
+        if not self.is_arbitrage_triggered(chicken, iteration):
             return
         if debug:
             print(" -- arbitrage_btkn")
 
         # Buy -> Redeem
         for chick in self.get_traders_with_token(chicken, chicks):
+            if not self.is_arbitrage_triggered(chicken, iteration):
+                return
             btkn_spot_price = self.get_btkn_spot_price(chicken)
             backing_ratio = self.get_backing_ratio(chicken)
-            if btkn_spot_price >= 0.99 * backing_ratio: # to account for fees and avoid rounding issues
-                return
             if debug:
                 print("Buy -> Redeem")
                 print(chicken.btkn_amm)
@@ -885,10 +1137,10 @@ class TesterSimple(TesterInterface):
 
         # Redeem -> Buy
         for chick in self.get_traders_with_btkn(chicken, chicks):
+            if not self.is_arbitrage_triggered(chicken, iteration):
+                return
             btkn_spot_price = self.get_btkn_spot_price(chicken)
             backing_ratio = self.get_backing_ratio(chicken)
-            if btkn_spot_price >= 0.99 * backing_ratio: # to account for fees and avoid rounding issues
-                return
             if debug:
                 print("Redeem -> Buy")
                 print(chicken.btkn_amm)
@@ -929,7 +1181,17 @@ class TesterSimple(TesterInterface):
             print("")
             print(" -- buy_btkn")
 
-        for chick in self.get_traders_with_token(chicken, chicks):
+        traders = self.get_traders_with_token(chicken, chicks)
+        # Generator streams draw all the premiums at once; legacy ones one by one, in between
+        # the draws of get_fair_price, as before
+        premiums = None
+        if self.config.rng == "generator":
+            premiums = self.rng.normal(
+                self.config.buy_premium_percentage_mean,
+                self.config.buy_premium_percentage_sd,
+                len(traders)
+            )
+        for position, chick in enumerate(traders):
             btkn_spot_price = self.get_btkn_spot_price(chicken)
             btkn_fair_price = self.get_fair_price(chicken)
             btkn_redemption_price = self.get_backing_ratio(chicken)
@@ -937,14 +1199,17 @@ class TesterSimple(TesterInterface):
                 print(f"btkn_spot_price:        {btkn_spot_price:,.6f}")
                 print(f"btkn_fair_price:        {btkn_fair_price:,.6f}")
                 print(f"btkn_redemption_price:  {btkn_redemption_price:,.6f}")
-            arbitrage_premium_percentage = np.random.normal(
-                BUY_PREMIUM_PERCENTAGE_MEAN,
-                BUY_PREMIUM_PERCENTAGE_SD
-            )
+            if premiums is None:
+                arbitrage_premium_percentage = self.rng.normal(
+                    self.config.buy_premium_percentage_mean,
+                    self.config.buy_premium_percentage_sd
+                )
+            else:
+                arbitrage_premium_percentage = premiums[position]
             target_price = min(
                 (1 - arbitrage_premium_percentage) * btkn_redemption_price \
                 + arbitrage_premium_percentage * btkn_fair_price,
-                BUY_PRICE_CAP
+                self.config.buy_price_cap
             )
             if btkn_spot_price >= target_price:
                 return
@@ -1022,8 +1287,8 @@ class TesterSimple(TesterInterface):
         return
 
     def get_btkn_amm_slippage(self, chicken, debug=False):
-        btkn_amount = chicken.btkn_amm.token_B_balance() * FRACTION_TO_SWAP
-        token_amount = chicken.btkn_amm.token_A_balance() * FRACTION_TO_SWAP
+        btkn_amount = chicken.btkn_amm.token_B_balance() * self.config.fraction_to_swap
+        token_amount = chicken.btkn_amm.token_A_balance() * self.config.fraction_to_swap
 
         sell_slippage = chicken.btkn_amm.get_slippage_from_input_B(btkn_amount, debug)
         try:
@@ -1,3 +1,6 @@
+import bisect
+import numpy as np
+
 class User():
     def __init__(self, account):
         self.account = account
@@ -15,3 +18,249 @@ class User():
         if self.bond_amount > 0:
             bond_string = f"\n Bonded {self.bond_amount:,.2f} on day {self.bond_time}"
         return f"User with account \033[35m{self.account}\033[0m" + bond_string
+
+# Roles of agents in an AgentPopulation, as bits of its `roles` array
+ROLE_REBONDER = 1
+ROLE_LP = 2
+ROLE_SELLER = 4
+ROLE_TRADER = 8
+
+class AgentPopulation():
+    """
+    Users as a struct of arrays: one NumPy array per field (roles as a bitmask, bond_amount,
+    bond_time, bond_target_profit, buy_price), indexed by agent, so that queries over all of them
+    are vectorized masks.
+    It can be used as the list of User objects it replaces: iterating or indexing it gives
+    Agent views with the same attributes, in the current order of the population
+    (see shuffle and sort), and select(mask) gives the list of those matching a mask.
+    Sets of agent indexes are also maintained as the state changes, so that queries on them
+    cost what they return: bonded agents (updated on bond_amount writes through set_bond_amount,
+    i.e. Agent views), agents per role, holders of tokens (see get_holders), and bonded agents
+    by bond time (see get_bonded_until).
+    """
+    def __init__(self, accounts):
+        num_agents = len(accounts)
+        self.accounts = list(accounts)
+        self.roles = np.zeros(num_agents, dtype=np.uint8)
+        self.bond_amount = np.zeros(num_agents)
+        # Float, as events can happen in between iterations (see lib/events.py)
+        self.bond_time = np.zeros(num_agents)
+        self.bond_target_profit = np.zeros(num_agents)
+        self.buy_price = np.zeros(num_agents)
+        # Current order of the agents, as their indexes, and position of each agent in it
+        self.order = np.arange(num_agents)
+        self.rank = np.arange(num_agents)
+        self.agents = [Agent(self, index) for index in range(num_agents)]
+        self.agent_ids = {account: index for index, account in enumerate(self.accounts)}
+        self.bonded = set()
+        self.role_sets = {role: set() for role in [ROLE_REBONDER, ROLE_LP, ROLE_SELLER, ROLE_TRADER]}
+        # Calendar of the bonded agents: their indexes by bond time, and the bond times in use, sorted
+        self.bond_calendar = {}
+        self.bond_times = []
+        # Account IDs in the ledger balances are read from, see get_balances
+        self.ledger = None
+        self.account_ids = None
+
+    def __len__(self):
+        return len(self.agents)
+
+    def __iter__(self):
+        agents = self.agents
+        return (agents[index] for index in self.order.tolist())
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self.agents[index] for index in self.order[position].tolist()]
+        return self.agents[self.order[position]]
+
+    def shuffle(self, rng=np.random):
+        # Same draws (and same resulting order) as rng.shuffle on the list of users
+        rng.shuffle(self.order)
+        self.rank[self.order] = np.arange(len(self.order))
+
+    def sort(self, key):
+        self.order = np.array(sorted(self.order.tolist(), key=lambda index: key(self.agents[index])), dtype=self.order.dtype)
+        self.rank[self.order] = np.arange(len(self.order))
+
+    def set_role(self, role, start, end):
+        """
+        Add a role to the agents from position start to end (excluded), in the current order.
+        """
+        indexes = self.order[start:end]
+        self.roles[indexes] |= role
+        self.role_sets[role].update(indexes.tolist())
+
+    def update_role(self, index, role, value):
+        if value:
+            self.roles[index] |= role
+            self.role_sets[role].add(index)
+        else:
+            self.roles[index] &= ~np.uint8(role)
+            self.role_sets[role].discard(index)
+
+    def set_bond_amount(self, index, value):
+        self.bond_amount[index] = value
+        if value > 0:
+            if index not in self.bonded:
+                self.bonded.add(index)
+                self.add_to_calendar(index)
+        elif index in self.bonded:
+            self.bonded.discard(index)
+            self.remove_from_calendar(index)
+
+    def set_bond_time(self, index, value):
+        if index in self.bonded:
+            self.remove_from_calendar(index)
+            self.bond_time[index] = value
+            self.add_to_calendar(index)
+        else:
+            self.bond_time[index] = value
+
+    def add_to_calendar(self, index):
+        bond_time = self.bond_time[index].item()
+        day = self.bond_calendar.get(bond_time)
+        if day is None:
+            day = self.bond_calendar[bond_time] = set()
+            bisect.insort(self.bond_times, bond_time)
+        day.add(index)
+
+    def remove_from_calendar(self, index):
+        bond_time = self.bond_time[index].item()
+        day = self.bond_calendar[bond_time]
+        day.discard(index)
+        if not day:
+            del self.bond_calendar[bond_time]
+            del self.bond_times[bisect.bisect_left(self.bond_times, bond_time)]
+
+    def get_bonded_until(self, bond_time):
+        """
+        Set of indexes of the bonded agents with a bond time up to bond_time (included).
+        It only goes through the days of the calendar up to bond_time.
+        """
+        end = bisect.bisect_right(self.bond_times, bond_time)
+        return set().union(*[self.bond_calendar[day] for day in self.bond_times[:end]])
+
+    def get_holders(self, token):
+        """
+        Set of indexes of the agents with a positive balance of token, kept up to date by the token.
+        It’s built on the first call.
+        """
+        for holder_index in token.holder_indexes:
+            if holder_index.population is self:
+                return holder_index.holders
+        holder_index = HolderIndex(self, token)
+        token.holder_indexes.append(holder_index)
+        return holder_index.holders
+
+    def has_role(self, role):
+        return (self.roles & role) != 0
+
+    def is_bonded(self):
+        return self.bond_amount > 0
+
+    def get_balances(self, token):
+        """
+        Balances of all the agents in a token (or Ledger token), by agent index.
+        """
+        ledger = getattr(token, "ledger", None)
+        if ledger is None:
+            return token.balances_of(self.accounts)
+        if ledger is not self.ledger:
+            self.ledger = ledger
+            self.account_ids = ledger.get_account_ids(self.accounts)
+        return token.balances_of(self.account_ids)
+
+    def select(self, mask):
+        """
+        Agents where mask (by agent index) is true, in the current order.
+        """
+        agents = self.agents
+        return [agents[index] for index in self.order[mask[self.order]].tolist()]
+
+    def sort_indexes(self, indexes):
+        """
+        Array of the given agent indexes (e.g. a maintained set), in the current order.
+        """
+        indexes = np.fromiter(indexes, dtype=self.order.dtype, count=len(indexes))
+        return indexes[np.argsort(self.rank[indexes])]
+
+    def select_indexes(self, indexes):
+        """
+        Agents with the given indexes (e.g. a maintained set), in the current order.
+        """
+        agents = self.agents
+        return [agents[index] for index in self.sort_indexes(indexes).tolist()]
+
+class HolderIndex():
+    """
+    Agents of a population with a positive balance of a token.
+    The token calls update() on every balance change out of overlays (see Token.update_holders).
+    """
+    def __init__(self, population, token):
+        self.population = population
+        self.holders = set(np.flatnonzero(population.get_balances(token) > 0).tolist())
+
+    def update(self, account, balance):
+        index = self.population.agent_ids.get(account)
+        if index is None:
+            return
+        if balance > 0:
+            self.holders.add(index)
+        else:
+            self.holders.discard(index)
+
+class Agent():
+    """
+    View of one agent of an AgentPopulation, with the attributes of User.
+    """
+    __slots__ = ("population", "index")
+
+    def __init__(self, population, index):
+        self.population = population
+        self.index = index
+
+    def get_role(self, role):
+        return bool(self.population.roles[self.index] & role)
+
+    def set_role(self, role, value):
+        self.population.update_role(self.index, role, value)
+
+    @property
+    def account(self):
+        return self.population.accounts[self.index]
+
+    @property
+    def bond_amount(self):
+        return self.population.bond_amount[self.index].item()
+    @bond_amount.setter
+    def bond_amount(self, value):
+        self.population.set_bond_amount(self.index, value)
+
+    @property
+    def bond_time(self):
+        return self.population.bond_time[self.index].item()
+    @bond_time.setter
+    def bond_time(self, value):
+        self.population.set_bond_time(self.index, value)
+
+    @property
+    def bond_target_profit(self):
+        return self.population.bond_target_profit[self.index].item()
+    @bond_target_profit.setter
+    def bond_target_profit(self, value):
+        self.population.bond_target_profit[self.index] = value
+
+    @property
+    def buy_price(self):
+        return self.population.buy_price[self.index].item()
+    @buy_price.setter
+    def buy_price(self, value):
+        self.population.buy_price[self.index] = value
+
+    rebonder = property(lambda self: self.get_role(ROLE_REBONDER), lambda self, value: self.set_role(ROLE_REBONDER, value))
+    lp = property(lambda self: self.get_role(ROLE_LP), lambda self, value: self.set_role(ROLE_LP, value))
+    seller = property(lambda self: self.get_role(ROLE_SELLER), lambda self, value: self.set_role(ROLE_SELLER, value))
+    trader = property(lambda self: self.get_role(ROLE_TRADER), lambda self, value: self.set_role(ROLE_TRADER, value))
+
+    def __str__(self):
+        return User.__str__(self)
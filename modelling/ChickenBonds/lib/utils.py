@@ -1,11 +1,11 @@
-from lib.constants import *
+from lib.config import *
 
-def get_amm_iteration_apr(amm, previous_accrued_fees_A, previous_accrued_fees_B, previous_accrued_fees_LP):
+def get_amm_iteration_apr(amm, previous_accrued_fees_A, previous_accrued_fees_B, previous_accrued_fees_LP, config):
     accrued_fees_A = amm.fees_accrued_A
     accrued_fees_B = amm.fees_accrued_B
     accrued_fees_LP = amm.fees_accrued_LP
     if hasattr(amm, "rewards"):
-        rewards_A = amm.rewards.get_amount_to_distribute(1)
+        rewards_A = amm.rewards.get_amount_to_distribute(config.get_step_days())
     else:
         rewards_A = 0
 
@@ -18,7 +18,7 @@ def get_amm_iteration_apr(amm, previous_accrued_fees_A, previous_accrued_fees_B,
         amm.get_lp_value_in_token_A(previous_accrued_fees_LP)
     total_fees_in_A = amm.get_accrued_fees_in_token_A()
     gains_in_A = total_fees_in_A - previous_total_fees_in_A + rewards_A
-    iteration_apr = TIME_UNITS_PER_YEAR * gains_in_A / amm_token_A_value
+    iteration_apr = config.get_steps_per_year() * gains_in_A / amm_token_A_value
     """
     print(f"previous fees in A:     {previous_total_fees_in_A:,.2f}")
     print(f"total fees in A:        {total_fees_in_A:,.2f}")
@@ -28,12 +28,12 @@ def get_amm_iteration_apr(amm, previous_accrued_fees_A, previous_accrued_fees_B,
     """
     return iteration_apr, accrued_fees_A, accrued_fees_B, accrued_fees_LP
 
-def get_amm_average_apr(data, iteration):
-    if iteration <= AMM_APR_PERIOD:
+def get_amm_average_apr(data, iteration, config):
+    if iteration <= config.amm_apr_period:
         return 0
-    #print(data[iteration - AMM_APR_PERIOD : iteration]["amm_iteration_apr"])
-    #print(f"average: {data[iteration - AMM_APR_PERIOD : iteration].mean()['amm_iteration_apr']:,.2f}")
-    return data[iteration - AMM_APR_PERIOD : iteration].mean()["amm_iteration_apr"]
+    #print(data["amm_iteration_apr"][iteration - config.amm_apr_period : iteration])
+    #print(f"average: {data.metrics.mean('amm_iteration_apr'):,.2f}")
+    return data.metrics.mean("amm_iteration_apr")
 
 def get_chick_total_token_value(chicken, chick):
     token_amount = chicken.token.balance_of(chick.account)
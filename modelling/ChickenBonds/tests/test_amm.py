@@ -0,0 +1,91 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import inspect
+import pickle
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pytest
+from lib import erc_token
+from lib.amm import amm_base, uniswap, stableswap, constant_price, amm_mock_price
+
+
+def get_pool(pool_class, *args):
+    token_A = erc_token.Token('LUSD')
+    token_B = erc_token.Token('bLUSD')
+    pool = pool_class("AMM", token_A, token_B, 0.003, *args)
+    token_A.mint("lp", 1000)
+    token_B.mint("lp", 1000)
+    pool.add_liquidity("lp", 500, 500)
+    if pool_class == amm_mock_price.AmmMockPrice:
+        pool.set_price_B(1.25)
+    token_A.mint("trader", 100)
+    token_B.mint("trader", 100)
+    return pool
+
+POOLS = [
+    (uniswap.UniswapPool, ()),
+    (stableswap.StableSwapPool, (10,)),
+    (constant_price.ConstantPricePool, ()),
+    (amm_mock_price.AmmMockPrice, ()),
+]
+
+
+class TestQuote:
+    """ Test suite for the pure quote of AMM swaps."""
+
+    @pytest.mark.parametrize("pool_class, args", POOLS)
+    def test_quote_matches_swap(self, pool_class, args):
+        """ Test quotes leave the pool alone, and match the swaps they quote."""
+        pool = get_pool(pool_class, *args)
+        for direction, swap in [(amm_base.SWAP_A_FOR_B, pool.swap_A_for_B), (amm_base.SWAP_B_FOR_A, pool.swap_B_for_A)]:
+            state = pool.get_state()
+            supplies = pool.token_A.total_supply, pool.token_B.total_supply
+
+            output_amount, fee_amount, new_state = pool.quote(direction, 50, state)
+
+            assert pool.get_state() == state
+            assert (pool.token_A.total_supply, pool.token_B.total_supply) == supplies
+            assert swap("trader", 50) == output_amount
+            assert fee_amount == pytest.approx(50 * pool.fee)
+            assert new_state[:2] == pytest.approx(pool.get_state()[:2])
+
+    def test_quote_is_pure(self):
+        """ Test the same state always gives the same quote, also in another process."""
+        pool = get_pool(stableswap.StableSwapPool, 10)
+        state = pool.get_state()
+        quote = pool.quote(amm_base.SWAP_A_FOR_B, 50, state)
+
+        assert stableswap.StableSwapPool.quote(amm_base.SWAP_A_FOR_B, 50, state) == quote
+        assert {state: quote}[pickle.loads(pickle.dumps(state))] == quote
+        assert pickle.loads(pickle.dumps(pool.quote))(amm_base.SWAP_A_FOR_B, 50, state) == quote
+
+
+class TestStateVersion:
+    """ Test suite for the state version of AMMs."""
+
+    def test_state_version(self):
+        """ Test the version increases with swaps, time and overlays, and only then."""
+        pool = get_pool(uniswap.UniswapPool)
+        version = pool.get_state_version()
+        pool.get_token_B_price()
+        assert pool.get_state_version() == version
+
+        for change in [
+            lambda: pool.swap_A_for_B("trader", 10),
+            lambda: pool.set_block_timestamp(1),
+        ]:
+            change()
+            assert pool.get_state_version() > version
+            version = pool.get_state_version()
+
+        with pool.overlay():
+            for i in range(10):
+                pool.set_block_timestamp(i)
+            inner_version = pool.get_state_version()
+        assert pool.get_state_version() > inner_version
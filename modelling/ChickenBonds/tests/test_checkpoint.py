@@ -0,0 +1,69 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import inspect
+import warnings
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import numpy as np
+import pytest
+import chicken_bonds
+from lib import config, fork, testers
+
+
+class TestCheckpoint:
+    """ Test suite for simulation snapshots."""
+
+    def test_resume_is_identical(self, tmp_path):
+        """ Test a run resumed from a checkpoint matches an uninterrupted one."""
+        warnings.simplefilter("ignore")
+        sim_config = config.SimConfig(iterations=30)
+        checkpoint_file = str(tmp_path / "checkpoint.pkl")
+
+        _, _, full = chicken_bonds.simulate(
+            testers.TesterSimple(sim_config),
+            checkpoint_interval=20,
+            checkpoint_file=checkpoint_file
+        )
+        tester = testers.TesterSimple()
+        _, _, resumed = chicken_bonds.simulate(tester, resume=True, checkpoint_file=checkpoint_file)
+
+        assert tester.config == sim_config
+        assert len(resumed) == len(full) == 30
+        assert np.array_equal(
+            resumed.get_dataframe().values,
+            full.get_dataframe().values,
+            equal_nan=True
+        )
+
+    def test_fork(self):
+        """ Test forks share the warm prefix and diverge only after it."""
+        warnings.simplefilter("ignore")
+        sim_config = config.SimConfig(iterations=30)
+        _, _, full = chicken_bonds.simulate(testers.TesterSimple(sim_config))
+
+        warm_sim = chicken_bonds.warm_up(testers.TesterSimple(sim_config), 20)
+        results = chicken_bonds.run_forks(
+            warm_sim,
+            {
+                "same": lambda sim: None,
+                "shock": lambda sim: fork.shock_natural_rate(sim, 3),
+            },
+            workers=1
+        )
+
+        assert len(warm_sim["recorder"]) == 20
+        assert len(results.suffixes["same"]) == 10
+        assert np.array_equal(results.get_dataframe("same").values, full.get_dataframe().values, equal_nan=True)
+        shock = results.get_dataframe("shock")
+        assert np.array_equal(shock.values[:20], full.get_dataframe().values[:20], equal_nan=True)
+        assert not np.allclose(shock["natural_rate"][20:], full["natural_rate"][20:])
+        assert chicken_bonds._fork_base is None
+
+        empty = chicken_bonds.run_forks(warm_sim, {}, workers=2)
+        assert empty.suffixes == {}
@@ -0,0 +1,68 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import inspect
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import dataclasses
+import pytest
+from lib import config, constants
+
+
+class TestSimConfig:
+    """ Test suite for the simulation config."""
+
+    def test_defaults(self):
+        """ Test defaults match the constants module."""
+        sim_config = config.SimConfig()
+
+        assert sim_config.iterations == constants.ITERATIONS
+        assert sim_config.num_traders == constants.NUM_TRADERS
+        assert sim_config.initial_accrual_param == constants.INITIAL_ACCRUAL_PARAM
+        assert sim_config.buy_price_cap == constants.BUY_PRICE_CAP
+
+    def test_immutable_and_hashable(self):
+        """ Test configs can be used as dict keys but not modified."""
+        sim_config = config.SimConfig()
+
+        assert {sim_config: 1}[config.SimConfig()] == 1
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            sim_config.iterations = 10
+
+    def test_replace_recomputes_derived(self):
+        """ Test derived values follow the changed parameters."""
+        sim_config = config.SimConfig().replace(target_average_age=60, num_chicks=200)
+
+        assert sim_config == config.SimConfig(target_average_age=60, num_chicks=200)
+        assert sim_config.num_traders == 125
+        assert sim_config.replace(initial_accrual_param=5.8).initial_accrual_param == 5.8
+
+    def test_replace_keeps_explicit_derived(self):
+        """ Test derived values given explicitly are kept by later replaces."""
+        sim_config = config.SimConfig(buy_price_cap=5.0)
+        replaced = sim_config.replace(external_yield=0.1, initial_btkn_price=2)
+
+        assert replaced.buy_price_cap == 5.0
+        assert replaced.curve_v2_initial_price == 2
+        assert replaced == config.SimConfig(buy_price_cap=5.0, external_yield=0.1, initial_btkn_price=2)
+        assert replaced.replace(buy_price_cap=None).buy_price_cap == 4
+        assert config.SimConfig(num_traders=10).replace(num_chicks=200).num_traders == 10
+
+    def test_time_base(self):
+        """ Test annualization and yield accrual follow the length of the step."""
+        daily = config.SimConfig()
+        hourly = config.SimConfig(step_seconds=3600)
+
+        assert daily.get_steps_per_year() == constants.TIME_UNITS_PER_YEAR
+        assert daily.get_yield_steps() == 1
+        assert hourly.get_steps_per_year() == 24 * constants.TIME_UNITS_PER_YEAR
+        assert hourly.get_yield_steps() == 24
+        assert hourly.get_step_days() == 1 / 24
+        assert hourly.replace(yield_period=3600).get_yield_steps() == 1
+        with pytest.raises(AssertionError):
+            config.SimConfig(step_seconds=7000)
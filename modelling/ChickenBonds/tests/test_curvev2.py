@@ -0,0 +1,160 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import inspect
+import copy
+import math
+import warnings
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pytest
+import numpy as np
+import chicken_bonds
+from lib import config, testers
+from lib.amm import amm_base, curvev2
+
+
+@pytest.fixture(scope="module")
+def pool():
+    warnings.simplefilter("ignore")
+    chicken, _, _ = chicken_bonds.simulate(testers.TesterSimple(config.SimConfig(iterations=40)))
+    return chicken.btkn_amm
+
+
+class TestCurveV2Prices:
+    """ Test suite for the Curve V2 pool pricing."""
+
+    def test_marginal_price(self, pool):
+        """ Test the analytic price matches the limit of small trades."""
+        for i, j in [(0, 1), (1, 0)]:
+            amount = pool.balances[i] * 1e-6
+            quoted = pool.get_dy(i, j, amount) / amount
+            assert pool.get_marginal_price(i, j) == pytest.approx(quoted, rel=1e-5)
+
+        price_B = pool.get_token_B_price()
+        assert pool.get_token_A_price() * price_B == pytest.approx((1 - pool._fee(pool.xp()))**2)
+
+    def test_post_trade_price(self, pool):
+        """ Test the post trade price doesn’t change the pool, and matches the traded pool."""
+        dx = pool.balances[0] * 0.05
+        balances = pool.balances.copy()
+        total_supply = pool.token_B.total_supply
+
+        price = pool.get_token_B_price(dx)
+
+        assert pool.balances == balances
+        assert pool.token_B.total_supply == total_supply
+        assert price > pool.get_token_B_price()
+
+        with pool.overlay():
+            # Keep price_scale where it is, and skip the admin fees claim (which
+            # recomputes D with newton_D), so that the quote and the trade are on the same curve
+            pool.adjustment_step = math.inf
+            pool.not_adjusted = False
+            price = pool.get_token_B_price(dx)
+            pool.token_A.mint(curvev2.TMP_ACCOUNT, dx)
+            output_amount, _ = pool._exchange(curvev2.TMP_ACCOUNT, 0, 1, dx, 0, curvev2.TMP_ACCOUNT)
+            traded_price = pool.get_token_B_price()
+        assert price == pytest.approx(max(traded_price, dx / output_amount), rel=1e-6)
+        assert pool.adjustment_step < math.inf
+        assert pool.balances == balances
+
+    def test_overlay(self, pool):
+        """ Test swaps inside an overlay are discarded, in the pool and in the ledgers."""
+        balances = pool.balances.copy()
+        price_scale = pool.price_scale
+        pool_balance = pool.token_B_balance()
+        supply_A = pool.token_A.total_supply
+
+        with pool.overlay():
+            pool.token_A.mint("whale", 1000)
+            output_amount = pool.swap_A_for_B("whale", 1000)
+            assert pool.token_B.balance_of("whale") == output_amount > 0
+            assert pool.token_B_balance() == pool_balance - output_amount
+            assert pool.balances[0] == balances[0] + 1000
+
+        assert pool.balances == balances
+        assert pool.price_scale == price_scale
+        assert pool.token_B_balance() == pool_balance
+        assert pool.token_A.total_supply == supply_A
+        assert pool.token_B.balance_of("whale") == 0
+        assert isinstance(pool.token_A.balances, dict)
+
+    def test_quote(self, pool):
+        """ Test the pure quote matches _exchange, without touching the pool."""
+        state = pool.get_state()
+        supply_A = pool.token_A.total_supply
+        for direction in [amm_base.SWAP_A_FOR_B, amm_base.SWAP_B_FOR_A]:
+            dx = pool.balances[direction] * 0.05
+            output_amount, fee_amount, new_state = pool.quote(direction, dx, state)
+
+            assert pool.get_state() == state
+            assert pool.token_A.total_supply == supply_A
+            with pool.overlay():
+                pool.coins[direction].mint(curvev2.TMP_ACCOUNT, dx)
+                assert pool._exchange(curvev2.TMP_ACCOUNT, direction, 1 - direction, dx, 0, curvev2.TMP_ACCOUNT) == (output_amount, fee_amount)
+                assert new_state.balances == tuple(pool.balances)
+
+    def test_batch_solvers(self, pool):
+        """ Test the vectorized solvers give the same results as the scalar ones."""
+        for i, j in [(0, 1), (1, 0)]:
+            dx = np.linspace(0, pool.balances[i], 50)
+            dy = pool.get_dy_batch(i, j, dx)
+            assert dy[0] == 0
+            assert list(dy[1:]) == [pool.get_dy(i, j, amount) for amount in dx[1:]]
+
+        A_gamma = pool._A_gamma()
+        x = [np.linspace(1000, 20000, 50), np.linspace(20000, 1000, 50)]
+        D = pool.newton_D_batch(A_gamma[0], A_gamma[1], x)
+        assert list(D) == [pool.newton_D_bigint(A_gamma[0], A_gamma[1], [x0, x1]) for x0, x1 in zip(*x)]
+
+    def test_solver_cache(self, pool):
+        """ Test memoized and warm started solutions match the ones from a cold start."""
+        A_gamma = pool._A_gamma()
+        x = [10000, 11000]
+        cold_D, _ = pool.solve_D(A_gamma[0], A_gamma[1], x.copy())
+        stats = pool.get_solver_stats()["newton_D"].copy()
+        assert pool.newton_D_bigint(A_gamma[0], A_gamma[1], x.copy()) == pytest.approx(cold_D, rel=1e-14)
+        assert pool.newton_D_bigint(A_gamma[0], A_gamma[1], x.copy()) == pytest.approx(cold_D, rel=1e-14)
+        assert pool.get_solver_stats()["newton_D"]["calls"] == stats["calls"] + 2
+        assert pool.get_solver_stats()["newton_D"]["cache_hits"] == stats["cache_hits"] + 1
+
+        # Warm starts (off by default) from both sides of the solution
+        assert not pool.solver_cache.warm_start
+        warm_pool = copy.copy(pool)
+        warm_pool.solver_cache = curvev2.SolverCache(warm_start=True)
+        warm_pool.newton_D_bigint(A_gamma[0], A_gamma[1], x.copy())
+        for factor in [0.9, 1.1]:
+            x_next = [x[0] * factor, x[1]]
+            cold_D, _ = pool.solve_D(A_gamma[0], A_gamma[1], x_next.copy())
+            assert warm_pool.newton_D_bigint(A_gamma[0], A_gamma[1], x_next.copy()) == pytest.approx(cold_D, rel=1e-14)
+            for i in [0, 1]:
+                cold_y, _ = pool.solve_y(A_gamma[0], A_gamma[1], x_next.copy(), cold_D * 1.01, i)
+                assert warm_pool.newton_y_bigint(A_gamma[0], A_gamma[1], x_next.copy(), cold_D * 1.01, i) == pytest.approx(cold_y, rel=1e-14)
+
+    def test_input_from_target_price(self, pool):
+        """ Test the solver gets to the target price without going over it."""
+        target_price = pool.get_token_B_price() * 1.05
+        input_amount = pool.get_input_A_amount_from_target_price_B(target_price)
+        xtol = curvev2.SOLVER_TOLERANCE * pool.balances[0]
+
+        assert input_amount > 0
+        assert pool.get_token_B_price(input_amount) <= target_price
+        assert pool.get_token_B_price(input_amount + 2 * xtol) > target_price
+        assert pool.get_input_A_amount_from_target_price_B(pool.get_token_B_price() * 0.9) == 0
+
+    def test_input_for_max_slippage(self, pool):
+        """ Test the solver gets to the max slippage without going over it."""
+        max_slippage = 0.01
+        initial_price = pool.get_token_B_price()
+        input_amount = pool.get_input_B_for_max_slippage(max_slippage, 0, 0)
+        xtol = curvev2.SOLVER_TOLERANCE * pool.balances[1]
+
+        assert 0 < input_amount < pool.balances[1] / 5
+        assert pool.get_slippage_from_input(initial_price, 1, 0, input_amount) <= max_slippage
+        assert pool.get_slippage_from_input(initial_price, 1, 0, input_amount + 2 * xtol) > max_slippage
@@ -0,0 +1,134 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import inspect
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pytest
+import numpy as np
+from lib import erc_token
+from lib.constants import *
+from lib.amm import curvev2, curvev2_int
+
+# Generated offline from the contract, see brownie/scripts/curve_v2_golden.py (or curve_v2_golden_evm.py)
+GOLDEN_FILE = os.path.join(currentdir, "data", "curve_v2_golden.json")
+
+
+def get_pool(math_mode, balances, price_scale, D, A_gamma, mid_fee=CURVE_V2_MID_FEE, out_fee=CURVE_V2_OUT_FEE, fee_gamma=CURVE_V2_FEE_GAMMA):
+    """ Float pool set to the given state (in simulation units)."""
+    pool = curvev2.CurveV2Pool(
+        "AMM", erc_token.Token('LUSD'), erc_token.Token('bLUSD'), None, None,
+        A_gamma[0], A_gamma[1], mid_fee, out_fee,
+        CURVE_V2_ALLOWED_EXTRA_PROFIT, fee_gamma, CURVE_V2_ADJUSTMENT_STEP,
+        CURVE_V2_ADMIN_FEE, CURVE_V2_MA_HALF_TIME, price_scale,
+        math_mode
+    )
+    pool.balances = list(balances)
+    pool.D = D
+    return pool
+
+def get_random_states(n, seed=0):
+    """ Balances, price scale and D of random pools, within the safe ranges of the solvers."""
+    rng = np.random.default_rng(seed)
+    pool = get_pool("float", [0, 0], 1, 0, [CURVE_V2_A, CURVE_V2_GAMMA])
+    states = []
+    for _ in range(n):
+        price_scale = float(rng.uniform(0.5, 3))
+        x0 = float(10**rng.uniform(2, 7))
+        x1 = x0 / price_scale * float(rng.uniform(0.3, 3))
+        D = pool.newton_D_bigint(CURVE_V2_A, CURVE_V2_GAMMA, [x0, x1 * price_scale])
+        states.append(([x0, x1], price_scale, D))
+    return states
+
+
+class TestCurveV2Int:
+    """ Test suite for the integer Curve V2 engine, against the float one."""
+
+    def test_solvers_match_float(self):
+        """ Test both engines find the same invariant and balances, up to float precision."""
+        A, gamma = CURVE_V2_A, CURVE_V2_GAMMA
+        pool = get_pool("float", [0, 0], 1, 0, [A, gamma])
+        to_int = curvev2_int.to_int
+        for balances, price_scale, D in get_random_states(100):
+            xp = [balances[0], balances[1] * price_scale]
+            D_int = curvev2_int.newton_D(to_int(A), to_int(gamma), [to_int(xp[0]), to_int(xp[1])])
+            assert curvev2_int.to_float(D_int) == pytest.approx(D, rel=1e-9)
+
+            for i in [0, 1]:
+                x = xp.copy()
+                x[1 - i] *= 1.1
+                y = pool.newton_y_bigint(A, gamma, x.copy(), D, i)
+                y_int = curvev2_int.newton_y(to_int(A), to_int(gamma), [to_int(x[0]), to_int(x[1])], to_int(D), i)
+                assert curvev2_int.to_float(y_int) == pytest.approx(y, rel=1e-9)
+
+    def test_math_mode(self):
+        """ Test a pool in integer mode quotes like a float one."""
+        for balances, price_scale, D in get_random_states(20, seed=1):
+            float_pool = get_pool("float", balances, price_scale, D, [CURVE_V2_A, CURVE_V2_GAMMA])
+            int_pool = get_pool("int", balances, price_scale, D, [CURVE_V2_A, CURVE_V2_GAMMA])
+            for i, j in [(0, 1), (1, 0)]:
+                dx = balances[i] * 0.1
+                assert int_pool.get_dy(i, j, dx) == pytest.approx(float_pool.get_dy(i, j, dx), rel=1e-9)
+
+    def test_halfpow(self):
+        """ Test the integer 0.5 ** x."""
+        for power in [0, 0.3, 1, 2.75, 10.5, 60]:
+            assert curvev2_int.to_float(curvev2_int.halfpow(curvev2_int.to_int(power))) == pytest.approx(0.5 ** power, rel=1e-7, abs=1e-18)
+
+
+@pytest.fixture(scope="module")
+def golden():
+    if not os.path.exists(GOLDEN_FILE):
+        pytest.skip("No golden vectors, generate them with brownie/scripts/curve_v2_golden.py")
+    with open(GOLDEN_FILE) as f:
+        return json.load(f)["states"]
+
+
+class TestCurveV2Golden:
+    """ Differential suite: integer engine (exact) and float engine (approx) against the contract.
+    Null outputs are inputs the contract rejects, which the integer engine has to reject too."""
+
+    def test_newton_y(self, golden):
+        for state in golden:
+            A, gamma = state["A_gamma"]
+            for vector in state["newton_y"]:
+                if vector["y"] is None:
+                    with pytest.raises((AssertionError, RuntimeError)):
+                        curvev2_int.newton_y(A, gamma, vector["x"], state["D"], vector["i"])
+                    continue
+                assert curvev2_int.newton_y(A, gamma, vector["x"], state["D"], vector["i"]) == vector["y"]
+
+    def test_fee(self, golden):
+        for state in golden:
+            assert curvev2_int.fee(state["xp"], state["mid_fee"], state["out_fee"], state["fee_gamma"]) == state["fee"]
+
+    def test_get_dy(self, golden):
+        for state in golden:
+            pool = get_pool(
+                "float",
+                [balance / 10**18 for balance in state["balances"]],
+                state["price_scale"] / 10**18,
+                state["D"] / 10**18,
+                [value / 10**18 for value in state["A_gamma"]],
+                state["mid_fee"] / 10**10,
+                state["out_fee"] / 10**10,
+                state["fee_gamma"] / 10**18
+            )
+            for vector in state["get_dy"]:
+                i, j = vector["i"], vector["j"]
+                get_dy = lambda: curvev2_int.get_dy(
+                    i, j, vector["dx"], state["balances"], state["price_scale"], state["D"], state["A_gamma"],
+                    state["mid_fee"], state["out_fee"], state["fee_gamma"]
+                )
+                if vector["dy"] is None:
+                    with pytest.raises((AssertionError, RuntimeError)):
+                        get_dy()
+                    continue
+                assert get_dy() == vector["dy"]
+                assert pool.get_dy(i, j, vector["dx"] / 10**18) == pytest.approx(vector["dy"] / 10**18, rel=1e-9)
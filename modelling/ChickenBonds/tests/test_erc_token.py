@@ -0,0 +1,131 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import inspect
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import warnings
+import pytest
+import numpy as np
+import chicken_bonds
+from lib import config, erc_token, testers
+
+TOKEN_KINDS = [erc_token.Token, erc_token.LedgerToken]
+
+
+class TestTokenOverlay:
+    """ Test suite for what-if overlays on token ledgers."""
+
+    @pytest.mark.parametrize("token_class", TOKEN_KINDS)
+    def test_nested_overlays(self, token_class):
+        """ Test changes are visible inside overlays and discarded level by level."""
+        token = token_class('LQTY')
+        token.mint("a", 10)
+
+        token.begin_overlay()
+        token.transfer("a", "b", 4)
+        token.begin_overlay()
+        token.mint("c", 5)
+        token.burn("a", 1)
+        assert token.balance_of("a") == 5
+        assert token.total_supply == 14
+        token.end_overlay()
+        assert token.balance_of("a") == 6
+        assert token.balance_of("c") == 0
+        assert token.total_supply == 10
+        token.end_overlay()
+
+        assert token.balances == {"a": 10}
+        assert token.total_supply == 10
+
+    @pytest.mark.parametrize("token_class", TOKEN_KINDS)
+    def test_version(self, token_class):
+        """ Test the version increases on every change, also when an overlay is discarded."""
+        token = token_class('LQTY')
+        versions = [token.version]
+        token.mint("a", 10)
+        versions.append(token.version)
+        token.transfer("a", "b", 4)
+        versions.append(token.version)
+        token.begin_overlay()
+        token.burn("b", 1)
+        versions.append(token.version)
+        token.end_overlay()
+        versions.append(token.version)
+        token.balance_of("a")
+
+        assert token.version == versions[-1]
+        assert versions == sorted(set(versions))
+
+
+class TestLedger:
+    """ Test suite for the array backed token ledger."""
+
+    def test_same_as_token(self):
+        """ Test a ledger token ends up with the same balances as a dict one, with the ledger growing."""
+        ledger = erc_token.Ledger(num_tokens=1, num_accounts=2)
+        tokens = [erc_token.Token('LQTY'), ledger.new_token('LQTY')]
+        other = ledger.new_token('bLQTY')
+        for token in tokens:
+            for i in range(10):
+                token.mint(f"chick_{i:02}", 100 + i)
+            for i in range(10):
+                token.transfer(f"chick_{i:02}", f"chick_{(i + 3) % 10:02}", 7.5 * i)
+            token.burn("chick_01", 50)
+        other.mint("chick_00", 1)
+
+        assert tokens[1].balances == tokens[0].balances
+        assert tokens[1].total_supply == tokens[0].total_supply
+        assert tokens[1].balance_of("unknown") == 0
+        assert other.balances == {"chick_00": 1}
+        assert ledger.balances.shape == (2, 16)
+        with pytest.raises(RuntimeError):
+            tokens[1].transfer("chick_00", "chick_01", 1000)
+
+    def test_batch(self):
+        """ Test batch mints and transfers match one by one ones, and fail as a whole."""
+        ledger = erc_token.Ledger()
+        token = ledger.new_token('LQTY')
+        accounts = [f"chick_{i:02}" for i in range(5)]
+        token.batch_mint(accounts, 100)
+        token.batch_mint(["chick_00", "chick_00"], [1, 2])
+        assert list(token.balances_of(accounts)) == [103, 100, 100, 100, 100]
+        assert token.total_supply == 503
+
+        ids = ledger.get_account_ids(accounts)
+        token.batch_transfer(ids, "pool", np.arange(5) * 10.0)
+        assert list(token.balances_of(accounts)) == [103, 90, 80, 70, 60]
+        assert token.balance_of("pool") == 100
+
+        version = token.version
+        balances = token.balances
+        with pytest.raises(RuntimeError):
+            token.batch_transfer(["chick_01", "chick_01"], ["pool", "chick_02"], [50, 50])
+        assert token.balances == balances
+        assert token.version == version
+        with pytest.raises(TypeError):
+            token.balances["pool"] = 0
+        with pytest.raises(AssertionError):
+            token.transfer("pool", len(ledger.accounts), 1)
+
+        token.begin_overlay()
+        token.batch_transfer("pool", ids, 20)
+        assert token.balance_of("pool") == 0
+        token.end_overlay()
+        assert token.balances == balances
+        assert token.version > version
+
+    def test_simulation(self):
+        """ Test a simulation gives the same results with both ledgers."""
+        warnings.simplefilter("ignore")
+        data = {}
+        for token_ledger in ["dict", "array"]:
+            sim_config = config.SimConfig(iterations=40, token_ledger=token_ledger)
+            _, _, recorder = chicken_bonds.simulate(testers.TesterSimple(sim_config))
+            data[token_ledger] = recorder.get_dataframe()
+        assert data["array"].equals(data["dict"])
@@ -0,0 +1,118 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import inspect
+import warnings
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pytest
+import chicken_bonds
+from lib import config, events, profiler, testers
+
+
+class TestEventEngine:
+    """ Test suite for the discrete-event scheduler."""
+
+    def test_order(self):
+        """ Test events run by time, then priority, then scheduling order, and the clock follows."""
+        fired = []
+        clock = []
+        engine = events.EventEngine(clock.append)
+        handler = lambda time, name: fired.append(name)
+        engine.schedule(2, 0, "p", handler, "c")
+        engine.schedule(1, 5, "p", handler, "b")
+        engine.schedule(1, 0, "p", handler, "a1")
+        engine.schedule(1, 0, "p", handler, "a2")
+        engine.schedule(0.5, 9, "p", lambda time: engine.schedule(1.5, 0, "p", handler, "later"))
+        engine.schedule(3, 0, "p", handler, "d")
+
+        assert engine.run(3) == 2
+        assert fired == ["a1", "a2", "b", "later", "c"]
+        assert clock == [0.5, 1, 1.5, 2]
+        assert engine.get_next_time() == 3
+        with pytest.raises(AssertionError):
+            engine.schedule(1, 0, "p", handler, "past")
+
+    def test_stop(self):
+        """ Test stop() keeps the pending events, and run() goes on with them."""
+        fired = []
+        engine = events.EventEngine()
+        engine.schedule(0, 0, "p", lambda time: (fired.append(time), engine.stop()))
+        engine.schedule(1, 0, "p", lambda time: fired.append(time))
+
+        engine.run(10)
+        assert fired == [0] and len(engine) == 1
+        engine.run(10)
+        assert fired == [0, 1] and len(engine) == 0
+
+
+def simulate(time_engine, iterations=40, **kwargs):
+    warnings.simplefilter("ignore")
+    tester = testers.TesterSimple(config.SimConfig(iterations=iterations, time_engine=time_engine, **kwargs))
+    sim = chicken_bonds.init_simulation(tester, 0)
+    return sim
+
+
+class TestSimulationEvents:
+    """ Test suite for the main loop run as events."""
+
+    def test_same_as_loop(self):
+        """ Test daily events give the same results, and the same profile phases, as the loop."""
+        results = {}
+        phases = {}
+        for time_engine in ["loop", "events"]:
+            sim = simulate(time_engine)
+            p = profiler.Profiler()
+            chicken_bonds.run_simulation(sim, profiler=p)
+            results[time_engine] = sim["recorder"].get_dataframe()
+            phases[time_engine] = set(p.phases)
+            assert sim["loop_state"]["iteration"] == 39
+
+        assert results["events"].equals(results["loop"])
+        assert phases["events"] == phases["loop"]
+
+    def test_due_events(self):
+        """ Test agent phases only run when due, with the same results as the loop."""
+        # All the chicks bond at once, so there are days with no chick to bond
+        population = dict(num_chicks=10, num_rebonders=2, num_lps=3, num_sellers=5, bootstrap_num_bonds=10)
+        sim = simulate("events", 60, **population)
+        tester = sim["tester"]
+        iterations = {}
+        for name in ["bond", "update_chicken_in", "buy_btkn"]:
+            def counted(*args, name=name, method=getattr(tester, name)):
+                iterations.setdefault(name, []).append(int(simulation_events.engine.time))
+                return method(*args)
+            setattr(tester, name, counted)
+        simulation_events = events.SimulationEvents(sim, log_level=0)
+        simulation_events.run(60)
+
+        loop_sim = simulate("loop", 60, **population)
+        chicken_bonds.run_simulation(loop_sim)
+        assert sim["recorder"].get_dataframe().equals(loop_sim["recorder"].get_dataframe())
+        assert 0 < len(iterations["bond"]) < 60
+        assert min(iterations["update_chicken_in"]) >= tester.config.bootstrap_period_chicken_in
+        assert len(iterations["update_chicken_in"]) < len(iterations["buy_btkn"]) < 60
+
+    def test_intraday_events(self):
+        """ Test extra events run in between days, with the block timestamp at their time."""
+        sim = simulate("events")
+        simulation_events = events.SimulationEvents(sim, log_level=0)
+        chicken = sim["chicken"]
+        chicken.token.mint("whale", 1000)
+        timestamps = []
+
+        def buy(time):
+            timestamps.append(chicken.btkn_amm.block_timestamp)
+            chicken.btkn_amm.swap_A_for_B("whale", 1000)
+        simulation_events.engine.schedule(30.5, 0, "whale", buy)
+
+        simulation_events.run(40)
+        assert timestamps == [30.5 * 86400]
+        assert chicken.btkn.balance_of("whale") > 0
+        assert chicken.btkn_amm.block_timestamp == 39 * 86400
+        assert len(sim["recorder"]) == 40
@@ -0,0 +1,72 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import inspect
+import warnings
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pytest
+import chicken_bonds
+from lib import config, erc_token, journal, testers
+
+
+@pytest.fixture(scope="module")
+def simulation(tmp_path_factory):
+    warnings.simplefilter("ignore")
+    path = str(tmp_path_factory.mktemp("journal"))
+    sim_journal = journal.Journal(path, chunk_size=256)
+    chicken, _, _ = chicken_bonds.simulate(testers.TesterSimple(config.SimConfig(iterations=30)), journal=sim_journal)
+    return chicken, sim_journal, journal.load_journal(path)
+
+
+class TestJournal:
+    """ Test suite for the ledger event journal."""
+
+    def test_replay(self, simulation):
+        """ Test replaying the journal from disk gives exactly the balances of the simulation, at any iteration."""
+        chicken, sim_journal, data = simulation
+        assert sim_journal.num_chunks > 1
+        assert len(data) == len(sim_journal.get_data())
+
+        balances = data.replay()
+        for token in chicken.get_tokens():
+            for account in data.accounts:
+                assert balances.loc[account, token.symbol] == token.balance_of(account)
+
+        sim = chicken_bonds.init_simulation(testers.TesterSimple(config.SimConfig(iterations=30)))
+        chicken_bonds.run_simulation(sim, end=11)
+        balances = data.replay(10)
+        for token in sim["chicken"].get_tokens():
+            for account in data.accounts:
+                assert balances.loc[account, token.symbol] == token.balance_of(account)
+
+    def test_queries(self, simulation):
+        """ Test flows and volumes add up to the events."""
+        _, _, data = simulation
+        events = data.get_dataframe()
+        transfers = events[events["op"] == "transfer"]
+
+        volumes = data.get_phase_volumes()
+        assert volumes.loc["none"].sum() == 0
+        assert volumes.values.sum() == pytest.approx(transfers["amount"].sum())
+        assert volumes.loc["bond", "LQTY"] == pytest.approx(transfers[transfers["phase"] == "bond"]["amount"].sum())
+
+        flows = data.get_account_flows("Pending")
+        assert flows["net"].sum() == pytest.approx(data.replay().loc["Pending", "LQTY"])
+
+    def test_overlays_not_logged(self):
+        """ Test what-if changes are left out."""
+        token = erc_token.Token('LQTY')
+        token_journal = journal.Journal()
+        token_journal.attach([token])
+        token.mint("a", 10)
+        token.begin_overlay()
+        token.transfer("a", "b", 5)
+        token.end_overlay()
+
+        assert len(token_journal.get_data()) == 1
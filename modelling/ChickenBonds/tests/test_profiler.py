@@ -0,0 +1,67 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import inspect
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pytest
+from lib import erc_token, profiler
+
+
+class TestProfiler:
+    """ Test suite for the main loop profiler."""
+
+    def test_call_counts(self):
+        """ Test calls are counted per iteration, only while instrumented."""
+        token = erc_token.Token('LQTY')
+        token.mint("a", 10)
+        original_transfer = erc_token.Token.transfer
+        p = profiler.Profiler(targets=[(erc_token.Token, "transfer")])
+
+        p.instrument()
+        for i in range(3):
+            p.start_iteration()
+            for _ in range(i):
+                token.transfer("a", "b", 1)
+            p.lap("transfers")
+            p.end_iteration()
+        p.uninstrument()
+        token.transfer("a", "b", 1)
+
+        assert erc_token.Token.transfer is original_transfer
+        assert token.balance_of("b") == 4
+        data = p.get_dataframe()
+        assert list(data["calls Token.transfer"]) == [0, 1, 2]
+        assert list(data["iteration"]) == [0, 1, 2]
+        assert (data["transfers"] >= 0).all()
+        summary = p.get_summary()
+        assert summary.loc["Token.transfer", "total"] == 3
+        assert summary.loc["transfers", "share"] == 1
+
+    def test_ledger_token_counts(self):
+        """ Test the default targets count the entry points of ledger tokens, in rows keyed by iteration."""
+        token = erc_token.LedgerToken('LQTY')
+        p = profiler.Profiler()
+
+        p.instrument()
+        try:
+            p.start_iteration(10)
+            token.mint("a", 10)
+            token.batch_mint(["a", "b"], 1)
+            token.transfer("a", "b", 1)
+            token.batch_transfer(["a", "b"], "c", 1)
+            token.burn("c", 1)
+            p.end_iteration()
+        finally:
+            p.uninstrument()
+
+        data = p.get_dataframe()
+        assert list(data["iteration"]) == [10]
+        for method in ["mint", "burn", "transfer", "batch_mint", "batch_transfer"]:
+            assert list(data[f"calls LedgerToken.{method}"]) == [1]
+        assert list(data["calls Token.transfer"]) == [0]
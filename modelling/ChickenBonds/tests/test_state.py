@@ -0,0 +1,97 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import inspect
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pickle
+import numpy as np
+from lib import ensemble, metrics, state
+
+
+class TestStateRecorder:
+    """ Test suite for the columnar state recorder."""
+
+    def test_append_and_grow(self):
+        """ Test appending rows beyond the initial capacity."""
+        recorder = state.StateRecorder(capacity=2)
+        for i in range(5):
+            recorder.append({"a": i, "b": 2 * i})
+
+        assert len(recorder) == 5
+        assert recorder.capacity == 8
+        assert list(recorder["a"]) == [0, 1, 2, 3, 4]
+        assert recorder.mean("b", 1, 4) == 4
+
+    def test_dataframe_view(self):
+        """ Test the DataFrame shares memory with the recorder buffer."""
+        recorder = state.StateRecorder(capacity=4)
+        recorder.append({"a": 1, "b": 2})
+        recorder.append({"a": 3, "b": 4})
+
+        data = recorder.get_dataframe()
+        assert list(data.columns) == ["a", "b"]
+        assert data["b"][1] == 4
+        assert np.shares_memory(data.values, recorder["a"])
+
+    def test_pickle(self):
+        """ Test only filled rows are pickled, and appending goes on after loading."""
+        recorder = state.StateRecorder(capacity=1000, windows={"a": 2})
+        recorder.append({"a": 1, "b": 2})
+        recorder.append({"a": 3, "b": 4})
+
+        data = pickle.dumps(recorder)
+        assert len(data) < 1000 * 8
+        loaded = pickle.loads(data)
+        loaded.append({"a": 5, "b": 6})
+
+        assert loaded.capacity == 1000
+        assert list(loaded["a"]) == [1, 3, 5]
+        assert loaded.metrics.mean("a") == 4
+
+
+class TestRollingMetrics:
+    """ Test suite for the rolling window averages."""
+
+    def test_partial_and_full_window(self):
+        """ Test the mean before and after the window is filled."""
+        window = metrics.RollingWindow(3)
+        assert window.mean() == 0
+
+        window.push(3)
+        window.push(6)
+        assert window.mean() == 4.5
+
+        for value in [9, 12, 15]:
+            window.push(value)
+        assert window.mean() == 12
+
+    def test_recorder_feeds_windows(self):
+        """ Test the recorder pushes tracked variables on append."""
+        recorder = state.StateRecorder(capacity=4, windows={"a": 2})
+        for i in range(5):
+            recorder.append({"a": i, "b": 0})
+
+        assert "b" not in recorder.metrics
+        assert recorder.metrics.mean("a") == recorder.mean("a", 3, 5)
+
+
+class TestEnsembleRecorder:
+    """ Test suite for the ensemble results store."""
+
+    def test_percentiles_with_early_stop(self):
+        """ Test percentiles ignore runs that stopped early."""
+        results = ensemble.EnsembleRecorder(3, iterations=4, variables=["a"])
+        results.record(0, {"a": np.array([1, 1, 1, 1])})
+        results.record(2, {"a": np.array([3, 3, 3])})
+        results.record(1, {"a": np.array([2, 2])})
+
+        percentiles = results.get_percentiles("a", [0, 50, 100])
+        assert results.completed == 3
+        assert list(percentiles["p50"]) == [2, 2, 2, 1]
+        assert list(percentiles["p100"]) == [3, 3, 3, 1]
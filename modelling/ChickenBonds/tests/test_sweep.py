@@ -0,0 +1,59 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import inspect
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pytest
+from lib import config, sweep
+
+
+class TestSweepDesigns:
+    """ Test suite for the sweep designs and cache."""
+
+    def test_grid_design(self):
+        """ Test the grid covers every combination, with derived fields recomputed."""
+        configs = sweep.get_grid_design({
+            "external_yield": [0.03, 0.05, 0.1],
+            "target_average_age": [30, 60],
+        })
+
+        assert len(configs) == 6
+        assert len(set(configs)) == 6
+        assert configs[-1].external_yield == 0.1
+        assert configs[-1].initial_accrual_param == 2 * configs[0].initial_accrual_param
+
+        base_config = config.SimConfig(buy_price_cap=5.0)
+        configs = sweep.get_grid_design({"external_yield": [0.03, 0.1]}, base_config)
+        assert all(c.buy_price_cap == 5.0 for c in configs)
+
+    def test_random_design(self):
+        """ Test random points stay in range and are reproducible."""
+        ranges = {"chicken_in_amm_fee": (0.01, 0.05)}
+        configs = sweep.get_random_design(ranges, n_points=10, seed=1)
+
+        assert all(0.01 <= c.chicken_in_amm_fee <= 0.05 for c in configs)
+        assert configs == sweep.get_random_design(ranges, n_points=10, seed=1)
+        assert configs != sweep.get_random_design(ranges, n_points=10, seed=2)
+
+    def test_config_key(self):
+        """ Test keys only depend on the parameter values."""
+        assert sweep.get_config_key(config.SimConfig()) == sweep.get_config_key(config.SimConfig())
+        assert sweep.get_config_key(config.SimConfig()) != sweep.get_config_key(config.SimConfig(amm_fee=0.01))
+
+    def test_cache(self, tmp_path):
+        """ Test summaries round trip through the cache."""
+        cache = sweep.SweepCache(str(tmp_path))
+        sim_config = config.SimConfig(external_yield=0.07)
+        assert sim_config not in cache
+
+        cache.put(sim_config, {"backing_ratio": 1.5})
+
+        assert sim_config in cache
+        assert config.SimConfig() not in cache
+        assert cache.get(sim_config) == {"backing_ratio": 1.5}
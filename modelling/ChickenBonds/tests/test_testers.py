@@ -0,0 +1,225 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import inspect
+import warnings
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pytest
+import concurrent.futures
+import numpy as np
+import chicken_bonds
+from lib import config, testers
+from lib.fork import *
+
+
+@pytest.fixture(scope="module")
+def simulation():
+    warnings.simplefilter("ignore")
+    tester = testers.TesterSimple(config.SimConfig(iterations=40))
+    chicken, chicks, _ = chicken_bonds.simulate(tester)
+    return chicken, chicks, tester
+
+
+class TestChickQueries:
+    """ Test suite for the queries on chicks, on maintained sets."""
+
+    def test_same_as_scan(self, simulation):
+        """ Test queries give the same chicks, in the same order, as full scans."""
+        chicken, chicks, tester = simulation
+        balance_of = lambda token, chick: token.balance_of(chick.account)
+        queries = [
+            (tester.get_bonded_chicks(chicks), lambda chick: chick.bond_amount > 0),
+            (tester.get_bonded_chicks_non_lps(chicks), lambda chick: chick.bond_amount > 0 and not chick.lp),
+            (tester.get_bonded_chicks_others(chicks), lambda chick: chick.bond_amount > 0 and not chick.rebonder and not chick.lp),
+            (tester.get_available_for_bonding_chicks(chicken, chicks),
+             lambda chick: chick.bond_amount == 0 and balance_of(chicken.token, chick) > 0 and not chick.trader),
+            (tester.get_lp_hodlers(chicken, chicks), lambda chick: balance_of(chicken.btkn_amm.lp_token, chick) > 0),
+            (tester.get_traders_with_btkn(chicken, chicks), lambda chick: chick.trader and balance_of(chicken.btkn, chick) > 0),
+            (tester.get_token_hodlers(chicken, chicks, 5000), lambda chick: balance_of(chicken.token, chick) > 5000),
+        ]
+        for result, condition in queries:
+            assert [chick.account for chick in result] == [chick.account for chick in chicks if condition(chick)]
+        assert len(tester.get_bonded_chicks(chicks)) > 0
+
+
+class TestBondDecisions:
+    """ Test suite for the batch chicken out and chicken in decisions."""
+
+    def get_copies(self, simulation):
+        return load_simulation(dump_simulation(simulation)), load_simulation(dump_simulation(simulation))
+
+    def get_state(self, copy):
+        chicken, chicks, tester = copy
+        return (
+            chicks.bond_amount.tolist(),
+            [chicken.btkn.balance_of(chick.account) for chick in chicks],
+            tester.chicken_out_counter,
+            tester.chicken_in_counter,
+        )
+
+    def test_chicken_out_bonds(self, simulation):
+        """ Test chicken outs are the same as one by one, with the same draws."""
+        (chicken, chicks, tester), (batch_chicken, batch_chicks, batch_tester) = self.get_copies(simulation)
+        tester.chicken_out_probability = batch_tester.chicken_out_probability = 0.5
+        iteration = 45
+
+        tester.seed(2023, iteration)
+        for chick in tester.get_bonded_chicks(chicks):
+            tester.chicken_out(chicken, chick, iteration, None)
+
+        batch_tester.seed(2023, iteration)
+        batch_tester.chicken_out_bonds(batch_chicken, batch_chicks, batch_chicks.sort_indexes(batch_chicks.bonded), iteration)
+        assert batch_tester.rng.rand() == tester.rng.rand()
+
+        assert self.get_state((batch_chicken, batch_chicks, batch_tester)) == self.get_state((chicken, chicks, tester))
+        assert batch_tester.chicken_out_counter > simulation[2].chicken_out_counter
+
+    def test_chicken_in_bonds(self, simulation):
+        """ Test chicken ins are the same as one by one, although prices move on the way,
+        and bonds too young are not visited."""
+        (chicken, chicks, tester), (batch_chicken, batch_chicks, batch_tester) = self.get_copies(simulation)
+        iteration = 80
+
+        for lps in [True, False]:
+            bonded_chicks = tester.get_bonded_chicks_lps(chicks) if lps else tester.get_bonded_chicks_non_lps(chicks)
+            for chick in bonded_chicks:
+                tester.chicken_in(chicken, chick, iteration, None)
+            batch_tester.chicken_in_bonds(batch_chicken, batch_chicks, lps, iteration, None)
+
+        assert self.get_state((batch_chicken, batch_chicks, batch_tester)) == self.get_state((chicken, chicks, tester))
+        assert batch_tester.chicken_in_counter > simulation[2].chicken_in_counter
+        assert len(batch_tester.get_bonded_chicks(batch_chicks)) > 0
+
+
+class TestTimeBase:
+    """ Test suite for runs with steps shorter than a day."""
+
+    def test_yield_per_day(self):
+        """ Test a day of yield is the same, whatever the step."""
+        daily = testers.TesterSimple(config.SimConfig())
+        hourly = testers.TesterSimple(config.SimConfig(step_seconds=3600))
+        hourly_steps = testers.TesterSimple(config.SimConfig(step_seconds=3600, yield_period=3600))
+
+        amount = daily.get_yield_amount(1000, 0.1)
+        assert hourly.get_yield_amount(1000, 0.1, hourly.config.get_yield_steps()) == pytest.approx(amount, rel=1e-12)
+        compounded = 1000
+        for _ in range(24):
+            compounded += hourly_steps.get_yield_amount(compounded, 0.1)
+        assert compounded - 1000 == pytest.approx(amount, rel=1e-9)
+
+    def test_perpetuity_premium(self, simulation):
+        """ Test the perpetuity premium is per step, like the yields."""
+        chicken, _, _ = simulation
+        hourly = testers.TesterSimple(config.SimConfig(step_seconds=3600, price_premium="perpetuity"))
+        hourly.seed(2021, 1)
+        base = chicken.pending_token_balance() * hourly.config.external_yield
+        assert hourly.get_premium(chicken) == pytest.approx(base ** (1 / (24 * hourly.config.time_units_per_year)), rel=1e-12)
+
+    def test_hourly_run(self):
+        """ Test block timestamps follow the step, and yield only accrues once a day."""
+        warnings.simplefilter("ignore")
+        tester = testers.TesterSimple(config.SimConfig(iterations=72, step_seconds=3600))
+        minted = []
+        distribute_yield = tester.distribute_yield
+        def count_yield(chicken, chicks, iteration):
+            supply = chicken.token.total_supply
+            distribute_yield(chicken, chicks, iteration)
+            if chicken.token.total_supply != supply:
+                minted.append(iteration)
+        tester.distribute_yield = count_yield
+
+        chicken, _, data = chicken_bonds.simulate(tester, log_level=0)
+        assert len(data) == 72
+        assert chicken.btkn_amm.block_timestamp == 71 * 3600
+        assert set(minted) <= {0, 24, 48} and minted
+
+
+class TestRandomStreams:
+    """ Test suite for the random streams owned by each simulation."""
+
+    def run(self, **changes):
+        tester = testers.TesterSimple(config.SimConfig(iterations=40, **changes))
+        sim = chicken_bonds.init_simulation(tester, 0)
+        chicken_bonds.run_simulation(sim, log_level=0)
+        return sim["recorder"].get_dataframe()
+
+    def test_global_state(self):
+        """ Test runs neither use nor change the global random state."""
+        warnings.simplefilter("ignore")
+        results = []
+        for rng in ["legacy", "generator"]:
+            np.random.seed(1)
+            state = np.random.get_state()
+            results.append(self.run(rng=rng))
+            assert all(np.array_equal(a, b) for a, b in zip(np.random.get_state(), state))
+            np.random.seed(2)
+            assert self.run(rng=rng).equals(results[-1])
+        assert not results[0].equals(results[1])
+
+    def test_threads(self):
+        """ Test simulations run in parallel threads give the same results as one after the other."""
+        warnings.simplefilter("ignore")
+        replicas = [dict(rng="generator", rng_seed=seed) for seed in range(3)] + [dict(rng="legacy")]
+        serial = [self.run(**changes) for changes in replicas]
+        with concurrent.futures.ThreadPoolExecutor(len(replicas)) as executor:
+            parallel = list(executor.map(lambda changes: self.run(**changes), replicas))
+        assert all(a.equals(b) for a, b in zip(parallel, serial))
+        assert not serial[0].equals(serial[1])
+
+    def test_generator_streams(self):
+        """ Test generator streams differ by replica, phase and iteration, and are the same when created again."""
+        tester = testers.TesterSimple(config.SimConfig(rng="generator"))
+        draws = {}
+        for run_id in [0, 1]:
+            tester.run_id = run_id
+            for salt, iteration in [(2022, 1), (2023, 1), (2022, 2)]:
+                draws[(run_id, salt, iteration)] = tester.get_stream(salt, iteration).random(4).tolist()
+        assert len(set(map(tuple, draws.values()))) == len(draws)
+        assert tester.get_stream(2022, 2).random(4).tolist() == draws[(1, 2022, 2)]
+
+
+class TestMetricCache:
+    """ Test suite for the memoized metrics of TesterSimple."""
+
+    def test_memoize(self, simulation):
+        """ Test metrics are cached until the state they depend on changes."""
+        chicken, _, tester = simulation
+        metrics = [
+            (tester.get_btkn_spot_price, lambda: chicken.btkn_amm.get_token_B_price()),
+            (tester.get_backing_ratio, chicken.get_backing_ratio),
+            (tester.get_optimal_apr_chicken_in_time, lambda: tester.compute_optimal_apr_chicken_in_time(chicken)),
+            (tester.get_rebond_time, lambda: tester.compute_rebond_time(chicken)),
+        ]
+        for metric, _ in metrics:
+            metric(chicken)
+
+        misses = tester.metric_cache_stats["misses"]
+        for metric, compute in metrics:
+            assert metric(chicken) == compute()
+        assert tester.metric_cache_stats["misses"] == misses
+
+        # Bond into the reserve and buy bTKN: all of them change
+        chicken.token.mint("buyer", 1000)
+        chicken.token.transfer("buyer", chicken.reserve_account, 500)
+        chicken.btkn_amm.swap_A_for_B("buyer", 500)
+        for metric, compute in metrics:
+            assert metric(chicken) == compute()
+        assert tester.metric_cache_stats["misses"] == misses + len(metrics)
+
+        tester.set_accrual_param(tester.accrual_param * 2)
+        assert tester.get_rebond_time(chicken) == tester.compute_rebond_time(chicken)
+        assert tester.metric_cache_stats["misses"] > misses + len(metrics)
+
+    def test_cache_key(self, simulation):
+        """ Test cache keys tell simulations apart, and survive pickling."""
+        chicken, _, tester = simulation
+        other, _ = chicken_bonds.deploy(tester.config)
+        assert tester.get_metric_cache_key(other) != tester.get_metric_cache_key(chicken)
+        copy, _, copy_tester = load_simulation(dump_simulation(simulation))
+        assert copy_tester.get_metric_cache_key(copy) == tester.get_metric_cache_key(chicken)
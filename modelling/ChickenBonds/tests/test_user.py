@@ -0,0 +1,120 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import inspect
+
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import pytest
+import numpy as np
+from lib import erc_token, user
+
+
+class TestAgentPopulation:
+    """ Test suite for the struct of arrays population of users."""
+
+    def test_views(self):
+        """ Test agents read and write the arrays of the population, like User attributes."""
+        population = user.AgentPopulation([f"chick_{i:02}" for i in range(4)])
+        chick = population[2]
+        chick.bond_amount = 100
+        chick.bond_time = 3
+        chick.lp = True
+        chick.trader = True
+        chick.trader = False
+
+        assert chick.account == "chick_02"
+        assert population.bond_amount[2] == 100
+        assert population.roles[2] == user.ROLE_LP
+        assert (chick.bond_amount, chick.bond_time, chick.lp, chick.trader) == (100, 3, True, False)
+        assert [agent.account for agent in population] == population.accounts
+        assert "Bonded 100.00 on day 3" in str(chick)
+
+    def test_shuffle(self):
+        """ Test shuffling gives the same order as shuffling a list of users with the same seed."""
+        accounts = [f"chick_{i:02}" for i in range(50)]
+        population = user.AgentPopulation(accounts)
+        np.random.seed(7)
+        population.shuffle()
+        np.random.seed(7)
+        np.random.shuffle(accounts)
+        assert [agent.account for agent in population] == accounts
+        assert [agent.account for agent in population[:3]] == accounts[:3]
+
+        population.sort(key=lambda agent: agent.account)
+        assert [agent.account for agent in population] == sorted(accounts)
+
+    @pytest.mark.parametrize("new_token", [erc_token.Token, erc_token.Ledger().new_token])
+    def test_select(self, new_token):
+        """ Test masks select the same agents as filtering views, in the current order."""
+        population = user.AgentPopulation([f"chick_{i:02}" for i in range(20)])
+        token = new_token('LQTY')
+        population.set_role(user.ROLE_TRADER, 0, 10)
+        population.set_role(user.ROLE_LP, 5, 15)
+        for i in range(0, 20, 3):
+            token.mint(population[i].account, i)
+            population[i].bond_amount = i
+        population.shuffle()
+
+        mask = population.has_role(user.ROLE_TRADER) & ~population.has_role(user.ROLE_LP) & (population.get_balances(token) > 2)
+        expected = [agent for agent in population if agent.trader and not agent.lp and token.balance_of(agent.account) > 2]
+        assert [agent.account for agent in population.select(mask)] == [agent.account for agent in expected]
+        assert len(population.select(population.is_bonded())) == 6
+
+    @pytest.mark.parametrize("new_token", [erc_token.Token, erc_token.Ledger().new_token])
+    def test_maintained_sets(self, new_token):
+        """ Test bonded and holder sets follow bond and balance changes, and ignore overlays."""
+        population = user.AgentPopulation([f"chick_{i:02}" for i in range(10)])
+        token = new_token('LQTY')
+        token.mint("chick_01", 10)
+        holders = population.get_holders(token)
+        assert population.get_holders(token) is holders
+        assert holders == {1}
+
+        token.transfer("chick_01", "chick_02", 10)
+        token.mint("chick_03", 5)
+        token.mint("pool", 5)
+        assert holders == {2, 3}
+        token.begin_overlay()
+        token.burn("chick_03", 5)
+        token.end_overlay()
+        token.burn("chick_02", 4)
+        assert holders == {2, 3} == set(np.flatnonzero(population.get_balances(token) > 0))
+
+        population[4].bond_amount = 10
+        population[5].bond_amount = 10
+        population[4].bond_amount = 0
+        assert population.bonded == {5}
+
+        population.shuffle()
+        assert population.select_indexes(holders) == population.select(population.get_balances(token) > 0)
+
+    def test_bond_calendar(self):
+        """ Test the calendar of bonded agents follows bonds, whatever the order of the writes."""
+        population = user.AgentPopulation([f"chick_{i:02}" for i in range(10)])
+        for i, bond_time in [(1, 3), (2, 5), (3, 5), (4, 8)]:
+            population[i].bond_amount = 10
+            population[i].bond_time = bond_time
+        population[5].bond_time = 2
+        assert population.get_bonded_until(5) == {1, 2, 3}
+        assert population.get_bonded_until(4.5) == {1}
+
+        # Chicken in, then rebond
+        population[2].bond_amount = 0
+        population[2].bond_time = 0
+        population[1].bond_time = 9
+        population[5].bond_amount = 10
+        assert population.get_bonded_until(8) == {3, 4, 5}
+        assert population.bond_times == [2, 5, 8, 9]
+        assert population.get_bonded_until(float("inf")) == population.bonded
+
+        # Bonds in between iterations keep their time
+        population[6].bond_amount = 10
+        population[6].bond_time = 8.25
+        assert population[6].bond_time == 8.25
+        assert population.get_bonded_until(8) == {3, 4, 5}
+        assert population.get_bonded_until(8.25) == {3, 4, 5, 6}